@@ -8,9 +8,15 @@ class ItemOptionInline(admin.TabularInline):
     extra = 0
 
 
+class ItemStockShardInline(admin.TabularInline):
+    model = models.ItemStockShard
+    extra = 0
+
+
 class ItemAdmin(admin.ModelAdmin):
     inlines = [
         ItemOptionInline,
+        ItemStockShardInline,
     ]
 
 
@@ -28,7 +34,7 @@ class DiscountCodeAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = models.OrderItem
     extra = 0
-    readonly_fields = ('preferences',)
+    readonly_fields = ('preferences', 'total')
 
     def preferences(self, order_item):
         print(order_item)
@@ -44,23 +50,25 @@ class OrderItemInline(admin.TabularInline):
     preferences.short_description = 'Preferencias'
 
 
+class StockReservationInline(admin.TabularInline):
+    model = models.StockReservation
+    extra = 0
+    readonly_fields = ('item', 'amount', 'status', 'expires_at')
+
+
 class InvoiceInline(admin.StackedInline):
     model = models.Invoice
     extra = 0
 
 
 class OrderAdmin(admin.ModelAdmin):
-    readonly_fields = ('order_total',)
+    readonly_fields = ('base_total', 'discount_total', 'total')
     inlines = [
         OrderItemInline,
+        StockReservationInline,
         InvoiceInline,
     ]
 
-    def order_total(self, order):
-        return order.calculate_total()
-
-    order_total.short_description = 'Total de la Orden'
-
 
 class CancellationItemInline(admin.TabularInline):
     model = models.CancellationItem
@@ -79,8 +87,31 @@ class CancellationAdmin(admin.ModelAdmin):
     ]
 
 
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'resource_id', 'status', 'modified_at')
+    list_filter = ('topic', 'status')
+    search_fields = ('resource_id',)
+
+
+class EmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'modified_at')
+    list_filter = ('status',)
+    search_fields = ('to',)
+    exclude = ('plain', 'html')
+    readonly_fields = ('error',)
+
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('name', 'payload', 'status', 'attempts', 'modified_at')
+    list_filter = ('name', 'status')
+    readonly_fields = ('error',)
+
+
 admin.site.register(models.Item, ItemAdmin)
 admin.site.register(models.DiscountCode, DiscountCodeAdmin)
 admin.site.register(models.Customer)
 admin.site.register(models.Order, OrderAdmin)
 admin.site.register(models.Cancellation, CancellationAdmin)
+admin.site.register(models.PaymentNotification, PaymentNotificationAdmin)
+admin.site.register(models.Email, EmailAdmin)
+admin.site.register(models.OutboxEvent, OutboxEventAdmin)
@@ -1,14 +1,29 @@
+import collections
+import json
+import os
+import threading
+import time
 from py3afipws import wsaa, wsfev1
 from django.conf import settings
-from django.utils import timezone
+from django.utils import timezone, dateparse
 from django.core.cache import caches
+from django.core.serializers import json as serializers_json
+from django.db import transaction
 
-from . import utils
+from shiro import metrics
+from . import models, utils
 
 TRA_TTL = 36000
 TOKEN_CACHE_KEY = 'TOKEN'
 SIGN_CACHE_KEY = 'SIGN'
 EXPIRATION_CACHE_KEY = 'EXPIRATION'
+LOGIN_LOCK_CACHE_KEY = 'LOGIN_LOCK'
+LOGIN_LOCK_TTL = 60
+LOGIN_WAIT_TIMEOUT = 30
+LOGIN_WAIT_INTERVAL = 0.5
+CREDENTIALS_REFRESH_MARGIN = timezone.timedelta(minutes=5)
+CLIENT_HEALTH_CHECK_INTERVAL = 300
+SEQUENCE_ERROR_CODE = '10016'
 EXPIRATION_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
 WSFEV1_DATE_FORMAT = '%Y%m%d'
 
@@ -25,47 +40,178 @@ INVOICE_CUIT_DOCUMENT_TYPE = 80
 INVOICE_NATIONAL_DOCUMENT_TYPE = 96
 INVOICE_SERVICE_START_DATE = timezone.datetime(year=2020, month=5, day=29)
 INVOICE_SERVICE_END_DATE = timezone.datetime(year=2020, month=5, day=30)
+INVOICE_BATCH_SIZE = 50
+INVOICE_DATE_FIELDS = (
+    'company_start_of_operations',
+    'invoice_date',
+    'invoice_payment_date',
+    'invoice_service_start_date',
+    'invoice_service_end_date',
+    'invoice_cae_expiration_date',
+)
 
 
-def _authenticate():
-    wsaa_client = wsaa.WSAA()
+Credentials = collections.namedtuple('Credentials', ['token', 'sign', 'expiration'])
+
+_credentials = None
+_credentials_lock = threading.Lock()
+# SOAP clients keep the results of the last call, so each thread gets its own
+_local = threading.local()
+_synced_sequences = set()
+
+
+class AfipError(Exception):
+    pass
+
+
+def clear_synced_sequences():
+    _synced_sequences.clear()
+
+
+def clear_credentials():
+    global _credentials
+    _credentials = None
+
+
+def _parse_expiration(expiration):
+    return timezone.datetime.strptime(expiration, EXPIRATION_DATE_FORMAT)
+
+
+def _get_cached_credentials():
     auth_info = caches['afip'].get_many([TOKEN_CACHE_KEY, SIGN_CACHE_KEY, EXPIRATION_CACHE_KEY])
+    metrics.record_cache('afip', len(auth_info) == 3)
+
+    if len(auth_info) < 3:
+        return None
+
+    return Credentials(
+        auth_info[TOKEN_CACHE_KEY],
+        auth_info[SIGN_CACHE_KEY],
+        _parse_expiration(auth_info[EXPIRATION_CACHE_KEY]),
+    )
 
-    if EXPIRATION_CACHE_KEY in auth_info and (
-        timezone.datetime.strptime(auth_info[EXPIRATION_CACHE_KEY], EXPIRATION_DATE_FORMAT) <
-        timezone.now()
-    ):
-        auth_info.clear()
 
-    if TOKEN_CACHE_KEY not in auth_info or SIGN_CACHE_KEY not in auth_info:
-        assert settings.AFIP_CERTIFICATE, 'AFIP Certificate not set'
-        assert settings.AFIP_PRIVATE_KEY, 'AFIP Private Key not set'
-        certificate = settings.AFIP_CERTIFICATE.replace('\\n', '\n')
-        private_key = settings.AFIP_PRIVATE_KEY.replace('\\n', '\n')
+def _is_valid(credentials, now, margin=timezone.timedelta(0)):
+    return credentials is not None and now < credentials.expiration - margin
 
-        tra = wsaa_client.CreateTRA('wsfe', ttl=TRA_TTL)
-        cms = wsaa_client.SignTRA(tra, certificate, private_key)
 
+def _login():
+    assert settings.AFIP_CERTIFICATE, 'AFIP Certificate not set'
+    assert settings.AFIP_PRIVATE_KEY, 'AFIP Private Key not set'
+    certificate = settings.AFIP_CERTIFICATE.replace('\\n', '\n')
+    private_key = settings.AFIP_PRIVATE_KEY.replace('\\n', '\n')
+
+    wsaa_client = wsaa.WSAA()
+    tra = wsaa_client.CreateTRA('wsfe', ttl=TRA_TTL)
+    cms = wsaa_client.SignTRA(tra, certificate, private_key)
+
+    with metrics.track_external('afip', 'WSAA LoginCMS'):
         wsaa_client.Conectar()
         wsaa_client.LoginCMS(cms)
-        auth_info[TOKEN_CACHE_KEY] = wsaa_client.Token
-        auth_info[SIGN_CACHE_KEY] = wsaa_client.Sign
-        auth_info[EXPIRATION_CACHE_KEY] = wsaa_client.ObtenerTagXml('expirationTime')
+    expiration = wsaa_client.ObtenerTagXml('expirationTime')
+
+    caches['afip'].set_many({
+        TOKEN_CACHE_KEY: wsaa_client.Token,
+        SIGN_CACHE_KEY: wsaa_client.Sign,
+        EXPIRATION_CACHE_KEY: expiration,
+    }, TRA_TTL)
+
+    return Credentials(wsaa_client.Token, wsaa_client.Sign, _parse_expiration(expiration))
+
+
+def _login_once(now):
+    # AFIP rejects a login while another one is valid, so only the worker holding the lock logs
+    # in and the rest wait for the credentials it stores
+    deadline = time.monotonic() + LOGIN_WAIT_TIMEOUT
+
+    while True:
+        credentials = _get_cached_credentials()
+
+        if _is_valid(credentials, now):
+            return credentials
+
+        if caches['afip'].add(LOGIN_LOCK_CACHE_KEY, True, LOGIN_LOCK_TTL):
+            try:
+                credentials = _get_cached_credentials()
+
+                return credentials if _is_valid(credentials, now) else _login()
+            finally:
+                caches['afip'].delete(LOGIN_LOCK_CACHE_KEY)
+
+        if time.monotonic() >= deadline:
+            return _login()
 
-        caches['afip'].set_many(auth_info, TRA_TTL)
+        time.sleep(LOGIN_WAIT_INTERVAL)
 
-    return auth_info[TOKEN_CACHE_KEY], auth_info[SIGN_CACHE_KEY]
+
+def _authenticate():
+    global _credentials
+    now = timezone.now()
+    credentials = _credentials
+
+    if _is_valid(credentials, now, CREDENTIALS_REFRESH_MARGIN):
+        return credentials.token, credentials.sign
+
+    with _credentials_lock:
+        credentials = _credentials
+
+        if not _is_valid(credentials, now, CREDENTIALS_REFRESH_MARGIN):
+            # close to the expiration another worker may have already logged in again
+            cached_credentials = _get_cached_credentials()
+
+            if _is_valid(cached_credentials, now):
+                credentials = cached_credentials
+
+            if not _is_valid(credentials, now):
+                credentials = _login_once(now)
+
+            _credentials = credentials
+
+    return credentials.token, credentials.sign
+
+
+def clear_client():
+    _local.__dict__.clear()
+
+
+def _connect():
+    os.makedirs(settings.AFIP_WSDL_CACHE_DIR, exist_ok=True)
+
+    # the parsed WSDL is kept on disk so new processes don't need to download it again
+    wsfev1_client = wsfev1.WSFEv1()
+    wsfev1_client.Cuit = settings.AFIP_CUIT
+
+    with metrics.track_external('afip', 'WSFEv1 Conectar'):
+        wsfev1_client.Conectar(cache=settings.AFIP_WSDL_CACHE_DIR)
+
+    return wsfev1_client
+
+
+def _is_healthy(wsfev1_client):
+    with metrics.track_external('afip', 'WSFEv1 Dummy'):
+        return bool(wsfev1_client.Dummy()) and wsfev1_client.AppServerStatus == 'OK'
 
 
 def get_client():
     assert settings.AFIP_CUIT, 'AFIP CUIT not set'
     token, sign = _authenticate()
+    wsfev1_client = getattr(_local, 'client', None)
 
-    wsfev1_client = wsfev1.WSFEv1()
+    if wsfev1_client is not None and \
+            time.monotonic() - _local.checked_at >= CLIENT_HEALTH_CHECK_INTERVAL:
+        if not _is_healthy(wsfev1_client):
+            wsfev1_client = None
+
+        _local.checked_at = time.monotonic()
+
+    if wsfev1_client is None:
+        wsfev1_client = _connect()
+        _local.client = wsfev1_client
+        _local.checked_at = time.monotonic()
+
+    # rotated credentials are used by the same connection
     wsfev1_client.Token = token.encode('utf-8')
     wsfev1_client.Sign = sign.encode('utf-8')
-    wsfev1_client.Cuit = settings.AFIP_CUIT
-    wsfev1_client.Conectar()
 
     return wsfev1_client
 
@@ -93,11 +239,69 @@ def generate_invoice_code(invoice):
     return code
 
 
-def generate_invoice(order):
-    client = get_client()
+def _sync_sequence(client, sequence):
+    with metrics.track_external('afip', 'WSFEv1 CompUltimoAutorizado'):
+        sequence.last_number = int(
+            client.CompUltimoAutorizado(sequence.invoice_type, sequence.point_of_sale),
+        )
+    sequence.synced_at = timezone.now()
+    sequence.save(update_fields=['last_number', 'synced_at'])
+    _synced_sequences.add((sequence.point_of_sale, sequence.invoice_type))
+
+
+def _is_sequence_error(client):
+    return SEQUENCE_ERROR_CODE in str(client.ErrCode).split() or any(
+        observation.startswith(f'{SEQUENCE_ERROR_CODE}:') for observation in client.Observaciones
+    )
+
+
+def _lock_sequence(client, point_of_sale, invoice_type):
+    # the sequence stays locked until AFIP answers, numbers must be authorized in order
+    sequence, created = models.InvoiceSequence.objects.select_for_update().get_or_create(
+        point_of_sale=point_of_sale,
+        invoice_type=invoice_type,
+    )
+
+    # AFIP is only asked for the last number once per process, or when it rejects ours
+    if (sequence.point_of_sale, sequence.invoice_type) not in _synced_sequences:
+        _sync_sequence(client, sequence)
+
+    return sequence
+
+
+def _request_cae(client, invoice, voucher):
+    with transaction.atomic():
+        sequence = _lock_sequence(
+            client,
+            invoice['invoice_point_of_sale'],
+            invoice['invoice_type'],
+        )
+
+        for attempt in range(2):
+            number = sequence.last_number + 1
+            client.CrearFactura(cbt_desde=number, cbt_hasta=number, **voucher)
+
+            with metrics.track_external('afip', 'WSFEv1 CAESolicitar'):
+                client.CAESolicitar()
+
+            if attempt > 0 or not _is_sequence_error(client):
+                break
+
+            _sync_sequence(client, sequence)
+
+        if not client.CAE:
+            raise AfipError(f'AFIP rejected invoice {number}: {client.ErrMsg} {client.Obs}')
+
+        sequence.last_number = number
+        sequence.save(update_fields=['last_number'])
+
+    return number
+
+
+def build_invoice(order, now):
     customer = order.customer
-    now = timezone.now()
-    invoice = {
+
+    return {
         'company_name': COMPANY_NAME,
         'company_name_short': COMPANY_NAME_SHORT,
         'company_address': COMPANY_ADDRESS,
@@ -112,14 +316,13 @@ def generate_invoice(order):
         'invoice_point_of_sale': INVOICE_POINT_OF_SALE,
         'invoice_type_letter': 'c',
         'invoice_type': INVOICE_TYPE,
-        'invoice_number': int(client.CompUltimoAutorizado(INVOICE_TYPE, INVOICE_POINT_OF_SALE)) + 1,
         'invoice_date': now,
         'invoice_payment_date': now,
         'invoice_service_start_date': INVOICE_SERVICE_START_DATE,
         'invoice_service_end_date': INVOICE_SERVICE_END_DATE,
-        'invoice_raw_total': str(utils.quantize_decimal(order.calculate_base_total().amount)),
-        'invoice_discount': str(utils.quantize_decimal(order.calculate_discount().amount)),
-        'invoice_total': str(utils.quantize_decimal(order.calculate_total().amount)),
+        'invoice_raw_total': str(utils.quantize_decimal(order.base_total.amount)),
+        'invoice_discount': str(utils.quantize_decimal(order.discount_total.amount)),
+        'invoice_total': str(utils.quantize_decimal(order.total.amount)),
         'invoice_items': [
             {
                 'name': order_item.item.name,
@@ -128,40 +331,102 @@ def generate_invoice(order):
                 'total_price': str(
                     utils.quantize_decimal(order_item.calculate_base_total().amount),
                 ),
-            } for order_item in order.order_items.all()
+            } for order_item in order.order_items.select_related('item')
         ],
     }
 
+
+def build_voucher(invoice):
     formatted_invoice_date = invoice['invoice_date'].strftime(WSFEV1_DATE_FORMAT)
-    formatted_service_start_date = invoice['invoice_service_start_date'].strftime(
-        WSFEV1_DATE_FORMAT,
-    )
-    formatted_service_end_date = invoice['invoice_service_end_date'].strftime(
-        WSFEV1_DATE_FORMAT,
-    )
 
-    client.CrearFactura(
-        concepto=INVOICE_CONCEPT,
-        tipo_doc=invoice['client_document_type'],
-        nro_doc=invoice['client_identity_document'],
-        tipo_cbte=invoice['invoice_type'],
-        punto_vta=invoice['invoice_point_of_sale'],
-        cbt_desde=invoice['invoice_number'],
-        cbt_hasta=invoice['invoice_number'],
-        imp_total=invoice['invoice_total'],
-        imp_neto=invoice['invoice_total'],
-        fecha_cbte=formatted_invoice_date,
-        fecha_venc_pago=formatted_invoice_date,
-        fecha_serv_desde=formatted_service_start_date,
-        fecha_serv_hasta=formatted_service_end_date,
-    )
-    client.CAESolicitar()
+    return {
+        'concepto': INVOICE_CONCEPT,
+        'tipo_doc': invoice['client_document_type'],
+        'nro_doc': invoice['client_identity_document'],
+        'tipo_cbte': invoice['invoice_type'],
+        'punto_vta': invoice['invoice_point_of_sale'],
+        'imp_total': invoice['invoice_total'],
+        'imp_neto': invoice['invoice_total'],
+        'fecha_cbte': formatted_invoice_date,
+        'fecha_venc_pago': formatted_invoice_date,
+        'fecha_serv_desde': invoice['invoice_service_start_date'].strftime(WSFEV1_DATE_FORMAT),
+        'fecha_serv_hasta': invoice['invoice_service_end_date'].strftime(WSFEV1_DATE_FORMAT),
+    }
+
 
-    invoice['invoice_cae'] = client.CAE
+def complete_invoice(invoice, number, cae, cae_expiration_date):
+    invoice['invoice_number'] = number
+    invoice['invoice_cae'] = cae
     invoice['invoice_cae_expiration_date'] = timezone.datetime.strptime(
-        client.Vencimiento,
+        cae_expiration_date,
         WSFEV1_DATE_FORMAT,
     )
     invoice['invoice_code'] = generate_invoice_code(invoice)
 
     return invoice
+
+
+def serialize_invoice(invoice):
+    return json.loads(json.dumps(invoice, cls=serializers_json.DjangoJSONEncoder))
+
+
+def deserialize_invoice(data):
+    return {
+        **data,
+        **{field: dateparse.parse_datetime(data[field]) for field in INVOICE_DATE_FIELDS},
+    }
+
+
+def generate_invoice(order):
+    client = get_client()
+    invoice = build_invoice(order, timezone.now())
+    number = _request_cae(client, invoice, build_voucher(invoice))
+
+    return complete_invoice(invoice, number, client.CAE, client.Vencimiento)
+
+
+def generate_invoices(orders):
+    client = get_client()
+    now = timezone.now()
+    invoices = [build_invoice(order, now) for order in orders]
+    generated_invoices = {}
+
+    with transaction.atomic():
+        sequence = _lock_sequence(client, INVOICE_POINT_OF_SALE, INVOICE_TYPE)
+
+        for attempt in range(2):
+            client.IniciarFacturasX()
+
+            for number, invoice in enumerate(invoices, start=sequence.last_number + 1):
+                client.CrearFactura(cbt_desde=number, cbt_hasta=number, **build_voucher(invoice))
+                client.AgregarFacturaX()
+
+            with metrics.track_external('afip', 'WSFEv1 CAESolicitarX'):
+                client.CAESolicitarX()
+
+            client.LeerFacturaX(0)
+
+            if attempt > 0 or not _is_sequence_error(client):
+                break
+
+            _sync_sequence(client, sequence)
+
+        for index, (order, invoice) in enumerate(zip(orders, invoices)):
+            client.LeerFacturaX(index)
+
+            # rejected vouchers are left out, their orders are invoiced again in a later batch
+            if client.CAE:
+                generated_invoices[order.id] = complete_invoice(
+                    invoice,
+                    sequence.last_number + 1 + index,
+                    client.CAE,
+                    client.Vencimiento,
+                )
+
+        if generated_invoices:
+            sequence.last_number = max(
+                invoice['invoice_number'] for invoice in generated_invoices.values()
+            )
+            sequence.save(update_fields=['last_number'])
+
+    return generated_invoices
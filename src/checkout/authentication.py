@@ -1,39 +1,111 @@
+import time
+import hashlib
+from django.conf import settings
+from django.core import signing
+from django.utils import baseconv
+from django.core.cache import caches
 from rest_framework import authentication, exceptions
-from . import models
+from shiro import metrics
+from . import models, tokens
 
 __all__ = ['CustomerAuthentication', 'CUSTOMER_AUTH_SCHEMA']
 
 
 CUSTOMER_AUTH_SCHEMA = 'Customer'
+CUSTOMER_AUTH_CACHE_KEY = 'CUSTOMER_AUTH'
+
+
+def get_cache():
+    return caches['customers']
+
+
+def build_cache_key(auth_parts):
+    credentials = ' '.join(auth_parts).encode('utf-8')
+
+    return f'{CUSTOMER_AUTH_CACHE_KEY}:{hashlib.sha256(credentials).hexdigest()}'
+
+
+def get_expiration(auth_parts):
+    # email and identity document pairs don't expire, tokens do once they're too old
+    if len(auth_parts) != 1:
+        return None
+
+    token = auth_parts[0]
+
+    if tokens.is_legacy_token(token):
+        # "<value>:<timestamp>:<signature>" as django.core.signing.dumps builds them
+        issued_at = baseconv.base62.decode(token.rsplit(':', 2)[1])
+    else:
+        issued_at = tokens.get_issued_at(token)
+
+    return issued_at + settings.CUSTOMER_TOKEN_MAX_AGE
+
+
+def get_cache_timeout(auth_parts):
+    # a token isn't accepted from the cache after it expired
+    timeout = get_cache().default_timeout
+    expiration = get_expiration(auth_parts)
+
+    return timeout if expiration is None else min(timeout, expiration - time.time())
 
 
 class CustomerAuthentication(authentication.BaseAuthentication):
-    def _get_authentication_parameters(self, request):
-        email = None
-        identity_document = None
+    def _get_authentication_parts(self, request):
         auth_header = authentication.get_authorization_header(request)
         auth_parts = str(auth_header, 'utf-8').split(' ') if auth_header else []
         auth_schema = auth_parts.pop(0) if len(auth_parts) > 0 else None
 
-        if auth_schema == CUSTOMER_AUTH_SCHEMA:
-            if len(auth_parts) == 2:
-                email, identity_document = auth_parts
-            elif len(auth_parts) == 1:
-                token = auth_parts[0]
-                email, identity_document = models.Customer.parse_customer_token(token)
+        return auth_parts if auth_schema == CUSTOMER_AUTH_SCHEMA else []
+
+    def _get_authentication_parameters(self, auth_parts):
+        email = None
+        identity_document = None
+
+        if len(auth_parts) == 2:
+            email, identity_document = auth_parts
+        elif len(auth_parts) == 1:
+            token = auth_parts[0]
+            email, identity_document = models.Customer.parse_customer_token(token)
 
         return email, identity_document
 
-    def authenticate(self, request):
-        email, identity_document = self._get_authentication_parameters(request)
+    def _get_customer(self, auth_parts):
+        customers = models.Customer.objects.select_related('user')
+
+        try:
+            if len(auth_parts) == 1 and not tokens.is_legacy_token(auth_parts[0]):
+                return customers.get(id=tokens.parse_customer_token(auth_parts[0]))
+
+            email, identity_document = self._get_authentication_parameters(auth_parts)
 
-        if email and identity_document:
-            try:
-                customer = models.Customer.objects.get(
+            if email and identity_document:
+                return customers.get(
                     user__email__iexact=email,
                     identity_document__iexact=identity_document,
                 )
-            except models.Customer.DoesNotExist:
-                raise exceptions.AuthenticationFailed()
+        except (tokens.InvalidToken, signing.BadSignature, models.Customer.DoesNotExist):
+            raise exceptions.AuthenticationFailed()
+
+    def authenticate(self, request):
+        auth_parts = self._get_authentication_parts(request)
+
+        if not auth_parts:
+            return None
+
+        # credentials verified shortly before don't need the database, compact tokens are
+        # checked with their HMAC alone and only hit it to load the user, a customer deleted or
+        # deactivated meanwhile is still accepted until the cache entry expires
+        cache_key = build_cache_key(auth_parts)
+        user = get_cache().get(cache_key)
+        metrics.record_cache('customers', user is not None)
+
+        if user is None:
+            customer = self._get_customer(auth_parts)
+
+            if customer is None:
+                return None
+
+            user = customer.user
+            get_cache().set(cache_key, user, get_cache_timeout(auth_parts))
 
-            return customer.user, CUSTOMER_AUTH_SCHEMA
+        return user, CUSTOMER_AUTH_SCHEMA
@@ -0,0 +1,109 @@
+import functools
+
+URL_SCHEME = 'barcode'
+
+# interleaved 2 of 5, N and W are the narrow and wide elements
+ITF_START = 'NNNN'
+ITF_STOP = 'WNN'
+ITF_CODES = (
+    'NNWWN',
+    'WNNNW',
+    'NWNNW',
+    'WWNNN',
+    'NNWNW',
+    'WNWNN',
+    'NWWNN',
+    'NNNWW',
+    'WNNWN',
+    'NWNWN',
+)
+ITF_WIDTHS = {'N': 2, 'W': 5}
+
+# same geometry python-barcode used for the invoices, in mm
+MODULE_WIDTH = 0.16
+MODULE_HEIGHT = 15
+QUIET_ZONE = 6.4
+MARGIN = 1
+FONT_SIZE = 10 * 0.352777778
+TEXT_DISTANCE = 5
+
+
+def _build_itf_pairs():
+    # every pair of digits interleaves the bars of the first one with the spaces of the second
+    return {
+        f'{bars}{spaces}': tuple(
+            ITF_WIDTHS[element]
+            for bar, space in zip(ITF_CODES[bars], ITF_CODES[spaces])
+            for element in (bar, space)
+        ) for bars in range(10) for spaces in range(10)
+    }
+
+
+ITF_PAIRS = _build_itf_pairs()
+
+
+def normalize_code(code):
+    code = str(code)
+
+    if not code.isdigit():
+        raise ValueError('ITF codes can only contain numbers')
+
+    return code if len(code) % 2 == 0 else f'0{code}'
+
+
+def encode_itf(code):
+    # the widths in modules of the alternating bars and spaces of the code
+    code = normalize_code(code)
+    widths = [ITF_WIDTHS[element] for element in ITF_START]
+
+    for index in range(0, len(code), 2):
+        widths.extend(ITF_PAIRS[code[index:index + 2]])
+
+    widths.extend(ITF_WIDTHS[element] for element in ITF_STOP)
+
+    return widths
+
+
+def format_size(size):
+    return f'{size:.3f}'.rstrip('0').rstrip('.')
+
+
+@functools.lru_cache(maxsize=1024)
+def render_svg(code):
+    code = normalize_code(code)
+    widths = encode_itf(code)
+    bars_width = sum(widths) * MODULE_WIDTH
+    width = int(QUIET_ZONE * 2 + bars_width)
+    height = int(MARGIN * 2 + MODULE_HEIGHT + FONT_SIZE / 2 + TEXT_DISTANCE)
+    bars = []
+    x = QUIET_ZONE
+
+    for index, modules in enumerate(widths):
+        if index % 2 == 0:
+            bars.append(
+                f'M{format_size(x)} {MARGIN}h{format_size(modules * MODULE_WIDTH)}'
+                f'v{MODULE_HEIGHT}h-{format_size(modules * MODULE_WIDTH)}z',
+            )
+
+        x += modules * MODULE_WIDTH
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}mm" height="{height}mm" '
+        f'viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="white"/>'
+        f'<path d="{"".join(bars)}"/>'
+        f'<text x="{format_size(QUIET_ZONE + bars_width / 2)}" '
+        f'y="{MARGIN + MODULE_HEIGHT + TEXT_DISTANCE}" '
+        f'font-size="{format_size(FONT_SIZE)}" text-anchor="middle">{code}</text>'
+        f'</svg>'
+    ).encode('utf-8')
+
+
+def build_url(code):
+    return f'{URL_SCHEME}:{normalize_code(code)}'
+
+
+def parse_url(url):
+    scheme, separator, code = url.partition(':')
+
+    return code if scheme == URL_SCHEME and separator else None
@@ -0,0 +1,272 @@
+import collections
+import contextlib
+import math
+import random
+import statistics
+import threading
+import time
+import uuid
+import requests
+from concurrent import futures
+from django import db
+from django.core import wsgi
+from django.core.servers import basehttp
+from django.utils import crypto
+
+from .. import authentication, mercadopago, models
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+JSON_API_CONTENT_TYPE = 'application/vnd.api+json'
+STEPS = (
+    'create_customer',
+    'verify_customer',
+    'list_items',
+    'get_discount_code',
+    'create_order',
+    'notify_payment',
+)
+PERCENTILES = (50, 95, 99)
+
+StepResult = collections.namedtuple('StepResult', ['step', 'elapsed', 'queries', 'ok'])
+
+
+class JourneyError(Exception):
+    pass
+
+
+class QueryCountingApplication:
+    # counts the queries run to answer each request and sends them back in a response header
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+
+            return execute(sql, params, many, context)
+
+        def start_counted_response(status, headers, exc_info=None):
+            return start_response(
+                status,
+                [*headers, (QUERY_COUNT_HEADER, str(queries))],
+                exc_info,
+            )
+
+        # each request is served by its own thread, so the wrapper only sees its queries
+        with db.connection.execute_wrapper(count_query):
+            return self.application(environ, start_counted_response)
+
+
+class RequestHandler(basehttp.WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def local_server():
+    server = basehttp.ThreadedWSGIServer(
+        ('127.0.0.1', 0),
+        RequestHandler,
+        allow_reuse_address=False,
+    )
+    server.set_app(QueryCountingApplication(wsgi.get_wsgi_application()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def build_resource(type, attributes):
+    return {'type': type, 'attributes': attributes}
+
+
+def build_identifier(type, id):
+    return {'type': type, 'id': id}
+
+
+class Journey:
+    # a customer going through the whole checkout, from signing up to having the order paid
+    def __init__(self, url, item_ids, discount_codes):
+        self.url = url
+        self.item_ids = item_ids
+        self.discount_codes = discount_codes
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = JSON_API_CONTENT_TYPE
+        self.results = []
+        self.order_id = None
+
+    def request(self, step, method, path, expected_status, **kwargs):
+        start = time.perf_counter()
+        response = self.session.request(method, f'{self.url}{path}', **kwargs)
+        elapsed = time.perf_counter() - start
+        ok = response.status_code == expected_status
+
+        self.results.append(StepResult(
+            step,
+            elapsed,
+            int(response.headers.get(QUERY_COUNT_HEADER, 0)),
+            ok,
+        ))
+
+        if not ok:
+            raise JourneyError(f'{step} responded with {response.status_code}: {response.text}')
+
+        return response.json() if response.content else None
+
+    def create_customer(self):
+        email = f'benchmark-{uuid.uuid4().hex}@example.com'
+        identity_document = crypto.get_random_string(8, '0123456789')
+
+        self.request('create_customer', 'POST', '/api/customers/', 201, json={
+            'data': build_resource('customer', {
+                'email': email,
+                'first-name': 'Benchmark',
+                'identity-document': identity_document,
+            }),
+        })
+        self.session.headers['Authorization'] = \
+            f'{authentication.CUSTOMER_AUTH_SCHEMA} {email} {identity_document}'
+
+    def verify_customer(self):
+        self.request('verify_customer', 'GET', '/api/customers/verify/', 200)
+
+    def list_items(self):
+        response = self.request('list_items', 'GET', '/api/items/', 200, params={
+            'include': 'options',
+            'page[size]': 100,
+        })
+        items = collections.defaultdict(list)
+
+        # only the seeded items are bought, so the stock of other items doesn't fail the orders
+        for item in response['data']:
+            if int(item['id']) not in self.item_ids:
+                continue
+
+            items[item['attributes']['type']].append((
+                item['id'],
+                [option['id'] for option in item['relationships']['options']['data']],
+            ))
+
+        return items
+
+    def get_discount_code(self):
+        response = self.request('get_discount_code', 'GET', '/api/discount-codes/', 200, params={
+            'filter[code]': random.choice(self.discount_codes),
+        })
+
+        return response['data'][0]['id']
+
+    def create_order(self, items, discount_code_id):
+        response = self.request('create_order', 'POST', '/api/orders/', 201, json={
+            'data': build_resource('order', {
+                'order-items': [
+                    build_resource('order-item', {
+                        'item': build_identifier('item', item_id),
+                        'options': [
+                            build_resource('order-item-option', {
+                                'item-option': build_identifier('item-option', option_id),
+                                'value': 'benchmark',
+                            }) for option_id in options_ids
+                        ],
+                    }) for item_id, options_ids in items
+                ],
+                'discount-code': build_identifier('discount-code', discount_code_id),
+            }),
+        })
+        self.order_id = int(response['data']['id'])
+
+    def notify_payment(self):
+        # the Mercado Pago stub answers merchant orders with the order of the same id
+        self.request('notify_payment', 'POST', '/api/orders/ipn/', 200, params={
+            'topic': mercadopago.IPNTopic.MERCHANT_ORDER.value,
+            'id': self.order_id,
+        })
+
+    def run(self):
+        try:
+            self.create_customer()
+            self.verify_customer()
+            items = self.list_items()
+            discount_code_id = self.get_discount_code()
+            self.create_order(
+                [
+                    random.choice(items[models.Item.TYPES.PASS]),
+                    random.choice(items[models.Item.TYPES.ADDON]),
+                ],
+                discount_code_id,
+            )
+            self.notify_payment()
+        except (JourneyError, requests.RequestException):
+            # the rest of the journey depends on the failed step
+            pass
+        finally:
+            self.session.close()
+
+        return self
+
+
+def run_journeys(url, item_ids, discount_codes, journeys, concurrency):
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        completed = list(executor.map(
+            lambda index: Journey(url, item_ids, discount_codes).run(),
+            range(journeys),
+        ))
+        elapsed = time.perf_counter() - start
+
+    return completed, elapsed
+
+
+def percentile(values, percent):
+    # nearest rank, always one of the measured values
+    values = sorted(values)
+
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+def summarize_step(results, elapsed):
+    latencies = [result.elapsed * 1000 for result in results]
+    queries = [result.queries for result in results]
+
+    return {
+        'requests': len(results),
+        'errors': sum(not result.ok for result in results),
+        'throughput': round(len(results) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2),
+            **{
+                f'p{percent}': round(percentile(latencies, percent), 2)
+                for percent in PERCENTILES
+            },
+            'max': round(max(latencies), 2),
+        },
+        'queries': {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        },
+    }
+
+
+def summarize(completed, elapsed, paid_orders):
+    results = collections.defaultdict(list)
+
+    for journey in completed:
+        for result in journey.results:
+            results[result.step].append(result)
+
+    return {
+        'journeys': len(completed),
+        'elapsed': round(elapsed, 3),
+        'paid_orders': paid_orders,
+        'throughput': round(paid_orders / elapsed, 2),
+        'steps': {
+            step: summarize_step(results[step], elapsed) for step in STEPS if results[step]
+        },
+    }
@@ -0,0 +1,32 @@
+import collections
+from djmoney import money
+
+from .. import factories, models
+
+# every journey reserves one pass and one add-on, the stock never runs out during a run
+SEED_STOCK = 10 ** 6
+
+Seed = collections.namedtuple('Seed', ['passes', 'addons', 'discount_codes'])
+
+
+def seed(passes=3, addons=10, discount_codes=20, options=2):
+    # creates the catalog the journeys buy from, items carry options so orders go through their
+    # validation as they do in production
+    return Seed(
+        passes=[
+            factories.ItemFactory(
+                type=models.Item.TYPES.PASS,
+                price=money.Money('3000.00', 'ARS'),
+                stock=SEED_STOCK,
+                options=[factories.ItemOptionFactory.build() for i in range(options)],
+            ) for i in range(passes)
+        ],
+        addons=[
+            factories.ItemFactory(
+                type=models.Item.TYPES.ADDON,
+                stock=SEED_STOCK,
+                options=[factories.ItemOptionFactory.build()],
+            ) for i in range(addons)
+        ],
+        discount_codes=[factories.DiscountCodeFactory() for i in range(discount_codes)],
+    )
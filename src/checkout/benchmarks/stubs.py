@@ -0,0 +1,146 @@
+import contextlib
+import json
+import re
+import threading
+import time
+import uuid
+from http import server
+from django.utils import timezone
+
+from .. import afip, mercadopago, models
+
+MERCHANT_ORDER_PATH = re.compile(r'^/merchant_orders/(?P<id>\d+)$')
+ACCESS_TOKEN_EXPIRATION = 6 * 60 * 60
+
+
+class MercadoPagoHandler(server.BaseHTTPRequestHandler):
+    # answers the Mercado Pago API calls shiro makes. Merchant orders are always paid and their id
+    # is the id of the order they belong to, so notifications need no shared state
+    latency = 0
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        self.read_body()
+        time.sleep(self.latency)
+
+        if self.path == mercadopago.TOKEN_PATH:
+            self.send_json(200, {
+                'access_token': 'benchmark',
+                'expires_in': ACCESS_TOKEN_EXPIRATION,
+            })
+        elif self.path == mercadopago.PREFERENCES_PATH:
+            self.send_json(201, {'id': f'benchmark-{uuid.uuid4()}'})
+        else:
+            self.send_json(404, {'message': 'not found'})
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        match = MERCHANT_ORDER_PATH.match(self.path)
+
+        if match is None:
+            self.send_json(404, {'message': 'not found'})
+        else:
+            self.send_json(200, {
+                'id': match.group('id'),
+                'external_reference': match.group('id'),
+                'status': 'closed',
+                'order_status': mercadopago.OrderStatus.PAID.value,
+            })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WSFEv1Stub:
+    # approves every voucher like WSFEv1 would, numbers follow the sequence stored by shiro
+    latency = 0
+
+    def __init__(self):
+        self.voucher = None
+        self.vouchers = []
+        self.results = []
+        self.reset()
+
+    def reset(self):
+        self.CAE = ''
+        self.Vencimiento = ''
+        self.ErrCode = ''
+        self.ErrMsg = ''
+        self.Obs = ''
+        self.Observaciones = []
+
+    def authorize(self, vouchers):
+        time.sleep(self.latency)
+        expiration = (timezone.now() + timezone.timedelta(days=10)).strftime(
+            afip.WSFEV1_DATE_FORMAT,
+        )
+
+        return [(f'{voucher["cbt_desde"]:014d}', expiration) for voucher in vouchers]
+
+    def CompUltimoAutorizado(self, invoice_type, point_of_sale):
+        sequence = models.InvoiceSequence.objects.filter(
+            point_of_sale=point_of_sale,
+            invoice_type=invoice_type,
+        ).first()
+
+        return str(sequence.last_number if sequence is not None else 0)
+
+    def CrearFactura(self, **voucher):
+        self.voucher = voucher
+
+    def CAESolicitar(self):
+        self.reset()
+        self.CAE, self.Vencimiento = self.authorize([self.voucher])[0]
+
+    def IniciarFacturasX(self):
+        self.vouchers = []
+        self.results = []
+
+    def AgregarFacturaX(self):
+        self.vouchers.append(self.voucher)
+
+    def CAESolicitarX(self):
+        self.results = self.authorize(self.vouchers)
+
+    def LeerFacturaX(self, index):
+        self.reset()
+        self.CAE, self.Vencimiento = self.results[index]
+
+
+@contextlib.contextmanager
+def mercadopago_server(latency=0):
+    handler = type('MercadoPagoHandler', (MercadoPagoHandler,), {'latency': latency})
+    stub_server = server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=stub_server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f'http://127.0.0.1:{stub_server.server_port}'
+    finally:
+        stub_server.shutdown()
+        stub_server.server_close()
+
+
+@contextlib.contextmanager
+def afip_client(latency=0):
+    stub = type('WSFEv1Stub', (WSFEv1Stub,), {'latency': latency})
+
+    get_client = afip.get_client
+    # the login against WSAA is skipped along with the SOAP client
+    afip.get_client = stub
+
+    try:
+        yield
+    finally:
+        afip.get_client = get_client
@@ -0,0 +1,125 @@
+import hashlib
+import uuid
+from django import http
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import signals
+from django.utils import timezone, cache as cache_utils, http as http_utils
+from rest_framework_json_api import renderers
+
+from shiro import metrics
+from . import models
+
+VERSION_CACHE_KEY = 'CATALOG_VERSION'
+RESPONSE_CACHE_KEY = 'CATALOG_RESPONSE'
+CACHED_QUERY_PARAMS = ('filter[type]', 'include', 'page[number]', 'page[size]')
+# responses carry the remaining stock of the items, which every order changes without invalidating
+# the catalog, so they're only kept for a few seconds
+RESPONSE_TIMEOUT = 10
+
+
+def get_cache():
+    return caches['catalog']
+
+
+def new_version():
+    # every invalidation writes a value no other one can, so concurrent invalidations never
+    # leave behind a version a response rendered between them was already stored under
+    return uuid.uuid4().hex
+
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_CACHE_KEY)
+
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, new_version(), None)
+        version = cache.get(VERSION_CACHE_KEY)
+
+    return version
+
+
+def bump_version():
+    get_cache().set(VERSION_CACHE_KEY, new_version(), None)
+
+
+def invalidate(*args, **kwargs):
+    bump_version()
+
+    # responses rendered before the transaction commits still see the old data, so they're
+    # dropped once more when it does
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump_version)
+
+
+def build_cache_key(request, version):
+    params = sorted(
+        (param, request.query_params.get(param))
+        for param in CACHED_QUERY_PARAMS
+        if param in request.query_params
+    )
+    key = f'{request.path}:{request.accepted_media_type}:{params}'
+
+    return f'{RESPONSE_CACHE_KEY}:{version}:{hashlib.md5(key.encode("utf-8")).hexdigest()}'
+
+
+def is_cacheable(request):
+    return request.method == 'GET' and \
+        isinstance(request.accepted_renderer, renderers.JSONRenderer) and \
+        set(request.query_params.keys()) <= set(CACHED_QUERY_PARAMS)
+
+
+def set_validators(response, last_modified):
+    cache_utils.set_response_etag(response)
+    response['Last-Modified'] = http_utils.http_date(last_modified)
+    cache_utils.patch_vary_headers(response, ('Accept',))
+
+
+def cached_response(request, get_response):
+    if not is_cacheable(request):
+        return get_response()
+
+    cache = get_cache()
+    version = get_version()
+    cache_key = build_cache_key(request, version)
+    cached = cache.get(cache_key)
+    metrics.record_cache('catalog', cached is not None)
+
+    if cached is not None:
+        response = http.HttpResponse(cached['content'], content_type=cached['content_type'])
+        set_validators(response, cached['last_modified'])
+
+        return cache_utils.get_conditional_response(
+            request,
+            etag=response['ETag'],
+            last_modified=cached['last_modified'],
+            response=response,
+        )
+
+    def store(response):
+        if response.status_code == 200:
+            last_modified = int(timezone.now().timestamp())
+            set_validators(response, last_modified)
+            cache.set(cache_key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'last_modified': last_modified,
+            }, RESPONSE_TIMEOUT)
+
+    response = get_response()
+    response.add_post_render_callback(store)
+
+    return response
+
+
+for model in (models.Item, models.ItemOption):
+    signals.post_save.connect(
+        invalidate,
+        sender=model,
+        dispatch_uid=f'catalog_{model.__name__}_save',
+    )
+    signals.post_delete.connect(
+        invalidate,
+        sender=model,
+        dispatch_uid=f'catalog_{model.__name__}_delete',
+    )
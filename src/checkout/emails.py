@@ -0,0 +1,145 @@
+import time
+import contextlib
+from django.conf import settings
+from django.core import mail
+from django.db import connection
+from django.template import Context, loader
+from django.utils import timezone
+from render_block import django as render_block, exceptions as render_block_exceptions
+
+from . import models, queues
+
+EMAIL_PARTS = ('subject', 'plain', 'html')
+# SES errors worth retrying, any other error code means the message was rejected
+TRANSIENT_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'InternalFailure',
+}
+# any number unique among the advisory locks taken on the database
+SENDER_LOCK_ID = 0x656d61696c
+
+email_queue = queues.Queue(models.Email, models.Email.STATUS.SENDING, 'send_after')
+
+
+def get_template(template_name):
+    return loader.get_template(
+        f'{settings.TEMPLATED_EMAIL_TEMPLATE_DIR}{template_name}.'
+        f'{settings.TEMPLATED_EMAIL_FILE_EXTENSION}',
+    )
+
+
+def render_email(template, context):
+    # same blocks and context templated_email renders
+    parts = {}
+
+    for part in EMAIL_PARTS:
+        try:
+            parts[part] = render_block.django_render_block(
+                template,
+                part,
+                Context(context, autoescape=False),
+            )
+        except render_block_exceptions.BlockNotFound:
+            parts[part] = ''
+
+    parts['subject'] = parts['subject'].strip('\n\r')
+
+    return parts
+
+
+def queue_emails(template_name, messages, attachments=()):
+    # one email for every (to, context) pair, sent later by the worker
+    template = get_template(template_name)
+    emails = models.Email.objects.bulk_create([
+        models.Email(to=to, **render_email(template, context)) for to, context in messages
+    ])
+    models.EmailAttachment.objects.bulk_create([
+        models.EmailAttachment(email=email, name=name, content=content, mimetype=mimetype)
+        for email in emails for name, content, mimetype in attachments
+    ])
+
+    return emails
+
+
+def queue_email(template_name, to, context, attachments=()):
+    return queue_emails(template_name, [(to, context)], attachments=attachments)[0]
+
+
+def build_message(email, connection):
+    message = mail.EmailMultiAlternatives(
+        email.subject,
+        email.plain,
+        settings.DEFAULT_EMAIL,
+        [email.to],
+        connection=connection,
+    )
+
+    if email.html:
+        message.attach_alternative(email.html, 'text/html')
+
+    for attachment in email.attachments.all():
+        message.attach(attachment.name, bytes(attachment.content), attachment.mimetype)
+
+    return message
+
+
+def is_transient_error(error):
+    # errors without a code didn't get an answer from SES, e.g. connection errors
+    response = getattr(error, 'response', None)
+    code = response.get('Error', {}).get('Code') if isinstance(response, dict) else None
+
+    return code is None or code in TRANSIENT_ERROR_CODES
+
+
+def set_email_sent(email):
+    email_queue.update(email, status=models.Email.STATUS.SENT, sent_at=timezone.now(), error='')
+
+
+def set_email_failed(email, error):
+    email_queue.set_failed(email, error, retry=is_transient_error(error))
+
+
+@contextlib.contextmanager
+def sender_lock():
+    # a session lock, as the queue commits every claim and every sent email on its own
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [SENDER_LOCK_ID])
+        acquired, = cursor.fetchone()
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [SENDER_LOCK_ID])
+
+
+def send_queued_emails(batch_size=None):
+    emails = list(email_queue.claim(batch_size).prefetch_related('attachments'))
+
+    if not emails:
+        return 0, 0
+
+    interval = 1 / settings.EMAIL_SEND_RATE
+    next_send_at = time.monotonic()
+    sent = 0
+
+    # a single connection, i.e. a single SES client, for the whole batch
+    with mail.get_connection() as connection:
+        for email in emails:
+            time.sleep(max(next_send_at - time.monotonic(), 0))
+            next_send_at = max(next_send_at, time.monotonic()) + interval
+
+            try:
+                build_message(email, connection).send()
+            except Exception as error:
+                set_email_failed(email, error)
+            else:
+                # marked right away, so a batch cut short doesn't send them again
+                set_email_sent(email)
+                sent += 1
+
+    return sent, len(emails)
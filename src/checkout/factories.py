@@ -8,7 +8,7 @@ class ItemFactory(factory.DjangoModelFactory):
     name = factory.Faker('word')
     type = factory.Faker('random_element', elements=[type[0] for type in models.Item.TYPES])
     price = factory.Faker('numerify', text='###.##')
-    stock = factory.Faker('random_digit')
+    stock = factory.Faker('random_int', min=10, max=100)
 
     class Meta:
         model = models.Item
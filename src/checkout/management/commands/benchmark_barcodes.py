@@ -0,0 +1,52 @@
+import base64
+import io
+import random
+import timeit
+import barcode
+from django.core.management import base
+
+from ... import barcodes
+
+
+def render_python_barcode(code):
+    output = io.BytesIO()
+    barcode.get_barcode_class('itf')(code).write(output, options={'module_width': 0.16})
+
+    return 'data:image/svg+xml;charset=utf-8;base64,' + \
+        base64.b64encode(output.getvalue()).decode('utf-8')
+
+
+class Command(base.BaseCommand):
+    help = 'Compares invoice barcode rendering with python-barcode against the compact encoder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codes', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def measure(self, render, codes, repeat):
+        elapsed = min(timeit.repeat(
+            lambda: [render(code) for code in codes],
+            number=1,
+            repeat=repeat,
+        ))
+        size = sum(len(render(code)) for code in codes) / len(codes)
+
+        return elapsed / len(codes) * 1e6, size
+
+    def uncached(self, code):
+        return barcodes.render_svg.__wrapped__(code)
+
+    def handle(self, *args, codes, repeat, **options):
+        # invoice codes are 42 digits: CUIT, type, point of sale, CAE, due date and check digit
+        codes = [''.join(random.choices('0123456789', k=42)) for i in range(codes)]
+        barcodes.render_svg.cache_clear()
+        for code in codes:
+            barcodes.render_svg(code)
+
+        for name, render in (
+            ('python-barcode', render_python_barcode),
+            ('compact', self.uncached),
+            ('compact cached', barcodes.render_svg),
+        ):
+            per_code, size = self.measure(render, codes, repeat)
+            self.stdout.write(f'{name}: {per_code:.1f}us/code size={size:.0f}B')
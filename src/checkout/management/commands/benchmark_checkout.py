@@ -0,0 +1,84 @@
+import json
+import shutil
+import tempfile
+from django import db
+from django.core.management import base
+from django.test import utils as test_utils
+
+from ... import models
+from ...benchmarks import journey, seed, stubs
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Runs the customer checkout journey against a local server, with Mercado Pago and AFIP '
+        'stubbed, and reports latency, throughput and queries per step as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journeys', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--stub-latency',
+            type=float,
+            default=0,
+            help='Seconds the Mercado Pago and AFIP stubs take to answer',
+        )
+        parser.add_argument('--output', help='File for the JSON report, stdout by default')
+
+    def handle(self, *args, output, **options):
+        # the seeded catalog and everything the journeys write go to a throwaway test database,
+        # never to the one the settings point at
+        old_config = test_utils.setup_databases(verbosity=0, interactive=False)
+        # and the invoices they generate to a throwaway directory
+        media_root = tempfile.mkdtemp(prefix='benchmark_checkout')
+
+        try:
+            report = json.dumps(self.run_benchmark(media_root=media_root, **options), indent=2)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            db.connections.close_all()
+            test_utils.teardown_databases(old_config, verbosity=0)
+
+        if output:
+            with open(output, 'w') as report_file:
+                report_file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def run_benchmark(self, journeys, concurrency, stub_latency, media_root, **options):
+        catalog = seed.seed()
+        item_ids = {item.id for item in [*catalog.passes, *catalog.addons]}
+        discount_codes = [discount_code.code for discount_code in catalog.discount_codes]
+
+        with stubs.mercadopago_server(stub_latency) as mercadopago_url, \
+                stubs.afip_client(stub_latency), \
+                test_utils.override_settings(
+                    DEBUG=False,
+                    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+                    MEDIA_ROOT=media_root,
+                    ALLOWED_HOSTS=['127.0.0.1'],
+                    MERCADOPAGO_API_URL=mercadopago_url,
+                    MERCADOPAGO_CLIENT_ID='benchmark',
+                    MERCADOPAGO_CLIENT_SECRET='benchmark',
+                    MERCADOPAGO_ASYNC_PREFERENCES=False,
+                    EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend',
+                    # outside Lambda the email worker runs within the notification request, its
+                    # pacing would be measured as part of it
+                    EMAIL_SEND_RATE=float('inf'),
+                ), \
+                journey.local_server() as url:
+            completed, elapsed = journey.run_journeys(
+                url,
+                item_ids,
+                discount_codes,
+                journeys,
+                concurrency,
+            )
+
+        paid_orders = models.Order.objects.filter(
+            id__in=[completed_journey.order_id for completed_journey in completed],
+            status=models.Order.STATUS.PAID,
+        ).count()
+
+        return journey.summarize(completed, elapsed, paid_orders)
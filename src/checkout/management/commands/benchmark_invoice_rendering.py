@@ -0,0 +1,59 @@
+import resource
+import time
+from django.core.management import base
+from django.utils import timezone
+
+from ... import afip, models, renderer
+
+
+def render(invoice_data):
+    renderer.render_invoice(invoice_data)
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(base.BaseCommand):
+    help = 'Measures invoice PDF rendering throughput and peak memory per worker count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=50)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--order', type=int, help='Order used as sample, the latest by default')
+
+    def build_invoices_data(self, order_id, invoices):
+        orders = models.Order.objects.select_related('customer__user').order_by('-id')
+        order = orders.filter(id=order_id).first() if order_id else orders.first()
+
+        if order is None:
+            raise base.CommandError('There are no orders to render invoices for')
+
+        invoice = afip.build_invoice(order, timezone.now())
+
+        return [
+            afip.complete_invoice(dict(invoice), number, '70000000000000', '20200309')
+            for number in range(1, invoices + 1)
+        ]
+
+    def run(self, invoices_data, workers):
+        # the pool start up, including warming each worker, is part of the measured time
+        start = time.perf_counter()
+
+        if workers <= 1:
+            renderer.get_stylesheets()
+            peak_rss = [render(invoice_data) for invoice_data in invoices_data]
+        else:
+            with renderer.build_pool(workers) as pool:
+                peak_rss = list(pool.map(render, invoices_data))
+
+        return time.perf_counter() - start, max(peak_rss)
+
+    def handle(self, *args, invoices, workers, order, **options):
+        invoices_data = self.build_invoices_data(order, invoices)
+
+        for workers_count in workers:
+            elapsed, peak_rss = self.run(invoices_data, workers_count)
+
+            self.stdout.write(
+                f'workers={workers_count} invoices={invoices} elapsed={elapsed:.2f}s '
+                f'throughput={invoices / elapsed:.1f}/s peak_rss={peak_rss / 1024:.1f}MB',
+            )
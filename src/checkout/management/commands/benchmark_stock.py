@@ -0,0 +1,80 @@
+import time
+from concurrent import futures
+from django import db
+from django.core.management import base
+from django.db import transaction
+from django.test import utils as test_utils
+
+from ... import models, stock
+
+
+class Command(base.BaseCommand):
+    help = 'Measures reservation throughput of a single stock row against sharded stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservations', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 4, 16])
+        parser.add_argument(
+            '--hold',
+            type=float,
+            default=0.01,
+            help='Seconds each reservation keeps its transaction open',
+        )
+
+    def reserve(self, item_id, reservations, hold):
+        reserved = 0
+
+        try:
+            for i in range(reservations):
+                with transaction.atomic():
+                    reserved += stock.decrement_stock(item_id, 1)
+                    # stands in for the rest of the order creation done in the same transaction
+                    time.sleep(hold)
+        finally:
+            db.connection.close()
+
+        return reserved
+
+    def run(self, shards, reservations, workers, hold):
+        item = models.Item.objects.create(
+            name='Stock benchmark',
+            type=models.Item.TYPES.PASS,
+            price=0,
+            stock=reservations // workers * workers,
+        )
+
+        try:
+            stock.rebalance_item_stock(item.id, shards)
+
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                start = time.perf_counter()
+                reserved = sum(executor.map(
+                    lambda index: self.reserve(item.id, reservations // workers, hold),
+                    range(workers),
+                ))
+                elapsed = time.perf_counter() - start
+
+            item.refresh_from_db()
+            remaining = item.get_available_stock()
+        finally:
+            item.delete()
+
+        return reserved, remaining, elapsed
+
+    def handle(self, *args, reservations, workers, shards, hold, **options):
+        # the benchmark item goes to a throwaway test database, never to the one the settings
+        # point at
+        old_config = test_utils.setup_databases(verbosity=0, interactive=False)
+
+        try:
+            for shards_count in shards:
+                reserved, remaining, elapsed = self.run(shards_count, reservations, workers, hold)
+
+                self.stdout.write(
+                    f'shards={shards_count} reserved={reserved} remaining={remaining} '
+                    f'elapsed={elapsed:.2f}s throughput={reserved / elapsed:.1f}/s',
+                )
+        finally:
+            db.connections.close_all()
+            test_utils.teardown_databases(old_config, verbosity=0)
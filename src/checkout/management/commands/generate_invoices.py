@@ -0,0 +1,24 @@
+from django.core.management import base
+
+from ... import afip, tasks
+
+
+class Command(base.BaseCommand):
+    help = 'Requests the CAE of paid orders without an invoice in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=afip.INVOICE_BATCH_SIZE)
+
+    def handle(self, *args, batch_size=afip.INVOICE_BATCH_SIZE, **options):
+        invoiced = 0
+
+        while True:
+            batch_invoiced, batch_orders = tasks.generate_invoices(batch_size=batch_size)
+            invoiced += batch_invoiced
+
+            # a batch with no invoices means AFIP rejected all of its orders, they're left alone
+            # instead of being requested again right away
+            if batch_orders < batch_size or batch_invoiced == 0:
+                break
+
+        self.stdout.write(f'Generated {invoiced} invoices')
@@ -0,0 +1,19 @@
+from django.core.management import base
+
+from ... import stock
+
+
+class Command(base.BaseCommand):
+    help = 'Splits the stock of an item evenly across the given number of shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('item_id', type=int)
+        parser.add_argument('--shards', type=int, default=0)
+
+    def handle(self, *args, item_id, shards=0, **options):
+        if shards < 0:
+            raise base.CommandError('The number of shards must be zero or positive')
+
+        total = stock.rebalance_item_stock(item_id, shards)
+
+        self.stdout.write(f'Split {total} units of item {item_id} across {shards} shards')
@@ -0,0 +1,12 @@
+from django.core.management import base
+
+from ... import stock
+
+
+class Command(base.BaseCommand):
+    help = 'Returns the stock of expired reservations and cancels their orders'
+
+    def handle(self, *args, **options):
+        released = stock.release_expired_reservations()
+
+        self.stdout.write(f'Released reservations for {released} orders')
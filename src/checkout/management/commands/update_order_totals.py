@@ -0,0 +1,24 @@
+from django.core.management import base
+from django.db import transaction
+
+from ... import models, pricing
+
+
+class Command(base.BaseCommand):
+    help = 'Recalculates the stored totals of existing orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, batch_size=100, **options):
+        order_ids = list(models.Order.objects.order_by('id').values_list('id', flat=True))
+
+        for start in range(0, len(order_ids), batch_size):
+            with transaction.atomic():
+                orders = models.Order.objects \
+                    .filter(id__in=order_ids[start:start + batch_size]) \
+                    .select_related('discount_code') \
+                    .prefetch_related('order_items')
+                pricing.update_orders_totals(orders)
+
+        self.stdout.write(f'Updated totals for {len(order_ids)} orders')
@@ -1,10 +1,22 @@
 import enum
-import mercadopago
+import functools
+import threading
+import time
+import requests
+from requests import adapters
+from urllib3.util import retry
 from django.conf import settings
 
-from . import models
+from shiro import metrics
+from . import models, stock
 
+TOKEN_PATH = '/oauth/token'
+PREFERENCES_PATH = '/checkout/preferences'
 MERCHANT_ORDER_PATH = '/merchant_orders/{id}'
+TOKEN_EXPIRATION_MARGIN = 60
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (500, 502, 503, 504)
 
 
 class IPNTopic(enum.Enum):
@@ -22,11 +34,110 @@ class OrderStatus(enum.Enum):
     PAYMENT_IN_PROCESS = 'payment_in_process'
 
 
+class MercadoPagoError(Exception):
+    def __init__(self, status, response):
+        self.status = status
+        self.response = response
+        super().__init__(f'Mercado Pago responded with {status}: {response}')
+
+
+class Client:
+    def __init__(self, client_id, client_secret, api_url, timeout, max_retries=MAX_RETRIES):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = build_session(api_url, max_retries)
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.access_token_expires_at = 0
+
+    def get_access_token(self):
+        with self.lock:
+            if self.access_token is None or time.monotonic() >= self.access_token_expires_at:
+                access_data = self.request('POST', TOKEN_PATH, authenticate=False, data={
+                    'client_id': self.client_id,
+                    'client_secret': self.client_secret,
+                    'grant_type': 'client_credentials',
+                })['response']
+                self.access_token = access_data['access_token']
+                self.access_token_expires_at = time.monotonic() + \
+                    access_data['expires_in'] - TOKEN_EXPIRATION_MARGIN
+
+            return self.access_token
+
+    def invalidate_access_token(self):
+        with self.lock:
+            self.access_token = None
+
+    def send(self, method, path, authenticate=True, **kwargs):
+        headers = {'Accept': 'application/json'}
+
+        if authenticate:
+            headers['Authorization'] = f'Bearer {self.get_access_token()}'
+
+        with metrics.track_external('mercadopago', f'{method} {path}'):
+            return self.session.request(
+                method,
+                f'{self.api_url}{path}',
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs,
+            )
+
+    def request(self, method, path, authenticate=True, **kwargs):
+        response = self.send(method, path, authenticate=authenticate, **kwargs)
+
+        if response.status_code == 401 and authenticate:
+            # the token was revoked before its expiration, a new one is requested only once
+            self.invalidate_access_token()
+            response = self.send(method, path, authenticate=authenticate, **kwargs)
+
+        if response.status_code >= 400:
+            raise MercadoPagoError(response.status_code, response.text)
+
+        return {
+            'status': response.status_code,
+            'response': response.json(),
+        }
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    def create_preference(self, preference):
+        return self.request('POST', PREFERENCES_PATH, json=preference)
+
+
+def build_session(api_url, max_retries=MAX_RETRIES):
+    session = requests.Session()
+    session.mount(api_url, adapters.HTTPAdapter(max_retries=retry.Retry(
+        total=max_retries,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # preferences can be safely created twice, so POST requests are retried as well
+        method_whitelist=False,
+        raise_on_status=False,
+    )))
+
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def build_mp_client(client_id, client_secret, api_url, timeout):
+    return Client(client_id, client_secret, api_url, timeout)
+
+
 def get_mp_client():
     assert settings.MERCADOPAGO_CLIENT_ID, 'Client Id for Mercado Pago not set'
     assert settings.MERCADOPAGO_CLIENT_SECRET, 'Client Secret for Mercado Pago not set'
 
-    return mercadopago.MP(settings.MERCADOPAGO_CLIENT_ID, settings.MERCADOPAGO_CLIENT_SECRET)
+    # the client is shared by the whole process so its access token and connections are reused
+    return build_mp_client(
+        settings.MERCADOPAGO_CLIENT_ID,
+        settings.MERCADOPAGO_CLIENT_SECRET,
+        settings.MERCADOPAGO_API_URL,
+        settings.MERCADOPAGO_TIMEOUT,
+    )
 
 
 def build_path(path, **kwargs):
@@ -57,12 +168,21 @@ def generate_order_preference(order, notification_url=None, back_urls=None):
         'external_reference': str(order.id),
         'notification_url': notification_url,
         'back_urls': back_urls,
+        'expires': True,
+        'expiration_date_to': stock.get_reservation_expiration(order).isoformat(
+            timespec='milliseconds',
+        ),
     }
 
     preference = mp.create_preference(preference)
     order.preference_id = preference['response']['id']
     order.status = models.Order.STATUS.IN_PROCESS
-    order.save()
+
+    # the order may have been cancelled while the preference was being created
+    models.Order.objects.filter(id=order.id, status=models.Order.STATUS.CREATED).update(
+        preference_id=order.preference_id,
+        status=order.status,
+    )
 
 
 def get_merchant_order(id):
@@ -0,0 +1,55 @@
+# Generated by Django 3.0.4 on 2026-10-18 02:12
+
+from decimal import Decimal
+from django.db import migrations
+import djmoney.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0018_customer_add_user_related_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='base_total',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='ARS', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='base_total_currency',
+            field=djmoney.models.fields.CurrencyField(choices=[('ARS', 'Argentine Peso')], default='ARS', editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_total',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='ARS', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_total_currency',
+            field=djmoney.models.fields.CurrencyField(choices=[('ARS', 'Argentine Peso')], default='ARS', editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='ARS', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_currency',
+            field=djmoney.models.fields.CurrencyField(choices=[('ARS', 'Argentine Peso')], default='ARS', editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='total',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default=Decimal('0'), default_currency='ARS', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='total_currency',
+            field=djmoney.models.fields.CurrencyField(choices=[('ARS', 'Argentine Peso')], default='ARS', editable=False, max_length=3),
+        ),
+    ]
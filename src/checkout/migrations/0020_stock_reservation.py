@@ -0,0 +1,27 @@
+# Generated by Django 3.0.4 on 2026-10-18 02:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0019_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField()),
+                ('status', model_utils.fields.StatusField(choices=[('RESERVED', 'Reservado'), ('CONFIRMED', 'Confirmado'), ('RELEASED', 'Liberado')], default='RESERVED', max_length=100, no_check_for_status=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='checkout.Item')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='checkout.Order')),
+            ],
+        ),
+    ]
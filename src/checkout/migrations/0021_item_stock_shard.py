@@ -0,0 +1,22 @@
+# Generated by Django 3.0.4 on 2026-10-18 02:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0020_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemStockShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='checkout.Item')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.4 on 2026-10-18 02:26
+
+from django.db import migrations, models
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0021_item_stock_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=50)),
+                ('resource_id', models.CharField(max_length=100)),
+                ('status', model_utils.fields.StatusField(choices=[('PENDING', 'Pendiente'), ('PROCESSING', 'Procesando'), ('PROCESSED', 'Procesada'), ('FAILED', 'Fallida')], default='PENDING', max_length=100, no_check_for_status=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('topic', 'resource_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('checkout', '0025_outbox_event'),
+    ]
+
+    operations = [
+        # matches the UPPER() expression Django uses for identity_document__iexact lookups
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS checkout_customer_identity_document_upper_idx '
+            'ON checkout_customer (UPPER(identity_document::text));',
+            'DROP INDEX CONCURRENTLY IF EXISTS checkout_customer_identity_document_upper_idx;',
+        ),
+    ]
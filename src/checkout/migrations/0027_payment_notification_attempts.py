@@ -0,0 +1,18 @@
+# Generated by Django 3.0.4 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0026_customer_identity_document_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentnotification',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
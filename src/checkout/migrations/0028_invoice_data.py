@@ -0,0 +1,26 @@
+# Generated by Django 3.0.4 on 2026-10-18 03:20
+
+from django.db import migrations, models
+import django.contrib.postgres.fields.jsonb
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0027_payment_notification_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='data',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,12 +1,14 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import functions
 from django.core import validators, signing
+from django.utils import timezone
 from django.contrib.postgres import fields as postgres_fields
 from model_utils import choices, fields as util_fields, tracker
 from djmoney.models import fields as money_fields
 from djmoney import money
 
-from . import validators as custom_validators, signals
+from . import validators as custom_validators, pricing, tokens
 
 
 class Item(models.Model):
@@ -22,6 +24,27 @@ class Item(models.Model):
     def __str__(self):
         return self.name
 
+    def get_available_stock(self):
+        shards_stock = getattr(self, 'shards_stock', None)
+
+        if shards_stock is None:
+            if 'stock_shards' in getattr(self, '_prefetched_objects_cache', {}):
+                shards_stock = sum(shard.stock for shard in self.stock_shards.all())
+            else:
+                shards_stock = self.stock_shards.aggregate(
+                    stock=functions.Coalesce(models.Sum('stock'), 0),
+                )['stock']
+
+        return self.stock + shards_stock
+
+
+class ItemStockShard(models.Model):
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, related_name='stock_shards')
+    stock = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.item} stock shard #{self.id}'
+
 
 class ItemOption(models.Model):
     TYPES = choices.Choices(('TEXT', 'Texto'), ('EMAIL', 'Email'), ('COLOR', 'Color'))
@@ -77,27 +100,18 @@ class DiscountCode(models.Model):
         return discount
 
     def calculate_order_item_discount(self, order_item):
-        discount = money.Money(0, 'ARS')
-
-        if self.type == self.TYPES.ITEM and order_item.item in self.items.all():
-            base_total = order_item.calculate_base_total()
-            discount = self.calculate_discount(base_total)
-
-        return discount
+        return pricing.calculate_order_item_totals(
+            order_item,
+            discount_code=self,
+            discount_item_ids=pricing.get_discount_codes_item_ids([self]).get(self.id, ()),
+        ).discount
 
     def calculate_order_discount(self, order):
-        discount = money.Money(0, 'ARS')
-
-        if self.type == self.TYPES.ORDER:
-            base_total = order.calculate_base_total()
-            discount = self.calculate_discount(base_total)
-        elif self.type == self.TYPES.ITEM:
-            discount = sum(
-                self.calculate_order_item_discount(order_item)
-                for order_item in order.order_items.all()
-            )
-
-        return discount
+        return pricing.calculate_totals(
+            order.order_items.all(),
+            discount_code=self,
+            discount_item_ids=pricing.get_discount_codes_item_ids([self]).get(self.id, ()),
+        ).discount
 
 
 class DiscountCodeRestriction(models.Model):
@@ -131,13 +145,11 @@ class Customer(models.Model):
     identity_document = models.CharField(max_length=50)
     company = models.CharField(max_length=100, null=True, blank=True)
 
-    @staticmethod
-    def generate_customer_token(email, identity_document):
-        return signing.dumps((email, identity_document))
-
     @staticmethod
     def parse_customer_token(token):
-        return signing.loads(token)
+        # tokens issued before the compact ones in checkout.tokens, still accepted until they
+        # expire like the new ones
+        return signing.loads(token, max_age=settings.CUSTOMER_TOKEN_MAX_AGE)
 
     def __str__(self):
         return str(self.user)
@@ -146,7 +158,7 @@ class Customer(models.Model):
         return len(self.identity_document) == self.CUIT_LENGTH
 
     def generate_token(self):
-        return Customer.generate_customer_token(self.user.email, self.identity_document)
+        return tokens.generate_customer_token(self.id)
 
 
 class Order(models.Model):
@@ -155,6 +167,7 @@ class Order(models.Model):
         ('IN_PROCESS', 'En proceso'),
         ('PAID', 'Pagado'),
         ('CANCELLED', 'Cancelado'),
+        ('REFUND_PENDING', 'Reembolso pendiente'),
     )
 
     customer = models.ForeignKey('Customer', on_delete=models.CASCADE, related_name='orders')
@@ -172,8 +185,27 @@ class Order(models.Model):
     preference_id = models.CharField(max_length=100, null=True, blank=True)
     external_id = models.CharField(max_length=100, null=True, blank=True)
     status = util_fields.StatusField()
+    base_total = money_fields.MoneyField(
+        max_digits=10,
+        decimal_places=2,
+        default_currency='ARS',
+        default=0,
+    )
+    discount_total = money_fields.MoneyField(
+        max_digits=10,
+        decimal_places=2,
+        default_currency='ARS',
+        default=0,
+    )
+    total = money_fields.MoneyField(
+        max_digits=10,
+        decimal_places=2,
+        default_currency='ARS',
+        default=0,
+    )
 
     status_tracker = tracker.FieldTracker(fields=['status'])
+    totals_tracker = tracker.FieldTracker(fields=['discount_code'])
 
     def __str__(self):
         return f'Orden {self.id} ({self.customer})'
@@ -181,11 +213,20 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         order_paid = self.status_tracker.previous('status') != self.STATUS.PAID and \
             self.status == self.STATUS.PAID
+        discount_code_changed = self.id is not None and \
+            self.totals_tracker.has_changed('discount_code')
 
         super().save(*args, **kwargs)
 
+        if discount_code_changed:
+            self.update_totals()
+
         if order_paid:
-            signals.order_paid.send(sender=self.__class__, order=self)
+            # delivered to the order_paid receivers once the transaction commits
+            OutboxEvent.objects.create(
+                name=OutboxEvent.NAMES.ORDER_PAID,
+                payload={'order_id': self.id},
+            )
 
     def calculate_base_total(self):
         return sum(order_item.calculate_base_total() for order_item in self.order_items.all())
@@ -199,9 +240,10 @@ class Order(models.Model):
         return discount
 
     def calculate_total(self):
-        total = self.calculate_base_total() - self.calculate_discount()
+        return pricing.calculate_order_totals(self).total
 
-        return total
+    def update_totals(self, order_items=()):
+        pricing.update_orders_totals([self], known_order_items=order_items)
 
 
 class OrderItem(models.Model):
@@ -210,6 +252,14 @@ class OrderItem(models.Model):
     price = money_fields.MoneyField(max_digits=7, decimal_places=2, default_currency='ARS')
     amount = models.PositiveIntegerField(default=1)
     fulfilled = models.BooleanField(default=False)
+    total = money_fields.MoneyField(
+        max_digits=10,
+        decimal_places=2,
+        default_currency='ARS',
+        default=0,
+    )
+
+    totals_tracker = tracker.FieldTracker(fields=['price', 'amount'])
 
     def __str__(self):
         return f'{self.amount} {self.item} ({self.price})'
@@ -218,8 +268,19 @@ class OrderItem(models.Model):
         if self.id is None:
             self.price = self.item.price if self.item is not None else None
 
+        totals_changed = self.id is None or self.totals_tracker.changed()
+
         super().save(*args, **kwargs)
 
+        if totals_changed:
+            self.order.update_totals(order_items=[self])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.order.update_totals()
+
+        return result
+
     def calculate_base_total(self):
         return self.price * self.amount
 
@@ -252,11 +313,45 @@ class OrderItemOption(models.Model):
         self.item_option.validate_value(self.value)
 
 
+class StockReservation(models.Model):
+    STATUS = choices.Choices(
+        ('RESERVED', 'Reservado'),
+        ('CONFIRMED', 'Confirmado'),
+        ('RELEASED', 'Liberado'),
+    )
+
+    order = models.ForeignKey('Order', on_delete=models.CASCADE, related_name='stock_reservations')
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, related_name='stock_reservations')
+    amount = models.PositiveIntegerField()
+    status = util_fields.StatusField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Reserva de {self.amount} {self.item} para {self.order}'
+
+
+class InvoiceSequence(models.Model):
+    point_of_sale = models.PositiveIntegerField()
+    invoice_type = models.PositiveIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('point_of_sale', 'invoice_type')
+
+    def __str__(self):
+        return f'Secuencia {self.invoice_type} del punto de venta {self.point_of_sale}'
+
+
 class Invoice(models.Model):
     order = models.OneToOneField('Order', on_delete=models.CASCADE)
     number = models.PositiveIntegerField()
     cae = models.CharField(max_length=100)
     file = models.FileField(upload_to='documents/invoices/')
+    # what the PDF is rendered from, cleared once the file is stored
+    data = postgres_fields.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'Factura {self.number} de {self.order}'
@@ -292,3 +387,85 @@ class CreditNote(models.Model):
 
     def __str__(self):
         return f'Nota de crédito de {self.cancellation.order}'
+
+
+class PaymentNotification(models.Model):
+    STATUS = choices.Choices(
+        ('PENDING', 'Pendiente'),
+        ('PROCESSING', 'Procesando'),
+        ('PROCESSED', 'Procesada'),
+        ('FAILED', 'Fallida'),
+    )
+
+    topic = models.CharField(max_length=50)
+    resource_id = models.CharField(max_length=100)
+    status = util_fields.StatusField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('topic', 'resource_id')
+
+    def __str__(self):
+        return f'Notificación {self.topic} {self.resource_id}'
+
+
+class Email(models.Model):
+    STATUS = choices.Choices(
+        ('PENDING', 'Pendiente'),
+        ('SENDING', 'Enviando'),
+        ('SENT', 'Enviado'),
+        ('FAILED', 'Fallido'),
+    )
+
+    status = util_fields.StatusField(db_index=True)
+    to = models.EmailField()
+    subject = models.TextField()
+    plain = models.TextField()
+    html = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Email a {self.to}: {self.subject}'
+
+
+class EmailAttachment(models.Model):
+    email = models.ForeignKey('Email', on_delete=models.CASCADE, related_name='attachments')
+    name = models.CharField(max_length=100)
+    content = models.BinaryField()
+    mimetype = models.CharField(max_length=100)
+
+
+class OutboxEvent(models.Model):
+    NAMES = choices.Choices(
+        ('ORDER_PAID', 'Orden pagada'),
+    )
+    STATUS = choices.Choices(
+        ('PENDING', 'Pendiente'),
+        ('PROCESSING', 'Procesando'),
+        ('PROCESSED', 'Procesado'),
+        ('FAILED', 'Fallido'),
+    )
+
+    name = models.CharField(max_length=50, choices=NAMES)
+    payload = postgres_fields.JSONField(default=dict)
+    status = util_fields.StatusField(db_index=True)
+    delivered_receivers = postgres_fields.ArrayField(
+        models.CharField(max_length=200),
+        default=list,
+        blank=True,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Evento {self.get_name_display()} {self.payload}'
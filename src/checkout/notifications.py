@@ -0,0 +1,155 @@
+import logging
+from django import db
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import models, mercadopago, stock
+
+logger = logging.getLogger(__name__)
+
+STALE_NOTIFICATION_DELAY = timezone.timedelta(minutes=5)
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+
+def set_notification_status(notification_id, status, from_statuses, **fields):
+    return models.PaymentNotification.objects.filter(
+        id=notification_id,
+        status__in=from_statuses,
+    ).update(status=status, modified_at=timezone.now(), **fields) > 0
+
+
+def record_notification(topic, resource_id):
+    # repeated notifications are coalesced while one is still waiting to be processed, only the
+    # ones that make it pending again need to be dispatched
+    updated = models.PaymentNotification.objects \
+        .filter(topic=topic, resource_id=resource_id) \
+        .exclude(status=models.PaymentNotification.STATUS.PENDING) \
+        .update(
+            status=models.PaymentNotification.STATUS.PENDING,
+            attempts=0,
+            modified_at=timezone.now(),
+        )
+
+    if updated:
+        return models.PaymentNotification.objects.get(topic=topic, resource_id=resource_id)
+
+    try:
+        with transaction.atomic():
+            return models.PaymentNotification.objects.create(topic=topic, resource_id=resource_id)
+    except db.IntegrityError:
+        return None
+
+
+def mark_order_paid(order_id, external_id):
+    with transaction.atomic():
+        # concurrent notifications for the same order wait here, so only one of them pays it
+        order = models.Order.objects.select_for_update().get(id=order_id)
+
+        if order.status == models.Order.STATUS.CANCELLED:
+            return pay_cancelled_order(order, external_id)
+
+        if order.status != models.Order.STATUS.IN_PROCESS:
+            return False
+
+        order.status = models.Order.STATUS.PAID
+        order.external_id = external_id
+        order.save()
+        stock.confirm_order(order)
+
+    return True
+
+
+def pay_cancelled_order(order, external_id):
+    # the payment was approved after the reservation expired and its stock was released, so the
+    # order is only paid if the stock can still be taken, otherwise the money has to be returned
+    order.external_id = external_id
+
+    try:
+        stock.reserve_order(order)
+    except stock.InsufficientStock as error:
+        order.status = models.Order.STATUS.REFUND_PENDING
+        order.save()
+        logger.error(
+            'Order %s was paid after its reservation expired and item %s is out of stock, '
+            'the payment %s has to be refunded',
+            order.id,
+            error.item_id,
+            external_id,
+        )
+
+        return False
+
+    order.status = models.Order.STATUS.PAID
+    order.save()
+    stock.confirm_order(order)
+
+    return True
+
+
+def process_notification(notification_id):
+    if not set_notification_status(
+        notification_id,
+        models.PaymentNotification.STATUS.PROCESSING,
+        [models.PaymentNotification.STATUS.PENDING],
+        attempts=F('attempts') + 1,
+    ):
+        return None
+
+    notification = models.PaymentNotification.objects.get(id=notification_id)
+    paid_order_id = None
+
+    try:
+        order_response = mercadopago.get_merchant_order(notification.resource_id)
+
+        if order_response['order_status'] == mercadopago.OrderStatus.PAID.value:
+            order_id = int(order_response['external_reference'])
+
+            if mark_order_paid(order_id, order_response['id']):
+                paid_order_id = order_id
+    except Exception:
+        set_notification_status(
+            notification_id,
+            models.PaymentNotification.STATUS.FAILED,
+            [models.PaymentNotification.STATUS.PROCESSING],
+        )
+        raise
+
+    # a notification received while this one was being processed left it pending again
+    set_notification_status(
+        notification_id,
+        models.PaymentNotification.STATUS.PROCESSED,
+        [models.PaymentNotification.STATUS.PROCESSING],
+    )
+
+    return paid_order_id
+
+
+def get_stale_notification_ids(now=None):
+    now = now if now is not None else timezone.now()
+
+    return list(
+        models.PaymentNotification.objects.filter(
+            status__in=[
+                models.PaymentNotification.STATUS.PENDING,
+                models.PaymentNotification.STATUS.PROCESSING,
+                models.PaymentNotification.STATUS.FAILED,
+            ],
+            modified_at__lte=now - STALE_NOTIFICATION_DELAY,
+            # notifications that keep failing, e.g. for an order that doesn't exist, are given up
+            # on until Mercado Pago notifies them again
+            attempts__lt=NOTIFICATION_MAX_ATTEMPTS,
+        ).values_list('id', flat=True),
+    )
+
+
+def retry_notification(notification_id):
+    return set_notification_status(
+        notification_id,
+        models.PaymentNotification.STATUS.PENDING,
+        [
+            models.PaymentNotification.STATUS.PENDING,
+            models.PaymentNotification.STATUS.PROCESSING,
+            models.PaymentNotification.STATUS.FAILED,
+        ],
+    )
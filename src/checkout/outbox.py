@@ -0,0 +1,94 @@
+import weakref
+from django.core import exceptions
+from django.db import transaction
+
+from . import models, queues, signals
+
+
+def load_order_paid(payload):
+    return {'order': models.Order.objects.get(id=payload['order_id'])}
+
+
+# signal, sender and the arguments it's sent with for every event
+EVENTS = {
+    models.OutboxEvent.NAMES.ORDER_PAID: (signals.order_paid, models.Order, load_order_paid),
+}
+
+event_queue = queues.Queue(
+    models.OutboxEvent,
+    models.OutboxEvent.STATUS.PROCESSING,
+    'available_at',
+)
+
+
+def get_receivers(signal, sender):
+    receivers = []
+
+    # receivers are told apart by their dispatch_uid, the only key that's the same in every
+    # process and for receivers sharing a name, e.g. lambdas or closures
+    for (receiver_key, sender_key), receiver in signal.receivers:
+        if sender_key not in (id(sender), id(None)):
+            continue
+
+        if not isinstance(receiver_key, str):
+            raise exceptions.ImproperlyConfigured(
+                f'{receiver} must be connected to {signal} with a dispatch_uid',
+            )
+
+        if isinstance(receiver, weakref.ReferenceType):
+            receiver = receiver()
+
+        if receiver is not None:
+            receivers.append((receiver_key, receiver))
+
+    return receivers
+
+
+def deliver_event(event):
+    # only the receivers that didn't get the event yet are sent its signal
+    signal, sender, load = EVENTS[event.name]
+    kwargs = load(event.payload)
+    delivered_receivers = list(event.delivered_receivers)
+    error = None
+
+    for receiver_key, receiver in get_receivers(signal, sender):
+        if receiver_key in delivered_receivers:
+            continue
+
+        # the receiver's writes and its delivery are committed together, so a receiver that
+        # only writes to the database gets each event exactly once
+        try:
+            with transaction.atomic():
+                receiver(signal=signal, sender=sender, **kwargs)
+                models.OutboxEvent.objects.filter(id=event.id).update(
+                    delivered_receivers=delivered_receivers + [receiver_key],
+                )
+        except Exception as receiver_error:
+            error = receiver_error
+        else:
+            delivered_receivers.append(receiver_key)
+
+    return error
+
+
+def set_event_result(event, error):
+    if error is None:
+        event_queue.update(event, status=models.OutboxEvent.STATUS.PROCESSED, error='')
+    else:
+        event_queue.set_failed(event, error)
+
+
+def dispatch_events(batch_size=None):
+    events = list(event_queue.claim(batch_size))
+    delivered = 0
+
+    for event in events:
+        try:
+            error = deliver_event(event)
+        except Exception as event_error:
+            error = event_error
+
+        set_event_result(event, error)
+        delivered += error is None
+
+    return delivered, len(events)
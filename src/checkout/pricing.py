@@ -0,0 +1,158 @@
+import collections
+from django.db import models as django_models
+from djmoney import money
+
+from . import utils
+
+OrderTotals = collections.namedtuple(
+    'OrderTotals',
+    ['base_total', 'discount', 'total', 'order_items'],
+)
+OrderItemTotals = collections.namedtuple('OrderItemTotals', ['base_total', 'discount', 'total'])
+
+
+def zero():
+    return money.Money(0, 'ARS')
+
+
+def quantize_money(value):
+    return money.Money(utils.quantize_decimal(value.amount), value.currency)
+
+
+def bulk_update_money(instances, field_names):
+    # djmoney's managers can't expand Money values inside bulk_update's CASE expressions, so
+    # the amounts are written through a plain queryset instead
+    if not instances:
+        return
+
+    model = type(instances[0])
+    queryset = django_models.QuerySet(model).filter(pk__in=[instance.pk for instance in instances])
+    queryset.update(**{
+        field_name: django_models.Case(
+            *(
+                django_models.When(
+                    pk=instance.pk,
+                    then=django_models.Value(getattr(instance, field_name).amount),
+                ) for instance in instances
+            ),
+            output_field=model._meta.get_field(field_name),
+        ) for field_name in field_names
+    })
+
+
+def get_discount_codes_item_ids(discount_codes):
+    discount_codes = {
+        discount_code.id: discount_code
+        for discount_code in discount_codes
+        if discount_code.type == discount_code.TYPES.ITEM
+    }
+    item_ids = {discount_code_id: set() for discount_code_id in discount_codes}
+
+    if discount_codes:
+        DiscountCodeItem = next(iter(discount_codes.values())).items.through
+        rows = DiscountCodeItem.objects.filter(
+            discountcode_id__in=discount_codes.keys(),
+        ).values_list('discountcode_id', 'item_id')
+
+        for discount_code_id, item_id in rows:
+            item_ids[discount_code_id].add(item_id)
+
+    return item_ids
+
+
+def calculate_order_item_totals(order_item, discount_code=None, discount_item_ids=()):
+    base_total = order_item.price * order_item.amount
+    discount = zero()
+
+    if discount_code is not None and discount_code.type == discount_code.TYPES.ITEM and \
+            order_item.item_id in discount_item_ids:
+        discount = discount_code.calculate_discount(base_total)
+
+    return OrderItemTotals(base_total, discount, base_total - discount)
+
+
+def get_orders_order_items(orders, known_order_items=()):
+    known_order_items = {order_item.id: order_item for order_item in known_order_items}
+    order_items = {}
+    pending_orders = []
+
+    for order in orders:
+        if 'order_items' in getattr(order, '_prefetched_objects_cache', {}):
+            order_items[order.id] = list(order.order_items.all())
+        else:
+            order_items[order.id] = []
+            pending_orders.append(order)
+
+    if pending_orders:
+        OrderItem = pending_orders[0].order_items.model
+
+        for order_item in OrderItem.objects.filter(order__in=pending_orders).order_by('id'):
+            order_item = known_order_items.get(order_item.id, order_item)
+            order_items[order_item.order_id].append(order_item)
+
+    return order_items
+
+
+def calculate_totals(order_items, discount_code=None, discount_item_ids=()):
+    order_items = {
+        order_item.id: calculate_order_item_totals(
+            order_item,
+            discount_code=discount_code,
+            discount_item_ids=discount_item_ids,
+        ) for order_item in order_items
+    }
+    base_total = sum((line.base_total for line in order_items.values()), zero())
+
+    if discount_code is None:
+        discount = zero()
+    elif discount_code.type == discount_code.TYPES.ORDER:
+        discount = discount_code.calculate_discount(base_total)
+    else:
+        discount = sum((line.discount for line in order_items.values()), zero())
+
+    return OrderTotals(base_total, discount, base_total - discount, order_items)
+
+
+def calculate_orders_totals(orders, orders_order_items=None):
+    orders = list(orders)
+
+    if orders_order_items is None:
+        orders_order_items = get_orders_order_items(orders)
+
+    discount_codes = [order.discount_code for order in orders if order.discount_code is not None]
+    discount_codes_item_ids = get_discount_codes_item_ids(discount_codes)
+
+    return {
+        order.id: calculate_totals(
+            orders_order_items[order.id],
+            discount_code=order.discount_code,
+            discount_item_ids=discount_codes_item_ids.get(order.discount_code_id, ()),
+        ) for order in orders
+    }
+
+
+def calculate_order_totals(order):
+    return calculate_orders_totals([order])[order.id]
+
+
+def update_orders_totals(orders, known_order_items=()):
+    orders = list(orders)
+    orders_order_items = get_orders_order_items(orders, known_order_items=known_order_items)
+    orders_totals = calculate_orders_totals(orders, orders_order_items=orders_order_items)
+    updated_order_items = []
+
+    for order in orders:
+        totals = orders_totals[order.id]
+        order.base_total = quantize_money(totals.base_total)
+        order.total = quantize_money(totals.total)
+        # taken from the rounded amounts so they always add up, e.g. on the invoice
+        order.discount_total = order.base_total - order.total
+
+        for order_item in orders_order_items[order.id]:
+            order_item.total = quantize_money(totals.order_items[order_item.id].total)
+            updated_order_items.append(order_item)
+
+    bulk_update_money(orders, ['base_total', 'discount_total', 'total'])
+    bulk_update_money(updated_order_items, ['total'])
+
+    return orders_totals
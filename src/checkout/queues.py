@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timezone.timedelta(minutes=1)
+CLAIM_TIMEOUT = timezone.timedelta(minutes=10)
+
+
+class Queue:
+    # a table of rows worked through in batches by concurrent workers, each row is claimed,
+    # processed and then either done, retried later or failed for good
+    def __init__(
+        self,
+        model,
+        claimed_status,
+        available_field,
+        batch_size=BATCH_SIZE,
+        max_attempts=MAX_ATTEMPTS,
+        retry_delay=RETRY_DELAY,
+        claim_timeout=CLAIM_TIMEOUT,
+    ):
+        self.model = model
+        self.claimed_status = claimed_status
+        self.available_field = available_field
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_timeout = claim_timeout
+
+    def claim(self, batch_size=None):
+        now = timezone.now()
+
+        with transaction.atomic():
+            # rows left claimed by a worker that died are picked up again after a while, unless
+            # they used all their attempts, as they may be what keeps killing the worker
+            ids = list(
+                self.model.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(
+                        status=self.model.STATUS.PENDING,
+                        **{f'{self.available_field}__lte': now},
+                    ) |
+                    Q(
+                        status=self.claimed_status,
+                        modified_at__lt=now - self.claim_timeout,
+                        attempts__lt=self.max_attempts,
+                    ),
+                )
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size or self.batch_size],
+            )
+            self.model.objects.filter(id__in=ids).update(
+                status=self.claimed_status,
+                attempts=F('attempts') + 1,
+                modified_at=now,
+            )
+
+        return self.model.objects.filter(id__in=ids).order_by('id')
+
+    def update(self, row, **fields):
+        self.model.objects.filter(id=row.id).update(modified_at=timezone.now(), **fields)
+
+    def set_failed(self, row, error, retry=True):
+        now = timezone.now()
+
+        if retry and row.attempts < self.max_attempts:
+            self.update(
+                row,
+                status=self.model.STATUS.PENDING,
+                error=repr(error),
+                **{self.available_field: now + self.retry_delay * 2 ** (row.attempts - 1)},
+            )
+        else:
+            self.update(row, status=self.model.STATUS.FAILED, error=repr(error))
+
+    def drain(self, process_batch):
+        processed = 0
+
+        # a batch shorter than the batch size means there's nothing left to claim
+        while True:
+            batch_processed, attempted = process_batch(batch_size=self.batch_size)
+            processed += batch_processed
+
+            if attempted < self.batch_size:
+                return processed
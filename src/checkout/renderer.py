@@ -0,0 +1,67 @@
+import functools
+import multiprocessing
+import os
+import django
+import weasyprint
+from concurrent import futures
+from django.conf import settings
+from django.template import loader
+from weasyprint import fonts
+
+from . import barcodes
+
+INVOICE_TEMPLATE = 'invoice.html'
+INVOICE_STYLESHEET = os.path.join(os.path.dirname(__file__), 'assets', 'invoice.css')
+
+
+@functools.lru_cache(maxsize=None)
+def get_font_config():
+    return fonts.FontConfiguration()
+
+
+@functools.lru_cache(maxsize=None)
+def get_stylesheets():
+    # the fonts are bundled next to the stylesheet, so loading them needs no network
+    return [weasyprint.CSS(filename=INVOICE_STYLESHEET, font_config=get_font_config())]
+
+
+def warm_up():
+    django.setup()
+    get_stylesheets()
+
+
+def fetch_url(url):
+    barcode = barcodes.parse_url(url)
+
+    if barcode is not None:
+        return {'string': barcodes.render_svg(barcode), 'mime_type': 'image/svg+xml'}
+
+    return weasyprint.default_url_fetcher(url)
+
+
+def render_invoice(invoice_data):
+    invoice_html = loader.render_to_string(INVOICE_TEMPLATE, context=invoice_data)
+
+    return weasyprint.HTML(string=invoice_html, url_fetcher=fetch_url).write_pdf(
+        stylesheets=get_stylesheets(),
+        font_config=get_font_config(),
+    )
+
+
+def build_pool(workers):
+    # spawned instead of forked so the workers don't inherit the database connections
+    return futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=warm_up,
+    )
+
+
+def render_invoices(invoices_data, workers=None):
+    workers = settings.INVOICE_RENDER_WORKERS if workers is None else workers
+
+    if workers <= 1 or len(invoices_data) <= 1:
+        return [render_invoice(invoice_data) for invoice_data in invoices_data]
+
+    with build_pool(min(workers, len(invoices_data))) as pool:
+        return list(pool.map(render_invoice, invoices_data))
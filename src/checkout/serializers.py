@@ -1,10 +1,10 @@
 import json
+import collections
 from django.core import validators as django_validators
 from django.contrib import auth
 from django.utils.translation import gettext_lazy as _
 from rest_framework import validators
 from rest_framework_json_api import serializers, relations
-from djmoney.contrib import django_rest_framework as djmoney_serializers
 import model_utils
 
 from . import models, mercadopago
@@ -57,13 +57,15 @@ class ItemOptionSerializer(serializers.ModelSerializer):
 
 
 class ItemSerializer(serializers.ModelSerializer):
+    stock = serializers.IntegerField(source='get_available_stock', read_only=True)
+
     included_serializers = {
         'options': ItemOptionSerializer,
     }
 
     class Meta:
         model = models.Item
-        fields = ('id', 'name', 'image', 'type', 'price', 'options')
+        fields = ('id', 'name', 'image', 'type', 'price', 'stock', 'options')
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -105,7 +107,7 @@ class OrderItemOptionSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         try:
-            models.OrderItemOption(**data).clean()
+            data['item_option'].validate_value(data['value'])
         except django_validators.ValidationError as validation_error:
             raise serializers.ValidationError(validation_error.message_dict)
 
@@ -113,7 +115,6 @@ class OrderItemOptionSerializer(serializers.ModelSerializer):
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    total = djmoney_serializers.MoneyField(14, 2, source='calculate_total', read_only=True)
     options = WritableResourceRelatedField(
         write_serializer=OrderItemOptionSerializer(),
         queryset=models.OrderItemOption.objects.none(),
@@ -129,7 +130,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.OrderItem
         fields = ('id', 'item', 'amount', 'price', 'options', 'total')
-        read_only_fields = ('price',)
+        read_only_fields = ('price', 'total')
 
 
 class BackUrlsSerializer(serializers.Serializer):
@@ -139,7 +140,6 @@ class BackUrlsSerializer(serializers.Serializer):
 
 
 class OrderSerializer(serializers.ModelSerializer):
-    total = djmoney_serializers.MoneyField(14, 2, source='calculate_total', read_only=True)
     order_items = WritableResourceRelatedField(
         write_serializer=OrderItemSerializer(),
         queryset=models.OrderItem.objects.none(),
@@ -165,7 +165,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'preference_id',
             'total',
         )
-        read_only_fields = ('customer', 'status', 'preference_id')
+        read_only_fields = ('customer', 'status', 'preference_id', 'total')
 
     def validate_order_items(self, order_items):
         if len(order_items) == 0:
@@ -175,29 +175,59 @@ class OrderSerializer(serializers.ModelSerializer):
         ):
             raise serializers.ValidationError(_('Any order should include at least one pass'))
 
-        for order_item in order_items:
-            item_options = set(order_item['item'].options.values_list('id', flat=True))
+        items_options = collections.defaultdict(set)
+        items_options_rows = models.ItemOption.objects.filter(
+            item_id__in=set(order_item['item'].id for order_item in order_items),
+        ).values_list('item_id', 'id')
+
+        for item_id, item_option_id in items_options_rows:
+            items_options[item_id].add(item_option_id)
+
+        errors = []
+
+        for index, order_item in enumerate(order_items):
             received_options = set(
                 order_item_option['item_option'].id
                 for order_item_option in order_item.get('options', [])
             )
 
-            if item_options != received_options:
-                raise serializers.ValidationError(_('You must include all item options'))
+            if items_options[order_item['item'].id] != received_options:
+                errors.append(
+                    _('You must include all item options (order item %(index)s)') % {
+                        'index': index,
+                    },
+                )
+
+        if errors:
+            raise serializers.ValidationError(errors)
 
         return order_items
 
     def create(self, validated_data):
-        order_items = validated_data.pop('order_items')
+        order_items_data = validated_data.pop('order_items')
         validated_data.pop('back_urls', None)
         order = models.Order.objects.create(**validated_data)
 
-        for order_item_data in order_items:
-            options = order_item_data.pop('options', [])
-            order_item = order.order_items.create(**order_item_data)
+        order_items = []
+        order_items_options = []
 
-            for option_data in options:
-                order_item.options.create(**option_data)
+        for order_item_data in order_items_data:
+            options = order_item_data.pop('options', [])
+            order_item = models.OrderItem(
+                order=order,
+                price=order_item_data['item'].price,
+                **order_item_data,
+            )
+            order_items.append(order_item)
+            order_items_options.append(options)
+
+        models.OrderItem.objects.bulk_create(order_items)
+        models.OrderItemOption.objects.bulk_create([
+            models.OrderItemOption(order_item=order_item, **option_data)
+            for order_item, options in zip(order_items, order_items_options)
+            for option_data in options
+        ])
+        order.update_totals(order_items=order_items)
 
         return order
 
@@ -0,0 +1,194 @@
+import collections
+from django.db import models as django_models, transaction
+from django.db.models import F, functions
+from django.utils import timezone
+
+from . import catalog, models
+
+RESERVATION_TTL = timezone.timedelta(minutes=30)
+RESERVABLE_ORDER_STATUSES = [models.Order.STATUS.CREATED, models.Order.STATUS.IN_PROCESS]
+
+
+class InsufficientStock(Exception):
+    def __init__(self, item_id):
+        self.item_id = item_id
+        super().__init__(f'Not enough stock for item {item_id}')
+
+
+def get_reservation_expiration(order):
+    return order.created_at + RESERVATION_TTL
+
+
+def get_order_amounts(order):
+    amounts = collections.Counter()
+
+    for order_item in order.order_items.all():
+        amounts[order_item.item_id] += order_item.amount
+
+    return amounts
+
+
+def annotate_available_stock(queryset):
+    shards_stock = models.ItemStockShard.objects \
+        .filter(item=django_models.OuterRef('pk')) \
+        .order_by() \
+        .values('item') \
+        .annotate(stock=django_models.Sum('stock')) \
+        .values('stock')
+
+    return queryset.annotate(shards_stock=functions.Coalesce(
+        django_models.Subquery(shards_stock, output_field=django_models.PositiveIntegerField()),
+        0,
+    ))
+
+
+def decrement_shards_stock(item_id, amount, skip_locked=True):
+    shards = models.ItemStockShard.objects.filter(item_id=item_id, stock__gt=0)
+
+    if skip_locked:
+        # shards being used by other buyers are skipped instead of waited on, so buyers of a
+        # hot item spread across its shards rather than queueing behind a single row
+        queryset = shards.select_for_update(skip_locked=True).order_by('?')
+        shards = iter(queryset.first, None)
+    else:
+        shards = shards.select_for_update().order_by('id')
+
+    for shard in shards:
+        taken = min(shard.stock, amount)
+        models.ItemStockShard.objects.filter(id=shard.id).update(stock=F('stock') - taken)
+        amount -= taken
+
+        if amount == 0:
+            break
+
+    return amount
+
+
+def decrement_item_stock(item_id, amount, skip_locked=True):
+    amount = decrement_shards_stock(item_id, amount, skip_locked=skip_locked)
+
+    if amount == 0:
+        return True
+
+    # a single conditional UPDATE both checks and takes the stock, so concurrent buyers can
+    # never take more than what's left
+    return models.Item.objects.filter(id=item_id, stock__gte=amount).update(
+        stock=F('stock') - amount,
+    ) > 0
+
+
+def decrement_stock(item_id, amount):
+    # the stock may still be there in shards held by other buyers, so a failed attempt is rolled
+    # back to free the shards it took and retried waiting on all of them in order
+    for skip_locked in (True, False):
+        try:
+            with transaction.atomic():
+                if decrement_item_stock(item_id, amount, skip_locked=skip_locked):
+                    return True
+
+                raise InsufficientStock(item_id)
+        except InsufficientStock:
+            pass
+
+    return False
+
+
+def increment_stock(item_id, amount):
+    shard_id = models.ItemStockShard.objects \
+        .filter(item_id=item_id) \
+        .order_by('?') \
+        .values_list('id', flat=True) \
+        .first()
+
+    if shard_id is not None:
+        models.ItemStockShard.objects.filter(id=shard_id).update(stock=F('stock') + amount)
+    else:
+        models.Item.objects.filter(id=item_id).update(stock=F('stock') + amount)
+
+
+@transaction.atomic
+def rebalance_item_stock(item_id, shards):
+    # shards are locked before the item, the same order reservations take them in
+    item_shards = list(
+        models.ItemStockShard.objects.select_for_update().filter(item_id=item_id).order_by('id'),
+    )
+    item = models.Item.objects.select_for_update().get(id=item_id)
+    total = item.stock + sum(shard.stock for shard in item_shards)
+
+    for shard in item_shards[shards:]:
+        shard.delete()
+
+    item_shards = item_shards[:shards] + [
+        models.ItemStockShard(item=item) for i in range(shards - len(item_shards))
+    ]
+    shard_stock, remainder = divmod(total, shards) if shards else (0, total)
+
+    for index, shard in enumerate(item_shards):
+        shard.stock = shard_stock + (1 if index < remainder else 0)
+        shard.save()
+
+    item.stock = total if not shards else 0
+    item.save(update_fields=['stock'])
+    catalog.invalidate()
+
+    return total
+
+
+@transaction.atomic
+def reserve_order(order):
+    amounts = get_order_amounts(order)
+    expires_at = get_reservation_expiration(order)
+
+    # items are always updated in the same order to avoid deadlocks between orders sharing them
+    for item_id in sorted(amounts):
+        if not decrement_stock(item_id, amounts[item_id]):
+            raise InsufficientStock(item_id)
+
+    return models.StockReservation.objects.bulk_create([
+        models.StockReservation(
+            order=order,
+            item_id=item_id,
+            amount=amount,
+            expires_at=expires_at,
+        ) for item_id, amount in sorted(amounts.items())
+    ])
+
+
+def confirm_order(order):
+    return models.StockReservation.objects.filter(
+        order=order,
+        status=models.StockReservation.STATUS.RESERVED,
+    ).update(status=models.StockReservation.STATUS.CONFIRMED)
+
+
+@transaction.atomic
+def release_expired_reservations(now=None):
+    now = now if now is not None else timezone.now()
+    expired_reservations = models.StockReservation.objects.filter(
+        status=models.StockReservation.STATUS.RESERVED,
+        expires_at__lte=now,
+    )
+    # orders are locked first, like notifications.mark_order_paid does, so a payment being
+    # confirmed for one of them is never released
+    orders = list(
+        models.Order.objects
+        .select_for_update(skip_locked=True)
+        .filter(
+            status__in=RESERVABLE_ORDER_STATUSES,
+            id__in=expired_reservations.values('order_id'),
+        )
+        .values_list('id', flat=True),
+    )
+    reservations = expired_reservations.filter(order_id__in=orders)
+    amounts = collections.Counter()
+
+    for item_id, amount in reservations.values_list('item_id', 'amount'):
+        amounts[item_id] += amount
+
+    for item_id in sorted(amounts):
+        increment_stock(item_id, amounts[item_id])
+
+    reservations.update(status=models.StockReservation.STATUS.RELEASED)
+    models.Order.objects.filter(id__in=orders).update(status=models.Order.STATUS.CANCELLED)
+
+    return len(orders)
@@ -1,40 +1,218 @@
-import io
-import weasyprint
-import templated_email
+import logging
+from concurrent import futures
 from django.conf import settings
 from django.core import files
-from django.template import loader
+from django.db import transaction
+from django.db.models import signals
+from django.utils import timezone
 from zappa import asynchronous
 
-from . import models, afip
+from . import models, afip, emails, stock, mercadopago, notifications, outbox, renderer
+
+logger = logging.getLogger(__name__)
+
+INVOICE_DELIVERY_TIMEOUT = timezone.timedelta(minutes=10)
+
+
+def send_pending_emails(event=None, context=None):
+    # a single sender at a time keeps EMAIL_SEND_RATE below the account's rate, the emails
+    # queued while another one drains are picked up by it or by the next scheduled run
+    with emails.sender_lock() as acquired:
+        if acquired:
+            emails.email_queue.drain(emails.send_queued_emails)
 
 
 @asynchronous.task
-def generate_invoice(order_id):
-    order = models.Order.objects.get(id=order_id)
-    invoice_data = afip.generate_invoice(order)
+def send_emails():
+    send_pending_emails()
+
+
+def dispatch_pending_events(event=None, context=None):
+    delivered = outbox.event_queue.drain(outbox.dispatch_events)
+
+    # e.g. the passes queued when an order is paid
+    if delivered:
+        send_emails()
+
+
+@asynchronous.task
+def dispatch_events():
+    dispatch_pending_events()
+
+
+def schedule_events_dispatch(sender, created=False, **kwargs):
+    if created:
+        transaction.on_commit(dispatch_events)
+
+
+@asynchronous.task
+def generate_order_preference(order_id, notification_url=None, back_urls=None):
+    order = models.Order.objects.select_related('customer__user').get(id=order_id)
+    mercadopago.generate_order_preference(
+        order,
+        notification_url=notification_url,
+        back_urls=back_urls,
+    )
+
+
+def upload_invoice(invoice, invoice_pdf):
+    invoice.file.save(f'{invoice.number}.pdf', files.base.ContentFile(invoice_pdf), save=False)
+
+
+def send_invoice(invoice, invoice_pdf):
+    order = invoice.order
+
+    # the email is only queued together with the stored file, so an invoice whose upload failed
+    # is delivered again without its customer getting it twice
+    with transaction.atomic():
+        # the email is queued with the rendered bytes while the upload runs, so it doesn't wait
+        # for it nor downloads the file back from the storage
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            upload = executor.submit(upload_invoice, invoice, invoice_pdf)
+            emails.queue_email(
+                'order_paid',
+                order.customer.user.email,
+                {
+                    'order': order,
+                },
+                attachments=[('factura.pdf', invoice_pdf, 'application/pdf')],
+            )
+            upload.result()
+
+        invoice.data = None
+        invoice.save(update_fields=['file', 'data'])
 
-    invoice_html = loader.render_to_string('invoice.html', context=invoice_data)
-    invoice_pdf = io.BytesIO()
-    invoice_pdf_font_config = weasyprint.fonts.FontConfiguration()
-    invoice_pdf_writer = weasyprint.HTML(string=invoice_html)
-    invoice_pdf_writer.write_pdf(invoice_pdf, font_config=invoice_pdf_font_config)
 
-    invoice = models.Invoice.objects.create(
+def create_invoice(order, invoice_data):
+    return models.Invoice.objects.create(
         order=order,
         number=invoice_data['invoice_number'],
         cae=invoice_data['invoice_cae'],
-        file=files.File(invoice_pdf, f'{invoice_data["invoice_number"]}.pdf'),
+        data=afip.serialize_invoice(invoice_data),
     )
 
-    templated_email.send_templated_mail(
-        template_name='order_paid',
-        from_email=settings.DEFAULT_EMAIL,
-        recipient_list=[order.customer.user.email],
-        attachments=[
-            ('factura.pdf', invoice.file.read(), 'application/pdf'),
-        ],
-        context={
-            'order': order,
-        },
-    )
+
+@asynchronous.task
+def deliver_invoice(invoice_id):
+    invoice = models.Invoice.objects.select_related('order__customer__user').get(id=invoice_id)
+    send_invoice(invoice, renderer.render_invoice(afip.deserialize_invoice(invoice.data)))
+    send_emails()
+
+
+@asynchronous.task
+def generate_invoice(order_id):
+    # the invoice is stored with its CAE before the lock is released, so an order is never
+    # invoiced twice by concurrent tasks or batches
+    with transaction.atomic():
+        order = models.Order.objects.select_for_update().get(id=order_id)
+
+        if models.Invoice.objects.filter(order=order).exists():
+            return
+
+        invoice_data = afip.generate_invoice(order)
+        invoice = create_invoice(order, invoice_data)
+
+    send_invoice(invoice, renderer.render_invoice(invoice_data))
+    send_emails()
+
+
+def generate_invoices(batch_size=afip.INVOICE_BATCH_SIZE):
+    with transaction.atomic():
+        orders = list(
+            models.Order.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(status=models.Order.STATUS.PAID, invoice__isnull=True)
+            .select_related('customer__user')
+            .order_by('id')[:batch_size],
+        )
+
+        if not orders:
+            return 0, 0
+
+        invoices_data = afip.generate_invoices(orders)
+        invoices = [
+            create_invoice(order, invoices_data[order.id])
+            for order in orders if order.id in invoices_data
+        ]
+
+    if settings.INVOICE_RENDER_WORKERS > 1:
+        invoices_pdfs = renderer.render_invoices(
+            [invoices_data[invoice.order_id] for invoice in invoices],
+        )
+
+        for invoice, invoice_pdf in zip(invoices, invoices_pdfs):
+            send_invoice(invoice, invoice_pdf)
+
+        send_emails()
+    else:
+        # without a process pool, e.g. on Lambda, each invoice is rendered by its own task
+        for invoice in invoices:
+            deliver_invoice(invoice.id)
+
+    return len(invoices), len(orders)
+
+
+def deliver_undelivered_invoices(batch_size=afip.INVOICE_BATCH_SIZE, now=None):
+    now = now if now is not None else timezone.now()
+    delivered = 0
+
+    # invoices are stored before they're rendered, so the ones whose rendering, upload or email
+    # failed are left without a file and delivered again once they had enough time to finish
+    with transaction.atomic():
+        invoices = list(
+            models.Invoice.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(
+                file='',
+                data__isnull=False,
+                created_at__lte=now - INVOICE_DELIVERY_TIMEOUT,
+            )
+            .select_related('order__customer__user')
+            .order_by('id')[:batch_size],
+        )
+
+        for invoice in invoices:
+            try:
+                send_invoice(
+                    invoice,
+                    renderer.render_invoice(afip.deserialize_invoice(invoice.data)),
+                )
+            except Exception:
+                logger.exception('Could not deliver invoice %s', invoice.id)
+            else:
+                delivered += 1
+
+    if delivered:
+        send_emails()
+
+    return delivered
+
+
+def generate_pending_invoices(event=None, context=None):
+    generate_invoices()
+    deliver_undelivered_invoices()
+
+
+@asynchronous.task
+def process_notification(notification_id):
+    paid_order_id = notifications.process_notification(notification_id)
+
+    if paid_order_id is not None and not settings.AFIP_BATCH_INVOICES:
+        generate_invoice(paid_order_id)
+
+
+def process_stale_notifications(event=None, context=None):
+    for notification_id in notifications.get_stale_notification_ids():
+        if notifications.retry_notification(notification_id):
+            process_notification(notification_id)
+
+
+def release_expired_stock_reservations(event=None, context=None):
+    stock.release_expired_reservations()
+
+
+signals.post_save.connect(
+    schedule_events_dispatch,
+    sender=models.OutboxEvent,
+    dispatch_uid='outbox_event_save',
+)
@@ -1,11 +1,15 @@
+import io
+import time
 import faker
 import freezegun
 from unittest import mock
 from django import test
+from django.conf import settings
+from django.core import mail, management
 from django.utils import timezone
 from django.core.cache import caches
 
-from .. import factories, afip
+from .. import factories, models, afip, tasks
 from . import utils
 
 fake = faker.Faker()
@@ -19,11 +23,21 @@ fake = faker.Faker()
     AFIP_CUIT='12345',
 )
 class AfipGetClientTestCase(test.TestCase):
+    def setUp(self):
+        afip.clear_credentials()
+        afip.clear_client()
+
+    def build_expiration(self):
+        return timezone.make_aware(fake.date_time_between(
+            start_date=timezone.now() + timezone.timedelta(hours=1),
+            end_date=timezone.now() + timezone.timedelta(days=1),
+        )).strftime(afip.EXPIRATION_DATE_FORMAT)
+
     def test_should_store_token_and_sign_in_cache(self, wsaa, wsfev1):
         # arrange
         token = fake.lexify(text='?????????')
         sign = fake.lexify(text='?????????')
-        expiration = fake.date_time_between(start_date='now').strftime(afip.EXPIRATION_DATE_FORMAT)
+        expiration = self.build_expiration()
         wsaa.WSAA.return_value.Token = token
         wsaa.WSAA.return_value.Sign = sign
         wsaa.WSAA.return_value.ObtenerTagXml.return_value = expiration
@@ -68,9 +82,7 @@ class AfipGetClientTestCase(test.TestCase):
 
         new_token = fake.lexify(text='?????????')
         new_sign = fake.lexify(text='?????????')
-        new_expiration = fake.date_time_between(
-            start_date='now',
-        ).strftime(afip.EXPIRATION_DATE_FORMAT)
+        new_expiration = self.build_expiration()
         wsaa.WSAA.return_value.Token = new_token
         wsaa.WSAA.return_value.Sign = new_sign
         wsaa.WSAA.return_value.ObtenerTagXml.return_value = new_expiration
@@ -85,6 +97,114 @@ class AfipGetClientTestCase(test.TestCase):
         self.assertEqual(caches['afip'].get(afip.SIGN_CACHE_KEY), new_sign)
         self.assertEqual(caches['afip'].get(afip.EXPIRATION_CACHE_KEY), new_expiration)
 
+    def test_should_keep_token_and_sign_in_memory(self, wsaa, wsfev1):
+        # arrange
+        wsaa.WSAA.return_value.Token = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.Sign = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = self.build_expiration()
+        afip.get_client()
+
+        # act
+        with self.assertNumQueries(0):
+            client = afip.get_client()
+
+        # assert
+        wsaa.WSAA.return_value.LoginCMS.assert_called_once()
+        self.assertEqual(client.Token, wsaa.WSAA.return_value.Token.encode('utf-8'))
+
+    def test_should_refresh_token_and_sign_from_cache_before_expiration(self, wsaa, wsfev1):
+        # arrange
+        expiration = timezone.now() + afip.CREDENTIALS_REFRESH_MARGIN / 2
+        afip._credentials = afip.Credentials('old-token', 'old-sign', expiration)
+        token = fake.lexify(text='?????????')
+        caches['afip'].set(afip.TOKEN_CACHE_KEY, token)
+        caches['afip'].set(afip.SIGN_CACHE_KEY, fake.lexify(text='?????????'))
+        caches['afip'].set(afip.EXPIRATION_CACHE_KEY, self.build_expiration())
+
+        # act
+        client = afip.get_client()
+
+        # assert
+        wsaa.WSAA.return_value.LoginCMS.assert_not_called()
+        self.assertEqual(client.Token, token.encode('utf-8'))
+
+    def test_should_wait_for_other_worker_login(self, wsaa, wsfev1):
+        # arrange
+        token = fake.lexify(text='?????????')
+        caches['afip'].add(afip.LOGIN_LOCK_CACHE_KEY, True)
+
+        def sleep(seconds):
+            caches['afip'].set(afip.TOKEN_CACHE_KEY, token)
+            caches['afip'].set(afip.SIGN_CACHE_KEY, fake.lexify(text='?????????'))
+            caches['afip'].set(afip.EXPIRATION_CACHE_KEY, self.build_expiration())
+
+        # act
+        with mock.patch('checkout.afip.time.sleep', side_effect=sleep) as patched_sleep:
+            client = afip.get_client()
+
+        # assert
+        patched_sleep.assert_called_once()
+        wsaa.WSAA.return_value.LoginCMS.assert_not_called()
+        self.assertEqual(client.Token, token.encode('utf-8'))
+
+
+@mock.patch('checkout.afip.wsfev1')
+@mock.patch('checkout.afip._authenticate', return_value=('TOKEN', 'SIGN'))
+@test.override_settings(AFIP_CUIT='12345')
+class AfipClientConnectionTestCase(test.TestCase):
+    def setUp(self):
+        afip.clear_client()
+
+    def test_should_reuse_connection(self, authenticate, wsfev1):
+        # act
+        for i in range(3):
+            client = afip.get_client()
+
+        # assert
+        wsfev1.WSFEv1.assert_called_once()
+        client.Conectar.assert_called_once_with(cache=settings.AFIP_WSDL_CACHE_DIR)
+        client.Dummy.assert_not_called()
+
+    def test_should_use_rotated_token_and_sign(self, authenticate, wsfev1):
+        # arrange
+        afip.get_client()
+        authenticate.return_value = ('NEW_TOKEN', 'NEW_SIGN')
+
+        # act
+        client = afip.get_client()
+
+        # assert
+        wsfev1.WSFEv1.assert_called_once()
+        self.assertEqual(client.Token, b'NEW_TOKEN')
+        self.assertEqual(client.Sign, b'NEW_SIGN')
+
+    def test_should_keep_connection_if_healthy(self, authenticate, wsfev1):
+        # arrange
+        client = afip.get_client()
+        client.Dummy.return_value = True
+        client.AppServerStatus = 'OK'
+
+        # act
+        with mock.patch('checkout.afip.time.monotonic', return_value=time.monotonic() + 3600):
+            afip.get_client()
+
+        # assert
+        client.Dummy.assert_called_once()
+        wsfev1.WSFEv1.assert_called_once()
+
+    def test_should_reconnect_if_unhealthy(self, authenticate, wsfev1):
+        # arrange
+        client = afip.get_client()
+        client.Dummy.return_value = False
+
+        # act
+        with mock.patch('checkout.afip.time.monotonic', return_value=time.monotonic() + 3600):
+            afip.get_client()
+
+        # assert
+        client.Dummy.assert_called_once()
+        self.assertEqual(wsfev1.WSFEv1.call_count, 2)
+
 
 @mock.patch('checkout.afip.get_client')
 class AfipGenerateInvoiceTestCase(test.TestCase):
@@ -92,6 +212,18 @@ class AfipGenerateInvoiceTestCase(test.TestCase):
     def setUpTestData(cls):
         cls.order = factories.OrderFactory()
 
+    def setUp(self):
+        afip.clear_synced_sequences()
+
+    def build_afip_client(self, last_number):
+        afip_client = mock.MagicMock()
+        afip_client.CompUltimoAutorizado.return_value = last_number
+        afip_client.CAE = 1234
+        afip_client.Vencimiento = '20200309'
+        afip_client.ErrCode = ''
+
+        return afip_client
+
     @freezegun.freeze_time(timezone.now())
     def test_should_create_cae(self, get_client):
         # arrange
@@ -129,3 +261,214 @@ class AfipGenerateInvoiceTestCase(test.TestCase):
         afip_client.CAESolicitar.assert_called_once()
         self.assertEqual(invoice['invoice_number'], invoice_number)
         self.assertEqual(invoice['invoice_cae'], afip_client.CAE)
+
+    def test_should_number_invoices_from_local_sequence(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4)
+        get_client.return_value = afip_client
+
+        # act
+        invoices = [afip.generate_invoice(self.order) for i in range(3)]
+
+        # assert
+        afip_client.CompUltimoAutorizado.assert_called_once_with(
+            afip.INVOICE_TYPE,
+            afip.INVOICE_POINT_OF_SALE,
+        )
+        self.assertEqual([invoice['invoice_number'] for invoice in invoices], [5, 6, 7])
+        self.assertEqual(models.InvoiceSequence.objects.get().last_number, 7)
+
+    def test_should_resync_sequence_after_sequence_error(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4)
+        afip_client.CompUltimoAutorizado.side_effect = [4, 9]
+        get_client.return_value = afip_client
+        error_codes = [afip.SEQUENCE_ERROR_CODE, '']
+
+        def cae_solicitar():
+            afip_client.ErrCode = error_codes.pop(0)
+
+        afip_client.CAESolicitar.side_effect = cae_solicitar
+
+        # act
+        invoice = afip.generate_invoice(self.order)
+
+        # assert
+        self.assertEqual(invoice['invoice_number'], 10)
+        self.assertEqual(
+            [call[1]['cbt_desde'] for call in afip_client.CrearFactura.call_args_list],
+            [5, 10],
+        )
+        self.assertEqual(models.InvoiceSequence.objects.get().last_number, 10)
+
+    def test_should_not_advance_sequence_if_rejected(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4)
+        afip_client.CAE = ''
+        get_client.return_value = afip_client
+
+        # act
+        with self.assertRaises(afip.AfipError):
+            afip.generate_invoice(self.order)
+
+        # assert
+        self.assertFalse(models.InvoiceSequence.objects.filter(last_number=5).exists())
+
+
+@mock.patch('checkout.afip.get_client')
+class AfipGenerateInvoicesTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders = [factories.OrderFactory() for i in range(3)]
+
+    def setUp(self):
+        afip.clear_synced_sequences()
+
+    def build_afip_client(self, last_number, rejected=()):
+        afip_client = mock.MagicMock()
+        afip_client.CompUltimoAutorizado.return_value = last_number
+        afip_client.Vencimiento = '20200309'
+        afip_client.ErrCode = ''
+
+        def leer_factura(index):
+            afip_client.CAE = '' if index in rejected else f'7000{index}'
+
+        afip_client.LeerFacturaX.side_effect = leer_factura
+
+        return afip_client
+
+    def test_should_request_cae_for_all_orders_at_once(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4)
+        get_client.return_value = afip_client
+
+        # act
+        invoices = afip.generate_invoices(self.orders)
+
+        # assert
+        afip_client.CAESolicitarX.assert_called_once()
+        self.assertEqual(
+            [call[1]['cbt_desde'] for call in afip_client.CrearFactura.call_args_list],
+            [5, 6, 7],
+        )
+        self.assertEqual(
+            [(invoices[order.id]['invoice_number'], invoices[order.id]['invoice_cae'])
+             for order in self.orders],
+            [(5, '70000'), (6, '70001'), (7, '70002')],
+        )
+        self.assertEqual(models.InvoiceSequence.objects.get().last_number, 7)
+
+    def test_should_leave_out_rejected_vouchers(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4, rejected=(2,))
+        get_client.return_value = afip_client
+
+        # act
+        invoices = afip.generate_invoices(self.orders)
+
+        # assert
+        self.assertEqual(set(invoices), {order.id for order in self.orders[:2]})
+        self.assertEqual(models.InvoiceSequence.objects.get().last_number, 6)
+
+    def test_should_resync_sequence_after_sequence_error(self, get_client):
+        # arrange
+        afip_client = self.build_afip_client(4)
+        afip_client.CompUltimoAutorizado.side_effect = [4, 9]
+        get_client.return_value = afip_client
+        error_codes = [afip.SEQUENCE_ERROR_CODE, '']
+
+        def cae_solicitar():
+            afip_client.ErrCode = error_codes.pop(0)
+
+        afip_client.CAESolicitarX.side_effect = cae_solicitar
+
+        # act
+        invoices = afip.generate_invoices(self.orders)
+
+        # assert
+        self.assertEqual(
+            sorted(invoice['invoice_number'] for invoice in invoices.values()),
+            [10, 11, 12],
+        )
+        self.assertEqual(models.InvoiceSequence.objects.get().last_number, 12)
+
+    @mock.patch('checkout.renderer.render_invoice', return_value=b'%PDF')
+    def test_should_invoice_paid_orders_without_invoice(self, render_invoice, get_client):
+        # arrange
+        get_client.return_value = self.build_afip_client(4)
+        models.Order.objects.update(status=models.Order.STATUS.PAID)
+        models.Invoice.objects.create(order=self.orders[0], number=1, cae=fake.numerify('#' * 14))
+
+        # act
+        management.call_command('generate_invoices', batch_size=1, stdout=io.StringIO())
+
+        # assert
+        self.assertEqual(
+            set(models.Invoice.objects.exclude(order=self.orders[0]).values_list(
+                'order_id', flat=True,
+            )),
+            {order.id for order in self.orders[1:]},
+        )
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_should_deliver_invoices_whose_delivery_failed(self, get_client):
+        # arrange
+        get_client.return_value = self.build_afip_client(4)
+        models.Order.objects.update(status=models.Order.STATUS.PAID)
+
+        with mock.patch('checkout.renderer.render_invoice', side_effect=OSError):
+            with self.assertRaises(OSError):
+                tasks.generate_invoices(batch_size=1)
+
+        invoice = models.Invoice.objects.get()
+
+        # act
+        with mock.patch('checkout.renderer.render_invoice', return_value=b'%PDF'):
+            delivered = tasks.deliver_undelivered_invoices(
+                now=timezone.now() + tasks.INVOICE_DELIVERY_TIMEOUT,
+            )
+
+        # assert
+        self.assertEqual(delivered, 1)
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.file)
+        self.assertIsNone(invoice.data)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][1], b'%PDF')
+
+    def test_should_not_queue_invoice_email_if_upload_failed(self, get_client):
+        # arrange
+        invoice = models.Invoice.objects.create(
+            order=self.orders[0],
+            number=1,
+            cae=fake.numerify('#' * 14),
+            data={},
+        )
+
+        # act
+        with mock.patch('checkout.tasks.upload_invoice', side_effect=OSError):
+            with self.assertRaises(OSError):
+                tasks.send_invoice(invoice, b'%PDF')
+
+        # assert
+        invoice.refresh_from_db()
+        self.assertFalse(invoice.file)
+        self.assertIsNotNone(invoice.data)
+        self.assertFalse(models.Email.objects.exists())
+
+    def test_should_not_deliver_invoices_being_delivered(self, get_client):
+        # arrange
+        models.Invoice.objects.create(
+            order=self.orders[0],
+            number=1,
+            cae=fake.numerify('#' * 14),
+            data={},
+        )
+
+        # act
+        with mock.patch('checkout.renderer.render_invoice') as render_invoice:
+            delivered = tasks.deliver_undelivered_invoices()
+
+        # assert
+        self.assertEqual(delivered, 0)
+        render_invoice.assert_not_called()
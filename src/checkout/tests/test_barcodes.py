@@ -0,0 +1,83 @@
+import io
+import re
+import barcode
+import faker
+from django import test
+from xml.dom import minidom
+
+from .. import barcodes, renderer
+
+fake = faker.Faker()
+
+
+def parse_size(size):
+    return round(float(size.replace('mm', '')), 3)
+
+
+def parse_python_barcode_svg(code):
+    output = io.BytesIO()
+    barcode.get_barcode_class('itf')(code).write(output, options={'module_width': 0.16})
+    document = minidom.parseString(output.getvalue())
+    svg = document.documentElement
+    bars = [
+        (parse_size(rect.getAttribute('x')), parse_size(rect.getAttribute('width')))
+        for rect in document.getElementsByTagName('rect')
+        if rect.getAttribute('style') == 'fill:black;'
+    ]
+
+    return svg.getAttribute('width'), svg.getAttribute('height'), bars
+
+
+def parse_svg(code):
+    document = minidom.parseString(barcodes.render_svg(code))
+    svg = document.documentElement
+    path = document.getElementsByTagName('path')[0].getAttribute('d')
+    bars = [
+        (parse_size(x), parse_size(width))
+        for x, width in re.findall(r'M([\d.]+) [\d.]+h([\d.]+)', path)
+    ]
+
+    return svg.getAttribute('width'), svg.getAttribute('height'), bars
+
+
+class RenderBarcodeTestCase(test.SimpleTestCase):
+    def setUp(self):
+        barcodes.render_svg.cache_clear()
+
+    def test_should_match_python_barcode_output(self):
+        for code in ['0', '123456', '1234567', fake.numerify('#' * 40)]:
+            # act
+            width, height, bars = parse_svg(code)
+
+            # assert
+            expected_width, expected_height, expected_bars = parse_python_barcode_svg(code)
+            self.assertEqual(parse_size(width), parse_size(expected_width))
+            self.assertEqual(parse_size(height), parse_size(expected_height))
+            self.assertEqual(bars, expected_bars)
+
+    def test_should_use_a_single_path_for_all_bars(self):
+        # act
+        document = minidom.parseString(barcodes.render_svg('123456'))
+
+        # assert
+        self.assertEqual(len(document.getElementsByTagName('path')), 1)
+        self.assertEqual(document.getElementsByTagName('text')[0].firstChild.data, '123456')
+
+    def test_should_cache_rendered_barcodes(self):
+        # act
+        svg = barcodes.render_svg('123456')
+
+        # assert
+        self.assertIs(barcodes.render_svg('123456'), svg)
+
+    def test_should_not_render_non_numeric_codes(self):
+        with self.assertRaises(ValueError):
+            barcodes.render_svg('12a4')
+
+    def test_should_fetch_barcode_urls_without_encoding(self):
+        # act
+        response = renderer.fetch_url(barcodes.build_url('123'))
+
+        # assert
+        self.assertEqual(response['mime_type'], 'image/svg+xml')
+        self.assertEqual(response['string'], barcodes.render_svg('0123'))
@@ -1,10 +1,13 @@
 import faker
-from django import urls
+import freezegun
+from django import urls, db
+from django.conf import settings
+from django.core import signing
 from django.contrib import auth
-from rest_framework import test, status
+from rest_framework import test, status, exceptions
 
 from user import factories as user_factories
-from .. import models, factories, authentication
+from .. import models, factories, authentication, tokens
 from . import utils
 
 
@@ -142,3 +145,131 @@ class CustomerVerifyTestCase(test.APITestCase):
 
         # assert
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CustomerAuthenticationTestCase(test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = factories.CustomerFactory()
+
+    def setUp(self):
+        authentication.get_cache().clear()
+
+    def build_request(self, *credentials):
+        return test.APIRequestFactory().get('/', **utils.build_authentication_credentials(
+            authentication.CUSTOMER_AUTH_SCHEMA,
+            *credentials,
+        ))
+
+    def test_should_skip_customer_lookup_for_recently_verified_token(self):
+        # arrange
+        request = self.build_request(self.customer.generate_token())
+        authentication.CustomerAuthentication().authenticate(request)
+
+        # act
+        with self.assertNumQueries(0):
+            user, schema = authentication.CustomerAuthentication().authenticate(request)
+
+        # assert
+        self.assertEqual(user, self.customer.user)
+
+    def test_should_load_customer_by_id_from_compact_token(self):
+        # arrange
+        request = self.build_request(self.customer.generate_token())
+
+        # act
+        with self.assertNumQueries(1):
+            user, schema = authentication.CustomerAuthentication().authenticate(request)
+
+        # assert
+        self.assertEqual(user, self.customer.user)
+
+    def test_should_accept_legacy_tokens(self):
+        # arrange
+        token = signing.dumps((self.customer.user.email, self.customer.identity_document))
+
+        # act
+        user, schema = authentication.CustomerAuthentication().authenticate(
+            self.build_request(token),
+        )
+
+        # assert
+        self.assertEqual(user, self.customer.user)
+
+    def test_should_reject_expired_legacy_tokens(self):
+        # arrange
+        with freezegun.freeze_time('2020-01-01'):
+            token = signing.dumps((self.customer.user.email, self.customer.identity_document))
+
+        # act
+        with freezegun.freeze_time('2020-01-01') as frozen_time:
+            frozen_time.tick(settings.CUSTOMER_TOKEN_MAX_AGE + 1)
+
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+    def test_should_not_accept_cached_tokens_once_expired(self):
+        # arrange
+        with freezegun.freeze_time('2020-01-01'):
+            token = self.customer.generate_token()
+
+        with freezegun.freeze_time('2020-01-01') as frozen_time:
+            frozen_time.tick(settings.CUSTOMER_TOKEN_MAX_AGE - 1)
+            authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+            # act
+            frozen_time.tick(2)
+
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+    def test_should_not_accept_cached_legacy_tokens_once_expired(self):
+        # arrange
+        with freezegun.freeze_time('2020-01-01'):
+            token = signing.dumps((self.customer.user.email, self.customer.identity_document))
+
+        with freezegun.freeze_time('2020-01-01') as frozen_time:
+            frozen_time.tick(settings.CUSTOMER_TOKEN_MAX_AGE - 1)
+            authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+            # act
+            frozen_time.tick(2)
+
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+    def test_should_reject_tampered_tokens(self):
+        # arrange
+        token = self.customer.generate_token()
+        key_id, customer_id, issued_at, signature = token.split('.')
+        token = '.'.join([key_id, tokens.to_base36(int(customer_id, 36) + 1), issued_at, signature])
+
+        # act
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.CustomerAuthentication().authenticate(self.build_request(token))
+
+    def test_should_not_cache_failed_authentication(self):
+        # arrange
+        request = self.build_request(self.customer.user.email, 'wrong')
+
+        # act
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.CustomerAuthentication().authenticate(request)
+
+        # assert
+        self.assertEqual(authentication.get_cache().get(authentication.build_cache_key([
+            self.customer.user.email,
+            'wrong',
+        ])), None)
+
+    def test_should_index_case_insensitive_lookups(self):
+        # act
+        with db.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE indexname IN (%s, %s)',
+                ['user_user_email_upper_idx', 'checkout_customer_identity_document_upper_idx'],
+            )
+            indexes = cursor.fetchall()
+
+        # assert
+        self.assertEqual(len(indexes), 2)
@@ -0,0 +1,194 @@
+import faker
+from unittest import mock
+from django import test
+from django.core import mail
+from django.db import connection
+from django.utils import timezone
+
+from .. import emails, factories, models, tasks
+
+fake = faker.Faker()
+
+
+class ThrottlingError(Exception):
+    response = {'Error': {'Code': 'Throttling'}}
+
+
+class MessageRejectedError(Exception):
+    response = {'Error': {'Code': 'MessageRejected'}}
+
+
+class HTTPError(Exception):
+    response = mock.Mock(status_code=503)
+
+
+@test.override_settings(EMAIL_SEND_RATE=1000)
+class SendQueuedEmailsTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = factories.OrderFactory()
+
+    def test_should_render_and_send_queued_emails(self):
+        # arrange
+        email = fake.email()
+        emails.queue_email(
+            'order_paid',
+            email,
+            {'order': self.order},
+            attachments=[('factura.pdf', b'%PDF', 'application/pdf')],
+        )
+
+        # act
+        sent, attempted = emails.send_queued_emails()
+
+        # assert
+        self.assertEqual((sent, attempted), (1, 1))
+        self.assertEqual(mail.outbox[0].recipients(), [email])
+        self.assertEqual(mail.outbox[0].subject, '¡Gracias por tu compra!')
+        self.assertEqual(mail.outbox[0].attachments, [('factura.pdf', b'%PDF', 'application/pdf')])
+        self.assertEqual(models.Email.objects.get().status, models.Email.STATUS.SENT)
+
+    def test_should_send_batch_over_a_single_connection(self):
+        # arrange
+        emails.queue_emails('pass_paid', [(fake.email(), {}) for i in range(3)])
+
+        # act
+        with mock.patch('checkout.emails.mail.get_connection', wraps=mail.get_connection) as \
+                get_connection:
+            emails.send_queued_emails(batch_size=2)
+
+        # assert
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(models.Email.objects.filter(status=models.Email.STATUS.PENDING).count(), 1)
+
+    @test.override_settings(EMAIL_SEND_RATE=10)
+    @mock.patch('checkout.emails.time.sleep')
+    def test_should_respect_sending_rate(self, sleep):
+        # arrange
+        emails.queue_emails('pass_paid', [(fake.email(), {}) for i in range(3)])
+
+        # act
+        emails.send_queued_emails()
+
+        # assert
+        waits = [call[0][0] for call in sleep.call_args_list]
+        for wait, expected_wait in zip(waits, [0, 0.1, 0.2]):
+            self.assertAlmostEqual(wait, expected_wait, delta=0.05)
+
+    def test_should_retry_transient_failures(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+
+        # act
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=ThrottlingError()):
+            emails.send_queued_emails()
+
+        # assert
+        email = models.Email.objects.get()
+        self.assertEqual(email.status, models.Email.STATUS.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.send_after, timezone.now())
+        self.assertEqual(emails.send_queued_emails(), (0, 0))
+
+    def test_should_not_retry_rejected_emails(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+
+        # act
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=MessageRejectedError()):
+            emails.send_queued_emails()
+
+        # assert
+        self.assertEqual(models.Email.objects.get().status, models.Email.STATUS.FAILED)
+
+    def test_should_give_up_after_max_attempts(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+        models.Email.objects.update(attempts=emails.email_queue.max_attempts - 1)
+
+        # act
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=ThrottlingError()):
+            emails.send_queued_emails()
+
+        # assert
+        self.assertEqual(models.Email.objects.get().status, models.Email.STATUS.FAILED)
+
+    def test_should_retry_errors_with_a_response_that_is_not_from_ses(self):
+        # arrange
+        emails.queue_emails('pass_paid', [(fake.email(), {}) for i in range(2)])
+
+        # act
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=[HTTPError(), 1]):
+            sent, attempted = emails.send_queued_emails()
+
+        # assert
+        self.assertEqual((sent, attempted), (1, 2))
+        self.assertEqual(
+            list(models.Email.objects.order_by('id').values_list('status', flat=True)),
+            [models.Email.STATUS.PENDING, models.Email.STATUS.SENT],
+        )
+
+    def test_should_mark_emails_sent_before_the_batch_ends(self):
+        # arrange
+        emails.queue_emails('pass_paid', [(fake.email(), {}) for i in range(2)])
+        send = mock.patch('django.core.mail.EmailMessage.send', side_effect=[1, ThrottlingError()])
+
+        # act
+        with send, mock.patch('checkout.emails.set_email_failed', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                emails.send_queued_emails()
+
+        # assert
+        self.assertEqual(
+            models.Email.objects.order_by('id').first().status,
+            models.Email.STATUS.SENT,
+        )
+
+    def test_should_not_pick_up_emails_that_killed_the_worker_every_attempt(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+        models.Email.objects.update(
+            status=models.Email.STATUS.SENDING,
+            attempts=emails.email_queue.max_attempts,
+            modified_at=timezone.now() - emails.email_queue.claim_timeout,
+        )
+
+        # act
+        sent, attempted = emails.send_queued_emails()
+
+        # assert
+        self.assertEqual((sent, attempted), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+
+@test.override_settings(EMAIL_SEND_RATE=1000)
+class SendPendingEmailsTestCase(test.TestCase):
+    def test_should_send_pending_emails_and_release_the_lock(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+
+        # act
+        tasks.send_pending_emails()
+
+        # assert
+        self.assertEqual(len(mail.outbox), 1)
+        with emails.sender_lock() as acquired:
+            self.assertTrue(acquired)
+
+    def test_should_not_send_emails_while_another_worker_sends_them(self):
+        # arrange
+        emails.queue_email('pass_paid', fake.email(), {})
+        other_connection = connection.copy()
+        with other_connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [emails.SENDER_LOCK_ID])
+
+        # act
+        try:
+            tasks.send_pending_emails()
+        finally:
+            other_connection.close()
+
+        # assert
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(models.Email.objects.get().status, models.Email.STATUS.PENDING)
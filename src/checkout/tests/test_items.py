@@ -1,8 +1,10 @@
 import json
+import freezegun
 from django import urls
+from django.utils import timezone, http as http_utils
 from rest_framework import test, status
 
-from .. import factories
+from .. import catalog, factories, models, stock
 
 
 class ItemRetrieveTestCase(test.APITestCase):
@@ -18,6 +20,7 @@ class ItemRetrieveTestCase(test.APITestCase):
                 'name': item.name,
                 'type': item.type,
                 'price': str(item.price.amount),
+                'stock': item.stock,
                 'image': None,
                 'options': [
                     {
@@ -44,6 +47,7 @@ class ItemRetrieveTestCase(test.APITestCase):
             'name': item.name,
             'type': item.type,
             'price': str(item.price.amount),
+            'stock': item.stock,
             'image': None,
             'options': [
                 {
@@ -61,6 +65,21 @@ class ItemRetrieveTestCase(test.APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, expected_data)
 
+    def test_should_return_stock_including_shards(self):
+        # arrange
+        item = factories.ItemFactory(stock=3)
+        models.ItemStockShard.objects.bulk_create([
+            models.ItemStockShard(item=item, stock=stock) for stock in (4, 5)
+        ])
+        url = urls.reverse('item-detail', kwargs={'pk': item.id})
+
+        # act
+        response = self.client.get(url)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stock'], 12)
+
     def test_should_include_item_options(self):
         # arrange
         item = factories.ItemFactory(
@@ -88,3 +107,149 @@ class ItemRetrieveTestCase(test.APITestCase):
         # assert
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(json.loads(response.content)['included'], expected_data)
+
+
+class ItemCatalogCacheTestCase(test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [
+            factories.ItemFactory(options=[factories.ItemOptionFactory.build()])
+            for i in range(5)
+        ]
+        cls.url = urls.reverse('item-list')
+
+    def test_should_serve_repeated_requests_from_cache(self):
+        # arrange
+        first_response = self.client.get(f'{self.url}?include=options')
+
+        # act
+        with self.assertNumQueries(2):
+            response = self.client.get(f'{self.url}?include=options')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, first_response.content)
+
+    def test_should_cache_each_filter_separately(self):
+        # arrange
+        self.client.get(self.url, {'filter[type]': models.Item.TYPES.PASS})
+
+        # act
+        response = self.client.get(self.url, {'filter[type]': models.Item.TYPES.ADDON})
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in json.loads(response.content)['data']],
+            [str(item.id) for item in self.items if item.type == models.Item.TYPES.ADDON],
+        )
+
+    def test_should_cache_each_page_separately(self):
+        # arrange
+        self.client.get(self.url, {'page[number]': 1, 'page[size]': 2})
+
+        # act
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'page[number]': 1, 'page[size]': 2})
+
+        response = self.client.get(self.url, {'page[number]': 2, 'page[size]': 2})
+
+        # assert
+        self.assertEqual(
+            [item['id'] for item in json.loads(response.content)['data']],
+            [str(item.id) for item in self.items[2:4]],
+        )
+
+    def test_should_invalidate_cache_when_an_item_changes(self):
+        # arrange
+        self.client.get(self.url)
+        item = self.items[0]
+
+        # act
+        item.name = 'new name'
+        item.save()
+        response = self.client.get(self.url)
+
+        # assert
+        self.assertEqual(json.loads(response.content)['data'][0]['attributes']['name'], 'new name')
+
+    def test_should_invalidate_cache_when_an_item_option_changes(self):
+        # arrange
+        self.client.get(f'{self.url}?include=options')
+        option = self.items[0].options.first()
+
+        # act
+        option.name = 'new name'
+        option.save()
+        response = self.client.get(f'{self.url}?include=options')
+
+        # assert
+        included = json.loads(response.content)['included']
+        self.assertIn('new name', [option['attributes']['name'] for option in included])
+
+    def test_should_return_not_modified_for_matching_etag(self):
+        # arrange
+        first_response = self.client.get(self.url)
+
+        # act
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first_response['ETag'])
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_should_return_not_modified_if_not_modified_since(self):
+        # arrange
+        first_response = self.client.get(self.url)
+
+        # act
+        response = self.client.get(
+            self.url,
+            HTTP_IF_MODIFIED_SINCE=first_response['Last-Modified'],
+        )
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_should_not_set_last_modified_in_the_future_after_invalidations(self):
+        # arrange
+        for item in self.items:
+            item.save()
+
+        # act
+        response = self.client.get(self.url)
+
+        # assert
+        self.assertLessEqual(
+            http_utils.parse_http_date(response['Last-Modified']),
+            timezone.now().timestamp(),
+        )
+
+    def test_should_not_invalidate_cache_when_stock_is_reserved(self):
+        # arrange
+        item = self.items[0]
+        first_response = self.client.get(self.url)
+
+        # act
+        stock.reserve_order(factories.OrderFactory(items=[item]))
+        response = self.client.get(self.url)
+
+        # assert
+        self.assertEqual(response.content, first_response.content)
+
+    def test_should_refresh_stock_once_cached_responses_expire(self):
+        # arrange
+        item = self.items[0]
+
+        with freezegun.freeze_time() as frozen_time:
+            self.client.get(self.url)
+            stock.reserve_order(factories.OrderFactory(items=[item]))
+
+            # act
+            frozen_time.tick(catalog.RESPONSE_TIMEOUT + 1)
+            response = self.client.get(self.url)
+
+        # assert
+        self.assertEqual(
+            json.loads(response.content)['data'][0]['attributes']['stock'],
+            item.stock - 1,
+        )
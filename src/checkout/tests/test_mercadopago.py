@@ -1,11 +1,52 @@
+import json
+import time
 import faker
+import threading
+from http import server
 from unittest import mock
 from django import test
+from requests import exceptions
 
 from .. import models, factories, mercadopago
 
 fake = faker.Faker()
 PREFERENCE_ID = fake.lexify(text='?????????????????')
+ACCESS_TOKEN = fake.lexify(text='APP_USR-????????????')
+
+
+class FakeMercadoPagoHandler(server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.server.requests.append((self.command, self.path, self.client_address))
+        self.rfile.read(int(self.headers['Content-Length']))
+
+        if self.server.failures:
+            failure = self.server.failures.pop(0)
+            time.sleep(failure.get('delay', 0))
+            self.respond(failure['status'], {})
+        elif self.path == mercadopago.TOKEN_PATH:
+            self.respond(200, {'access_token': ACCESS_TOKEN, 'expires_in': 21600})
+        elif self.headers['Authorization'] != f'Bearer {ACCESS_TOKEN}':
+            self.respond(401, {})
+        else:
+            self.respond(201, {'id': PREFERENCE_ID})
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # the client gave up waiting for the response
+            pass
 
 
 @test.override_settings(MERCADOPAGO_CLIENT_ID='xxxx', MERCADOPAGO_CLIENT_SECRET='xxxx')
@@ -91,3 +132,109 @@ class GenerateOrderPreferenceTestCase(test.TestCase):
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, models.Order.STATUS.IN_PROCESS)
         self.assertEqual(self.order.preference_id, PREFERENCE_ID)
+
+    def test_should_not_update_cancelled_order(self):
+        # arrange
+        order = factories.OrderFactory(status=models.Order.STATUS.CANCELLED)
+
+        # act
+        mercadopago.generate_order_preference(order)
+
+        # assert
+        order.refresh_from_db()
+        self.assertEqual(order.status, models.Order.STATUS.CANCELLED)
+        self.assertIsNone(order.preference_id)
+
+
+class MercadoPagoClientTestCase(test.SimpleTestCase):
+    def setUp(self):
+        self.server = server.ThreadingHTTPServer(('127.0.0.1', 0), FakeMercadoPagoHandler)
+        self.server.requests = []
+        self.server.failures = []
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.client = mercadopago.Client(
+            'xxxx',
+            'xxxx',
+            f'http://127.0.0.1:{self.server.server_port}',
+            (1, 0.2),
+            max_retries=1,
+        )
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_should_reuse_access_token_and_connection(self):
+        # act
+        for i in range(3):
+            response = self.client.create_preference({})
+
+        # assert
+        self.assertEqual(response['response']['id'], PREFERENCE_ID)
+        self.assertEqual(
+            [path for method, path, address in self.server.requests],
+            [mercadopago.TOKEN_PATH] + [mercadopago.PREFERENCES_PATH] * 3,
+        )
+        self.assertEqual(len(set(address for method, path, address in self.server.requests)), 1)
+
+    def test_should_request_a_new_access_token_when_expired(self):
+        # arrange
+        self.client.create_preference({})
+        self.client.access_token_expires_at = time.monotonic()
+
+        # act
+        self.client.create_preference({})
+
+        # assert
+        self.assertEqual(
+            [path for method, path, address in self.server.requests],
+            [mercadopago.TOKEN_PATH, mercadopago.PREFERENCES_PATH] * 2,
+        )
+
+    def test_should_request_a_new_access_token_when_revoked(self):
+        # arrange
+        self.client.access_token = 'revoked'
+        self.client.access_token_expires_at = time.monotonic() + 60
+
+        # act
+        response = self.client.create_preference({})
+
+        # assert
+        self.assertEqual(response['response']['id'], PREFERENCE_ID)
+        self.assertEqual(self.client.access_token, ACCESS_TOKEN)
+
+    def test_should_retry_server_errors(self):
+        # arrange
+        self.server.failures = [{'status': 503}]
+
+        # act
+        response = self.client.create_preference({})
+
+        # assert
+        self.assertEqual(response['response']['id'], PREFERENCE_ID)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_should_fail_after_retrying_server_errors(self):
+        # arrange
+        self.server.failures = [{'status': 503}, {'status': 503}]
+
+        # act
+        with self.assertRaises(mercadopago.MercadoPagoError) as context:
+            self.client.get_access_token()
+
+        # assert
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_should_time_out(self):
+        # arrange
+        self.server.failures = [{'status': 200, 'delay': 0.5}, {'status': 200, 'delay': 0.5}]
+
+        # act
+        with self.assertRaises(exceptions.ConnectionError), self.assertLogs('urllib3', 'WARNING'):
+            self.client.get_access_token()
+
+        # assert
+        self.assertEqual(len(self.server.requests), 2)
@@ -0,0 +1,100 @@
+import json
+import requests
+from unittest import mock
+from django import test as django_test, urls
+from rest_framework import test, status
+
+from shiro import metrics
+from .. import factories, models
+from . import utils
+
+
+@django_test.override_settings(METRICS_SAMPLE_RATE=1, METRICS_SLOW_REQUEST_THRESHOLD=60)
+class MetricsMiddlewareTestCase(test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = factories.CustomerFactory()
+        cls.item = factories.ItemFactory(type=models.Item.TYPES.PASS)
+
+    def get_logged_metrics(self, logs):
+        self.assertEqual(len(logs.records), 1)
+
+        return json.loads(logs.records[0].getMessage())
+
+    def test_should_log_queries_and_cache_lookups_of_sampled_requests(self):
+        # act
+        with self.assertLogs(metrics.logger, 'INFO') as logs:
+            response = self.client.get(urls.reverse('item-list'))
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        logged_metrics = self.get_logged_metrics(logs)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(logged_metrics['view'], 'item-list')
+        self.assertEqual(logged_metrics['status'], status.HTTP_200_OK)
+        self.assertFalse(logged_metrics['slow'])
+        self.assertGreater(logged_metrics['db']['queries'], 0)
+        self.assertEqual(logged_metrics['cache']['catalog'], {'hits': 0, 'misses': 1})
+
+    def test_should_write_sampled_requests_to_the_configured_handler(self):
+        # arrange
+        handler, = metrics.logger.handlers
+
+        # act
+        with mock.patch.object(handler, 'emit') as emit:
+            self.client.get(urls.reverse('item-list'))
+
+        # assert
+        emit.assert_called_once()
+        self.assertEqual(emit.call_args[0][0].levelname, 'INFO')
+
+    @django_test.override_settings(
+        MERCADOPAGO_CLIENT_ID='xxxx',
+        MERCADOPAGO_CLIENT_SECRET='xxxx',
+    )
+    def test_should_log_external_calls(self):
+        # arrange
+        self.client.credentials(**utils.build_customer_authentication_credentials(self.customer))
+        payload = utils.build_json_api_payload('order', {
+            'order-items': [
+                utils.build_json_api_resource('order-item', {
+                    'item': utils.build_json_api_identifier('item', self.item.id),
+                }),
+            ],
+        })
+        mp_response = mock.Mock(status_code=201)
+        mp_response.json.return_value = {'access_token': 'xxxx', 'expires_in': 60, 'id': 'xxxx'}
+
+        # act
+        with mock.patch.object(requests.Session, 'request', return_value=mp_response), \
+                self.assertLogs(metrics.logger, 'INFO') as logs:
+            response = self.client.post(urls.reverse('order-list'), payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        logged_metrics = self.get_logged_metrics(logs)
+        self.assertGreaterEqual(logged_metrics['external']['mercadopago']['calls'], 1)
+        self.assertEqual(logged_metrics['cache']['customers'], {'hits': 0, 'misses': 1})
+
+    @django_test.override_settings(METRICS_SAMPLE_RATE=0)
+    def test_should_not_log_requests_that_are_not_sampled(self):
+        # act
+        with mock.patch.object(metrics.logger, 'log') as log:
+            self.client.get(urls.reverse('item-list'))
+
+        # assert
+        log.assert_not_called()
+
+    @django_test.override_settings(METRICS_SAMPLE_RATE=0, METRICS_SLOW_REQUEST_THRESHOLD=0)
+    def test_should_log_slow_requests_even_if_not_sampled(self):
+        # act
+        with self.assertLogs(metrics.logger, 'INFO') as logs:
+            self.client.get(urls.reverse('item-list'))
+
+        # assert
+        logged_metrics = self.get_logged_metrics(logs)
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertTrue(logged_metrics['slow'])
+        self.assertNotIn('db', logged_metrics)
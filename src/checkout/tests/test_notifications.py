@@ -0,0 +1,196 @@
+from unittest import mock
+from django import test
+from django.utils import timezone
+
+from .. import factories, models, mercadopago, notifications, stock, tasks
+
+
+class ProcessNotificationTestCase(test.TestCase):
+    def setUp(self):
+        self.order = factories.OrderFactory(status=models.Order.STATUS.IN_PROCESS)
+        self.notification = notifications.record_notification(
+            mercadopago.IPNTopic.MERCHANT_ORDER.value,
+            '1234',
+        )
+
+        self.get_merchant_order_patcher = mock.patch(
+            'checkout.notifications.mercadopago.get_merchant_order',
+        )
+        self.get_merchant_order = self.get_merchant_order_patcher.start()
+        self.get_merchant_order.return_value = {
+            'id': '1234',
+            'order_status': mercadopago.OrderStatus.PAID.value,
+            'external_reference': str(self.order.id),
+        }
+
+    def tearDown(self):
+        self.get_merchant_order_patcher.stop()
+
+    def test_should_pay_order(self):
+        # act
+        paid_order_id = notifications.process_notification(self.notification.id)
+
+        # assert
+        self.assertEqual(paid_order_id, self.order.id)
+        self.order.refresh_from_db()
+        self.notification.refresh_from_db()
+        self.assertEqual(self.order.status, models.Order.STATUS.PAID)
+        self.assertEqual(self.order.external_id, '1234')
+        self.assertEqual(self.notification.status, models.PaymentNotification.STATUS.PROCESSED)
+
+    def test_should_not_pay_order_twice(self):
+        # arrange
+        notifications.process_notification(self.notification.id)
+        notifications.record_notification(mercadopago.IPNTopic.MERCHANT_ORDER.value, '1234')
+
+        # act
+        paid_order_id = notifications.process_notification(self.notification.id)
+
+        # assert
+        self.assertIsNone(paid_order_id)
+        self.assertEqual(self.get_merchant_order.call_count, 2)
+
+    def test_should_skip_notifications_already_being_processed(self):
+        # arrange
+        notifications.set_notification_status(
+            self.notification.id,
+            models.PaymentNotification.STATUS.PROCESSING,
+            [models.PaymentNotification.STATUS.PENDING],
+        )
+
+        # act
+        paid_order_id = notifications.process_notification(self.notification.id)
+
+        # assert
+        self.assertIsNone(paid_order_id)
+        self.get_merchant_order.assert_not_called()
+
+    def test_should_keep_notification_pending_if_received_again_while_processing(self):
+        # arrange
+        def get_merchant_order(id):
+            notifications.record_notification(mercadopago.IPNTopic.MERCHANT_ORDER.value, id)
+
+            return {
+                'id': id,
+                'order_status': mercadopago.OrderStatus.PAYMENT_REQUIRED.value,
+                'external_reference': str(self.order.id),
+            }
+
+        self.get_merchant_order.side_effect = get_merchant_order
+
+        # act
+        notifications.process_notification(self.notification.id)
+
+        # assert
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, models.PaymentNotification.STATUS.PENDING)
+
+    def test_should_mark_notification_as_failed(self):
+        # arrange
+        self.get_merchant_order.side_effect = mercadopago.MercadoPagoError(500, '')
+
+        # act
+        with self.assertRaises(mercadopago.MercadoPagoError):
+            notifications.process_notification(self.notification.id)
+
+        # assert
+        self.notification.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.notification.status, models.PaymentNotification.STATUS.FAILED)
+        self.assertEqual(self.order.status, models.Order.STATUS.IN_PROCESS)
+
+    def cancel_expired_order(self):
+        item = factories.ItemFactory(stock=1)
+        order = factories.OrderFactory(items=[item], status=models.Order.STATUS.IN_PROCESS)
+        stock.reserve_order(order)
+        stock.release_expired_reservations(now=order.created_at + stock.RESERVATION_TTL)
+        self.get_merchant_order.return_value['external_reference'] = str(order.id)
+
+        return order, item
+
+    def test_should_pay_order_cancelled_before_its_payment_if_stock_is_left(self):
+        # arrange
+        order, item = self.cancel_expired_order()
+
+        # act
+        paid_order_id = notifications.process_notification(self.notification.id)
+
+        # assert
+        self.assertEqual(paid_order_id, order.id)
+        order.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual(order.status, models.Order.STATUS.PAID)
+        self.assertEqual(item.stock, 0)
+        self.assertEqual(
+            order.stock_reservations.get(status=models.StockReservation.STATUS.CONFIRMED).amount,
+            1,
+        )
+
+    def test_should_flag_order_cancelled_before_its_payment_for_refund_if_out_of_stock(self):
+        # arrange
+        order, item = self.cancel_expired_order()
+        models.Item.objects.filter(id=item.id).update(stock=0)
+
+        # act
+        with self.assertLogs(notifications.logger, 'ERROR'):
+            paid_order_id = notifications.process_notification(self.notification.id)
+
+        # assert
+        self.assertIsNone(paid_order_id)
+        order.refresh_from_db()
+        self.notification.refresh_from_db()
+        self.assertEqual(order.status, models.Order.STATUS.REFUND_PENDING)
+        self.assertEqual(order.external_id, '1234')
+        self.assertEqual(self.notification.status, models.PaymentNotification.STATUS.PROCESSED)
+
+    @mock.patch('checkout.tasks.generate_invoice')
+    def test_should_retry_stale_notifications(self, generate_invoice):
+        # arrange
+        models.PaymentNotification.objects.update(
+            status=models.PaymentNotification.STATUS.FAILED,
+            modified_at=timezone.now() - notifications.STALE_NOTIFICATION_DELAY,
+        )
+
+        # act
+        tasks.process_stale_notifications()
+
+        # assert
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, models.PaymentNotification.STATUS.PROCESSED)
+        generate_invoice.assert_called_once_with(self.order.id)
+
+    def test_should_give_up_on_notifications_that_keep_failing(self):
+        # arrange
+        self.get_merchant_order.return_value['external_reference'] = '0'
+
+        for i in range(notifications.NOTIFICATION_MAX_ATTEMPTS):
+            notifications.retry_notification(self.notification.id)
+
+            with self.assertRaises(models.Order.DoesNotExist):
+                notifications.process_notification(self.notification.id)
+
+        # act
+        stale_notification_ids = notifications.get_stale_notification_ids(
+            now=timezone.now() + notifications.STALE_NOTIFICATION_DELAY,
+        )
+
+        # assert
+        self.assertNotIn(self.notification.id, stale_notification_ids)
+
+    def test_should_retry_notifications_that_failed_again_if_notified_again(self):
+        # arrange
+        models.PaymentNotification.objects.update(
+            status=models.PaymentNotification.STATUS.FAILED,
+            attempts=notifications.NOTIFICATION_MAX_ATTEMPTS,
+        )
+
+        # act
+        notifications.record_notification(mercadopago.IPNTopic.MERCHANT_ORDER.value, '1234')
+
+        # assert
+        self.assertIn(
+            self.notification.id,
+            notifications.get_stale_notification_ids(
+                now=timezone.now() + notifications.STALE_NOTIFICATION_DELAY,
+            ),
+        )
@@ -2,13 +2,14 @@ import json
 import faker
 import itertools
 from unittest import mock
-from django import urls
+from django import urls, db
 from django.core import mail
+from django.test import utils as test_utils
 from rest_framework import test, status
 from djmoney import money
 
 from user import factories as user_factories
-from .. import factories, models, mercadopago
+from .. import afip, factories, models, mercadopago, renderer, stock
 from . import utils
 
 fake = faker.Faker()
@@ -189,6 +190,46 @@ class OrderCreateTestCase(test.APITestCase):
         self.assertEqual(order_item_option.item_option.id, option['item_option']['id'])
         self.assertEqual(order_item_option.value, option['value'])
 
+    def test_should_insert_order_items_and_options_in_bulk(self):
+        # arrange
+        items = [
+            factories.ItemFactory(
+                type=models.Item.TYPES.PASS,
+                options=[factories.ItemOptionFactory.build() for j in range(3)],
+            ) for i in range(5)
+        ]
+        items_extra = [
+            {
+                'options': [
+                    utils.build_json_api_resource('order-item-option', {
+                        'item_option': utils.build_json_api_identifier('item-option', option.id),
+                        'value': fake.word(),
+                    }) for option in item.options.all()
+                ],
+            } for item in items
+        ]
+        payload = self.build_order_payload(items, items_extra=items_extra)
+
+        # act
+        with test_utils.CaptureQueriesContext(db.connection) as context:
+            response = self.client.post(self.url, payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        inserts = [
+            query['sql'].split(' ')[2]
+            for query in context.captured_queries
+            if query['sql'].startswith('INSERT')
+        ]
+        self.assertEqual(inserts.count('"checkout_orderitem"'), 1)
+        self.assertEqual(inserts.count('"checkout_orderitemoption"'), 1)
+
+        order = models.Order.objects.first()
+        self.assertEqual(order.order_items.count(), 5)
+        self.assertEqual(models.OrderItemOption.objects.filter(order_item__order=order).count(), 15)
+        self.assertEqual(order.total, sum(item.price for item in items))
+
     def test_should_validate_at_least_one_item(self):
         # arrangeorder_itemi
         order_data = {}
@@ -228,6 +269,45 @@ class OrderCreateTestCase(test.APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data[0]['source']['pointer'], '/data/attributes/order-items')
 
+    def test_should_report_each_order_item_missing_options(self):
+        # arrange
+        items = [
+            factories.ItemFactory(
+                type=models.Item.TYPES.PASS,
+                options=[factories.ItemOptionFactory.build()],
+            ) for i in range(3)
+        ]
+        option = {
+            'item_option': utils.build_json_api_identifier(
+                'item-option',
+                items[1].options.first().id,
+            ),
+            'value': 'some value',
+        }
+        items_extra = [
+            {},
+            {'options': [utils.build_json_api_resource('order-item-option', option)]},
+            {},
+        ]
+        payload = self.build_order_payload(items, items_extra=items_extra)
+
+        # act
+        with test_utils.CaptureQueriesContext(db.connection) as context:
+            response = self.client.post(self.url, payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data), 2)
+        self.assertIn('order item 0', response.data[0]['detail'])
+        self.assertIn('order item 2', response.data[1]['detail'])
+        self.assertEqual(
+            len([
+                query for query in context.captured_queries
+                if query['sql'].startswith('SELECT "checkout_itemoption"."item_id"')
+            ]),
+            1,
+        )
+
     def test_should_return_total(self):
         # arrange
         items = [self.items[0], self.items[2]]
@@ -555,6 +635,69 @@ class OrderCreateTestCase(test.APITestCase):
             f'http://testserver{urls.reverse("order-ipn")}',
         )
 
+    @test.override_settings(MERCADOPAGO_ASYNC_PREFERENCES=True)
+    @mock.patch('checkout.views.tasks.generate_order_preference')
+    def test_should_create_preference_asynchronously_if_enabled(self, generate_order_preference):
+        # arrange
+        items = [self.items[0], self.items[2]]
+        payload = self.build_order_payload(items)
+
+        # act
+        response = self.client.post(self.url, payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.mp.create_preference.assert_not_called()
+
+        order = models.Order.objects.get()
+        self.assertIsNone(response.data['preference_id'])
+        self.assertEqual(response.data['status'], models.Order.STATUS.CREATED)
+        generate_order_preference.assert_called_once_with(
+            order.id,
+            notification_url=f'http://testserver{urls.reverse("order-ipn")}',
+            back_urls=None,
+        )
+
+    def test_should_reserve_items_stock(self):
+        # arrange
+        items = [self.items[0], self.items[2]]
+        stocks = [item.stock for item in items]
+        payload = self.build_order_payload(items)
+
+        # act
+        response = self.client.post(self.url, payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for item, item_stock in zip(items, stocks):
+            item.refresh_from_db()
+            self.assertEqual(item.stock, item_stock - 1)
+
+        order = models.Order.objects.get()
+        self.assertEqual(
+            set(order.stock_reservations.values_list('item_id', 'status')),
+            {(item.id, models.StockReservation.STATUS.RESERVED) for item in items},
+        )
+
+    def test_should_fail_if_there_is_not_enough_stock(self):
+        # arrange
+        item = factories.ItemFactory(type=models.Item.TYPES.PASS, stock=0)
+        addon = self.items[2]
+        addon_stock = addon.stock
+        payload = self.build_order_payload([item, addon])
+
+        # act
+        response = self.client.post(self.url, payload)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(models.Order.objects.exists())
+        self.mp.create_preference.assert_not_called()
+
+        addon.refresh_from_db()
+        self.assertEqual(addon.stock, addon_stock)
+
     def test_should_provide_back_urls_if_included_in_payload(self):
         # arrange
         items = [self.items[0], self.items[2]]
@@ -610,6 +753,99 @@ class OrderListTestCase(test.APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual([order['id'] for order in response.data['results']], [self.orders[0].id])
 
+    def test_should_paginate_with_cursors_without_counting_orders(self):
+        # arrange
+        self.client.credentials()
+        self.client.force_login(self.admin_user)
+        url = f'{self.url}?page[cursor]=&page[size]=2'
+        order_ids = []
+
+        # act
+        with test_utils.CaptureQueriesContext(db.connection) as queries:
+            while url:
+                response = json.loads(self.client.get(url).content)
+                order_ids.extend(int(order['id']) for order in response['data'])
+                url = response['links']['next']
+
+        # assert
+        self.assertEqual(order_ids, [order.id for order in self.orders])
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_should_paginate_with_page_numbers_by_default(self):
+        # arrange
+        self.client.credentials()
+        self.client.force_login(self.admin_user)
+
+        # act
+        response = json.loads(self.client.get(f'{self.url}?page[number]=2&page[size]=2').content)
+
+        # assert
+        self.assertEqual(
+            [int(order['id']) for order in response['data']],
+            [order.id for order in self.orders[2:4]],
+        )
+        self.assertEqual(response['meta']['pagination'], {'count': 5, 'page': 2, 'pages': 3})
+        self.assertIn('page%5Bnumber%5D=3', response['links']['last'])
+
+    def test_should_use_a_constant_number_of_queries_per_page(self):
+        # arrange
+        self.client.credentials()
+        self.client.force_login(self.admin_user)
+
+        # act
+        with test_utils.CaptureQueriesContext(db.connection) as queries:
+            response = self.client.get(self.url)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # session, user, count of orders, orders with their customers and discount codes, and
+        # order items
+        self.assertEqual(len(queries), 5)
+
+    def test_should_only_load_the_requested_fields(self):
+        # arrange
+        self.client.credentials()
+        self.client.force_login(self.admin_user)
+
+        # act
+        with test_utils.CaptureQueriesContext(db.connection) as queries:
+            response = self.client.get(f'{self.url}?fields[order]=total')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            json.loads(response.content)['data'][0]['attributes'],
+            {'total': str(self.order.total.amount)},
+        )
+
+        orders_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'checkout_order"' in query['sql'] and 'COUNT(' not in query['sql']
+        ]
+        self.assertEqual(len(orders_queries), 1)
+        self.assertNotIn('notes', orders_queries[0])
+        self.assertNotIn('checkout_orderitem', ''.join(query['sql'] for query in queries))
+
+    def test_should_retrieve_customer_order(self):
+        # arrange
+        self.order.preference_id = PREFERENCE_ID
+        self.order.save()
+
+        # act
+        response = self.client.get(urls.reverse('order-detail', kwargs={'pk': self.order.id}))
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['preference_id'], PREFERENCE_ID)
+
+    def test_should_not_retrieve_other_customers_orders(self):
+        # act
+        response = self.client.get(urls.reverse('order-detail', kwargs={'pk': self.orders[1].id}))
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_should_allow_to_include_discount_code(self):
         # arrange
         self.order.discount_code = factories.DiscountCodeFactory()
@@ -722,17 +958,21 @@ class OrderIPNTestCase(test.APITestCase):
 
         self.afip_patcher = mock.patch('checkout.tasks.afip', spec=True)
         self.afip = self.afip_patcher.start()
+        self.afip.serialize_invoice.side_effect = afip.serialize_invoice
         self.afip.generate_invoice.return_value = {
             'invoice_number': self.invoice_number,
             'invoice_cae': self.invoice_cae,
             'invoice_code': fake.numerify('######'),
         }
 
-        self.weasyprint_patcher = mock.patch('checkout.tasks.weasyprint')
+        self.weasyprint_patcher = mock.patch('checkout.renderer.weasyprint')
         self.weasyprint = self.weasyprint_patcher.start()
+        self.weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF'
+        renderer.get_stylesheets.cache_clear()
 
     def tearDown(self):
-        self.weasyprint.stop()
+        renderer.get_stylesheets.cache_clear()
+        self.weasyprint_patcher.stop()
         self.afip_patcher.stop()
         self.mp_patcher.stop()
 
@@ -800,8 +1040,77 @@ class OrderIPNTestCase(test.APITestCase):
         self.assertEqual(mail.outbox[0].recipients(), [self.order.customer.user.email])
         self.assertEqual(mail.outbox[0].subject, '¡Gracias por tu compra!')
 
-    @mock.patch('checkout.models.signals.order_paid')
-    def test_should_fire_an_order_paid_signal(self, order_paid):
+    def test_should_attach_rendered_invoice_without_reading_it_from_storage(self):
+        # arrange
+        order_payload = {
+            'id': self.order_external_id,
+            'order_status': mercadopago.OrderStatus.PAID.value,
+            'external_reference': str(self.order.id),
+        }
+        self.mp.get.return_value = {'response': order_payload}
+
+        # act
+        with mock.patch('django.core.files.storage.FileSystemStorage.open') as storage_open:
+            self.client.post(self.build_notification_url())
+
+        # assert
+        storage_open.assert_not_called()
+        self.assertEqual(mail.outbox[0].attachments, [('factura.pdf', b'%PDF', 'application/pdf')])
+
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.invoice.file)
+
+    def test_should_confirm_stock_reservations_if_completed(self):
+        # arrange
+        stock.reserve_order(self.order)
+        order_payload = {
+            'id': self.order_external_id,
+            'order_status': mercadopago.OrderStatus.PAID.value,
+            'external_reference': str(self.order.id),
+        }
+        self.mp.get.return_value = {'response': order_payload}
+
+        # act
+        self.client.post(self.build_notification_url())
+
+        # assert
+        self.assertFalse(self.order.stock_reservations.exclude(
+            status=models.StockReservation.STATUS.CONFIRMED,
+        ).exists())
+
+    @mock.patch('checkout.views.tasks.process_notification')
+    def test_should_coalesce_repeated_notifications(self, process_notification):
+        # act
+        for i in range(3):
+            response = self.client.post(self.build_notification_url())
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.mp.get.assert_not_called()
+
+        notification = models.PaymentNotification.objects.get()
+        self.assertEqual(notification.resource_id, self.order_external_id)
+        self.assertEqual(notification.status, models.PaymentNotification.STATUS.PENDING)
+        process_notification.assert_called_once_with(notification.id)
+
+    def test_should_generate_invoice_once_for_repeated_notifications(self):
+        # arrange
+        order_payload = {
+            'id': self.order_external_id,
+            'order_status': mercadopago.OrderStatus.PAID.value,
+            'external_reference': str(self.order.id),
+        }
+        self.mp.get.return_value = {'response': order_payload}
+
+        # act
+        for i in range(2):
+            self.client.post(self.build_notification_url())
+
+        # assert
+        self.assertEqual(self.mp.get.call_count, 2)
+        self.afip.generate_invoice.assert_called_once_with(self.order)
+
+    def test_should_record_an_order_paid_event(self):
         # arrange
         order_payload = {
             'id': self.order_external_id,
@@ -814,4 +1123,6 @@ class OrderIPNTestCase(test.APITestCase):
         self.client.post(self.build_notification_url())
 
         # assert
-        order_paid.send.assert_called_once_with(sender=models.Order, order=self.order)
+        event = models.OutboxEvent.objects.get()
+        self.assertEqual(event.name, models.OutboxEvent.NAMES.ORDER_PAID)
+        self.assertEqual(event.payload, {'order_id': self.order.id})
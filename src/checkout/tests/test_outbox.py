@@ -0,0 +1,168 @@
+from django import test
+from django.utils import timezone
+
+from .. import factories, models, outbox, signals
+
+received = []
+failures = []
+
+
+def record_order(sender, order=None, **kwargs):
+    received.append(('record_order', order.id))
+
+
+def fail_once(sender, order=None, **kwargs):
+    if failures:
+        raise failures.pop()
+
+    received.append(('fail_once', order.id))
+
+
+class DispatchEventsTestCase(test.TestCase):
+    def setUp(self):
+        received.clear()
+        failures.clear()
+        signals.order_paid.connect(record_order, dispatch_uid='test_record_order')
+        signals.order_paid.connect(fail_once, dispatch_uid='test_fail_once')
+        self.order = factories.OrderFactory(status=models.Order.STATUS.IN_PROCESS)
+
+    def tearDown(self):
+        signals.order_paid.disconnect(dispatch_uid='test_record_order')
+        signals.order_paid.disconnect(dispatch_uid='test_fail_once')
+
+    def pay_order(self):
+        self.order.status = models.Order.STATUS.PAID
+        self.order.save()
+
+    def test_should_not_fire_signal_when_order_is_paid(self):
+        # act
+        self.pay_order()
+
+        # assert
+        self.assertEqual(received, [])
+        self.assertEqual(
+            models.OutboxEvent.objects.get().status,
+            models.OutboxEvent.STATUS.PENDING,
+        )
+
+    def test_should_deliver_order_paid_to_receivers(self):
+        # arrange
+        self.pay_order()
+
+        # act
+        delivered, attempted = outbox.dispatch_events()
+
+        # assert
+        self.assertEqual((delivered, attempted), (1, 1))
+        self.assertEqual(received, [('record_order', self.order.id), ('fail_once', self.order.id)])
+        self.assertEqual(
+            models.OutboxEvent.objects.get().status,
+            models.OutboxEvent.STATUS.PROCESSED,
+        )
+        self.assertEqual(outbox.dispatch_events(), (0, 0))
+
+    def test_should_retry_only_failed_receivers(self):
+        # arrange
+        self.pay_order()
+        failures.append(ValueError('receiver crashed'))
+
+        # act
+        outbox.dispatch_events()
+        models.OutboxEvent.objects.update(available_at=timezone.now())
+        outbox.dispatch_events()
+
+        # assert
+        self.assertEqual(received, [('record_order', self.order.id), ('fail_once', self.order.id)])
+        event = models.OutboxEvent.objects.get()
+        self.assertEqual(event.status, models.OutboxEvent.STATUS.PROCESSED)
+        self.assertEqual(event.attempts, 2)
+
+    def test_should_wait_before_retrying(self):
+        # arrange
+        self.pay_order()
+        failures.append(ValueError('receiver crashed'))
+
+        # act
+        outbox.dispatch_events()
+
+        # assert
+        event = models.OutboxEvent.objects.get()
+        self.assertEqual(event.status, models.OutboxEvent.STATUS.PENDING)
+        self.assertIn('receiver crashed', event.error)
+        self.assertEqual(outbox.dispatch_events(), (0, 0))
+
+    def test_should_give_up_after_max_attempts(self):
+        # arrange
+        self.pay_order()
+        models.OutboxEvent.objects.update(attempts=outbox.event_queue.max_attempts - 1)
+        failures.append(ValueError('receiver crashed'))
+
+        # act
+        outbox.dispatch_events()
+
+        # assert
+        self.assertEqual(models.OutboxEvent.objects.get().status, models.OutboxEvent.STATUS.FAILED)
+
+    def test_should_pick_up_events_left_processing_by_a_dead_dispatcher(self):
+        # arrange
+        self.pay_order()
+        models.OutboxEvent.objects.update(
+            status=models.OutboxEvent.STATUS.PROCESSING,
+            attempts=1,
+            modified_at=timezone.now() - outbox.event_queue.claim_timeout,
+        )
+
+        # act
+        delivered, attempted = outbox.dispatch_events()
+
+        # assert
+        self.assertEqual((delivered, attempted), (1, 1))
+
+    def test_should_not_pick_up_events_that_killed_the_dispatcher_every_attempt(self):
+        # arrange
+        self.pay_order()
+        models.OutboxEvent.objects.update(
+            status=models.OutboxEvent.STATUS.PROCESSING,
+            attempts=outbox.event_queue.max_attempts,
+            modified_at=timezone.now() - outbox.event_queue.claim_timeout,
+        )
+
+        # act
+        delivered, attempted = outbox.dispatch_events()
+
+        # assert
+        self.assertEqual((delivered, attempted), (0, 0))
+        self.assertEqual(received, [])
+
+    def test_should_deliver_to_receivers_sharing_a_name(self):
+        # arrange
+        receivers = [
+            lambda sender, order=None, **kwargs: received.append(('first', order.id)),
+            lambda sender, order=None, **kwargs: received.append(('second', order.id)),
+        ]
+        for index, receiver in enumerate(receivers):
+            signals.order_paid.connect(receiver, dispatch_uid=f'test_lambda_{index}')
+        self.addCleanup(signals.order_paid.disconnect, dispatch_uid='test_lambda_0')
+        self.addCleanup(signals.order_paid.disconnect, dispatch_uid='test_lambda_1')
+        self.pay_order()
+
+        # act
+        outbox.dispatch_events()
+
+        # assert
+        self.assertIn(('first', self.order.id), received)
+        self.assertIn(('second', self.order.id), received)
+        self.assertIn('test_lambda_1', models.OutboxEvent.objects.get().delivered_receivers)
+
+    def test_should_fail_events_with_receivers_without_dispatch_uid(self):
+        # arrange
+        signals.order_paid.connect(record_order, sender=models.Order)
+        self.addCleanup(signals.order_paid.disconnect, record_order, sender=models.Order)
+        self.pay_order()
+
+        # act
+        delivered, attempted = outbox.dispatch_events()
+
+        # assert
+        self.assertEqual((delivered, attempted), (0, 1))
+        self.assertIn('dispatch_uid', models.OutboxEvent.objects.get().error)
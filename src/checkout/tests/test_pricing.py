@@ -0,0 +1,188 @@
+import io
+from django import test
+from django.core import management
+from djmoney import money
+
+from .. import factories, models, pricing
+
+
+class CalculateOrdersTotalsTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [factories.ItemFactory() for i in range(3)]
+
+    def test_should_calculate_totals_without_discount(self):
+        # arrange
+        order = factories.OrderFactory(items=self.items)
+        base_total = sum(item.price for item in self.items)
+
+        # act
+        totals = pricing.calculate_order_totals(order)
+
+        # assert
+        self.assertEqual(totals.base_total, base_total)
+        self.assertEqual(totals.discount, money.Money(0, 'ARS'))
+        self.assertEqual(totals.total, base_total)
+
+    def test_should_calculate_order_discount(self):
+        # arrange
+        discount_code = factories.DiscountCodeFactory(percentage=10)
+        order = factories.OrderFactory(items=self.items, discount_code=discount_code)
+        base_total = sum(item.price for item in self.items)
+
+        # act
+        totals = pricing.calculate_order_totals(order)
+
+        # assert
+        self.assertEqual(totals.discount, base_total * 10 / 100)
+        self.assertEqual(totals.total, base_total - base_total * 10 / 100)
+        self.assertTrue(all(
+            line.discount == money.Money(0, 'ARS') for line in totals.order_items.values()
+        ))
+
+    def test_should_calculate_item_discount_per_order_item(self):
+        # arrange
+        discount_code = factories.DiscountCodeFactory(
+            type=models.DiscountCode.TYPES.ITEM,
+            percentage=20,
+            items=self.items[:1],
+        )
+        order = factories.OrderFactory(items=self.items, discount_code=discount_code)
+        discounted_item = order.order_items.get(item=self.items[0])
+
+        # act
+        totals = pricing.calculate_order_totals(order)
+
+        # assert
+        self.assertEqual(totals.discount, self.items[0].price * 20 / 100)
+        self.assertEqual(
+            totals.order_items[discounted_item.id].total,
+            self.items[0].price - self.items[0].price * 20 / 100,
+        )
+
+    def test_should_match_model_calculations(self):
+        # arrange
+        discount_code = factories.DiscountCodeFactory(
+            type=models.DiscountCode.TYPES.ITEM,
+            items=self.items[1:],
+        )
+        order = factories.OrderFactory(items=self.items, discount_code=discount_code)
+
+        # act
+        totals = pricing.calculate_order_totals(order)
+
+        # assert
+        self.assertEqual(totals.total, order.calculate_total())
+        self.assertEqual(totals.discount, order.calculate_discount())
+        for order_item in order.order_items.all():
+            self.assertEqual(totals.order_items[order_item.id].total, order_item.calculate_total())
+
+    def test_should_use_a_constant_number_of_queries_for_many_orders(self):
+        # arrange
+        discount_code = factories.DiscountCodeFactory(
+            type=models.DiscountCode.TYPES.ITEM,
+            items=self.items[:2],
+        )
+        for i in range(10):
+            factories.OrderFactory(items=self.items, discount_code=discount_code)
+        orders = list(models.Order.objects.select_related('discount_code'))
+
+        # act
+        with self.assertNumQueries(2):
+            totals = pricing.calculate_orders_totals(orders)
+
+        # assert
+        self.assertEqual(len(totals), 10)
+
+
+class OrderStoredTotalsTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [factories.ItemFactory() for i in range(3)]
+
+    def test_should_store_totals_when_adding_order_items(self):
+        # act
+        order = factories.OrderFactory(items=self.items)
+
+        # assert
+        order.refresh_from_db()
+        self.assertEqual(order.base_total, sum(item.price for item in self.items))
+        self.assertEqual(order.total, order.base_total)
+        self.assertEqual(
+            [order_item.total for order_item in order.order_items.order_by('id')],
+            [item.price for item in self.items],
+        )
+
+    def test_should_update_totals_when_amount_changes(self):
+        # arrange
+        order = factories.OrderFactory(items=self.items)
+        order_item = order.order_items.first()
+
+        # act
+        order_item.amount = 3
+        order_item.save()
+
+        # assert
+        order.refresh_from_db()
+        order_item.refresh_from_db()
+        self.assertEqual(order_item.total, order_item.price * 3)
+        self.assertEqual(order.total, order.calculate_total())
+
+    def test_should_update_totals_when_order_item_is_deleted(self):
+        # arrange
+        order = factories.OrderFactory(items=self.items)
+
+        # act
+        order.order_items.first().delete()
+
+        # assert
+        order.refresh_from_db()
+        self.assertEqual(order.base_total, sum(item.price for item in self.items[1:]))
+
+    def test_should_update_totals_when_discount_code_changes(self):
+        # arrange
+        order = factories.OrderFactory(items=self.items)
+        discount_code = factories.DiscountCodeFactory(percentage=10)
+
+        # act
+        order.discount_code = discount_code
+        order.save()
+
+        # assert
+        order.refresh_from_db()
+        self.assertEqual(
+            order.total,
+            pricing.quantize_money(order.base_total - order.base_total * 10 / 100),
+        )
+        self.assertEqual(order.discount_total, order.base_total - order.total)
+
+    def test_should_store_discount_as_base_total_minus_total(self):
+        # arrange
+        item = factories.ItemFactory(price=money.Money('10.05', 'ARS'))
+        discount_code = factories.DiscountCodeFactory(percentage=10)
+
+        # act
+        order = factories.OrderFactory(items=[item], discount_code=discount_code)
+
+        # assert
+        order.refresh_from_db()
+        self.assertEqual(order.total, money.Money('9.04', 'ARS'))
+        self.assertEqual(order.discount_total, money.Money('1.01', 'ARS'))
+
+
+class UpdateOrderTotalsCommandTestCase(test.TestCase):
+    def test_should_fill_totals_for_existing_orders(self):
+        # arrange
+        discount_code = factories.DiscountCodeFactory()
+        orders = [factories.OrderFactory(discount_code=discount_code) for i in range(3)]
+        models.Order.objects.update(base_total=0, discount_total=0, total=0)
+        models.OrderItem.objects.update(total=0)
+
+        # act
+        management.call_command('update_order_totals', batch_size=2, stdout=io.StringIO())
+
+        # assert
+        for order in orders:
+            order.refresh_from_db()
+            self.assertEqual(order.total, pricing.quantize_money(order.calculate_total()))
+            self.assertEqual(order.discount_total, order.base_total - order.total)
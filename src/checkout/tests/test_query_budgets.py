@@ -0,0 +1,265 @@
+import faker
+from unittest import mock
+from django import db, urls
+from django.test import utils as test_utils
+from django.conf import settings
+from django.core import cache
+from rest_framework import test, status
+
+from user import factories as user_factories
+from .. import afip, factories, models, mercadopago, renderer, stock
+from . import utils
+
+fake = faker.Faker()
+
+# session and user of the logged in admin
+SESSION_QUERIES = 2
+
+
+class OrderQueryBudgetTestCase(utils.QueryBudgetMixin, test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = user_factories.UserFactory(is_staff=True)
+        cls.customer = factories.CustomerFactory()
+        cls.orders = [
+            factories.OrderFactory(
+                customer=cls.customer,
+                discount_code=factories.DiscountCodeFactory(),
+            ) for i in range(3)
+        ]
+
+        for order in cls.orders:
+            for order_item in order.order_items.all():
+                item_option = factories.ItemOptionFactory(item=order_item.item)
+                factories.OrderItemOptionFactory(order_item=order_item, item_option=item_option)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def test_should_list_orders_within_budget(self):
+        # the count of orders for the page numbers, the orders with their customers and discount
+        # codes, and order items
+        budgets = {
+            '': 3,
+            'fields[order]=status': 2,
+            'include=discount-code': 4,
+            'include=order-items': 4,
+            'include=order-items.item': 7,
+            'include=order-items.options': 5,
+            'include=order-items.item.options': 7,
+            'include=order-items.options.item_option': 6,
+            'page[cursor]=': 2,
+        }
+
+        for query_string, budget in budgets.items():
+            with self.subTest(query_string=query_string):
+                # act
+                with self.assertQueryBudget(SESSION_QUERIES + budget):
+                    response = self.client.get(f'{urls.reverse("order-list")}?{query_string}')
+
+                # assert
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_should_retrieve_an_order_within_budget(self):
+        # arrange
+        url = urls.reverse('order-detail', kwargs={'pk': self.orders[0].id})
+
+        # act
+        with self.assertQueryBudget(SESSION_QUERIES + 6):
+            response = self.client.get(f'{url}?include=order-items.item.options')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_should_list_customer_orders_within_budget(self):
+        # arrange
+        self.client.logout()
+        self.client.credentials(**utils.build_customer_authentication_credentials(self.customer))
+        cache.caches['customers'].clear()
+
+        # act
+        # customer lookup, the count of orders, and the orders with their customers and discount
+        # codes, and order items
+        with self.assertQueryBudget(4):
+            response = self.client.get(urls.reverse('order-list'))
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+
+
+# the views are measured without the catalog cache in front of them
+@test.override_settings(CACHES={
+    **settings.CACHES,
+    'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+class ItemQueryBudgetTestCase(utils.QueryBudgetMixin, test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [
+            factories.ItemFactory(options=[factories.ItemOptionFactory.build() for i in range(2)])
+            for i in range(3)
+        ]
+
+    def test_should_list_items_within_budget(self):
+        for query_string in ['', 'include=options']:
+            with self.subTest(query_string=query_string):
+                # act
+                # count, items with their stock, and options
+                with self.assertQueryBudget(3):
+                    response = self.client.get(f'{urls.reverse("item-list")}?{query_string}')
+
+                # assert
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_should_retrieve_an_item_within_budget(self):
+        # arrange
+        url = urls.reverse('item-detail', kwargs={'pk': self.items[0].id})
+
+        # act
+        with self.assertQueryBudget(2):
+            response = self.client.get(f'{url}?include=options')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class DiscountCodeQueryBudgetTestCase(utils.QueryBudgetMixin, test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.discount_codes = [factories.DiscountCodeFactory() for i in range(3)]
+
+    def test_should_filter_discount_codes_within_budget(self):
+        # act
+        # count, discount codes and their items
+        with self.assertQueryBudget(3):
+            response = self.client.get(
+                urls.reverse('discountcode-list'),
+                {'filter[code]': self.discount_codes[0].code},
+            )
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class OrderIPNQueryBudgetTestCase(utils.QueryBudgetMixin, test.APITestCase):
+    def setUp(self):
+        self.mp_patcher = mock.patch('checkout.mercadopago.get_mp_client', spec=True)
+        self.mp = self.mp_patcher.start().return_value
+
+        # the invoice is built from the order, only the WSFEv1 client is replaced
+        self.afip_patcher = mock.patch('checkout.afip.get_client')
+        afip_client = self.afip_patcher.start().return_value
+        afip_client.CompUltimoAutorizado.return_value = 4
+        afip_client.CAE = '1234'
+        afip_client.Vencimiento = '20200309'
+        afip_client.ErrCode = ''
+
+        self.weasyprint_patcher = mock.patch('checkout.renderer.weasyprint')
+        self.weasyprint_patcher.start().HTML.return_value.write_pdf.return_value = b'%PDF'
+
+    def tearDown(self):
+        renderer.get_stylesheets.cache_clear()
+        self.weasyprint_patcher.stop()
+        self.afip_patcher.stop()
+        self.mp_patcher.stop()
+
+    def create_order(self, items_count):
+        # passes and addons, so queries run once per item or option show up as repeated
+        items = [
+            factories.ItemFactory(type=models.Item.TYPES.PASS, stock=10)
+            for i in range(items_count)
+        ] + [
+            factories.ItemFactory(type=models.Item.TYPES.ADDON, stock=10)
+            for i in range(items_count)
+        ]
+        order = factories.OrderFactory(items=items, status=models.Order.STATUS.IN_PROCESS)
+
+        for order_item in order.order_items.all():
+            factories.OrderItemOptionFactory(
+                order_item=order_item,
+                item_option=factories.ItemOptionFactory(
+                    item=order_item.item,
+                    type=models.ItemOption.TYPES.EMAIL,
+                ),
+                value=fake.email(),
+            )
+
+        stock.reserve_order(order)
+
+        return order
+
+    def notify_order_paid(self, order):
+        self.mp.get.return_value = {
+            'response': {
+                'id': fake.numerify('######'),
+                'order_status': mercadopago.OrderStatus.PAID.value,
+                'external_reference': str(order.id),
+            },
+        }
+        # every notification starts as cold as the first one a worker handles
+        afip.clear_synced_sequences()
+        renderer.get_stylesheets.cache_clear()
+
+        return self.client.post(
+            f'{urls.reverse("order-ipn")}?topic={mercadopago.IPNTopic.MERCHANT_ORDER.value}&'
+            f'id={fake.numerify("######")}',
+        )
+
+    def test_should_process_a_notification_within_budget(self):
+        # arrange
+        order = self.create_order(3)
+
+        # act
+        # the order is locked twice, once to pay it and once to invoice it
+        with self.assertQueryBudget(43, max_repetitions=2):
+            response = self.notify_order_paid(order)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order.refresh_from_db()
+        self.assertEqual(order.status, models.Order.STATUS.PAID)
+
+    def test_should_not_run_more_queries_for_orders_with_more_items(self):
+        # arrange
+        orders = [self.create_order(1), self.create_order(5)]
+        queries_counts = []
+        # the first invoice creates the invoice sequence the others only lock
+        self.notify_order_paid(self.create_order(1))
+
+        # act
+        for order in orders:
+            with test_utils.CaptureQueriesContext(db.connection) as queries:
+                self.notify_order_paid(order)
+
+            queries_counts.append(len(queries))
+
+        # assert
+        self.assertEqual(queries_counts[0], queries_counts[1])
+
+
+class QueryBudgetTestCase(utils.QueryBudgetMixin, test.APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [factories.ItemFactory() for i in range(3)]
+
+    def test_should_group_queries_that_only_differ_in_their_parameters(self):
+        # act
+        normalized_queries = {
+            utils.normalize_query(
+                f'SELECT * FROM "checkout_item" WHERE "id" IN ({ids}) AND "name" = \'{name}\'',
+            ) for ids, name in [('1', 'a'), ('2, 3', 'b')]
+        }
+
+        # assert
+        self.assertEqual(
+            normalized_queries,
+            {'SELECT * FROM "checkout_item" WHERE "id" IN (?) AND "name" = ?'},
+        )
+
+    def test_should_fail_on_queries_repeated_per_row(self):
+        # act
+        with self.assertRaisesRegex(AssertionError, 'N\\+1'):
+            with self.assertQueryBudget(10):
+                for item in models.Item.objects.all():
+                    list(item.options.all())
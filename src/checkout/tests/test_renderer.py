@@ -0,0 +1,50 @@
+import os
+import re
+from django import test
+from django.utils import timezone
+
+from .. import factories, afip, renderer
+
+
+class RenderInvoiceTestCase(test.TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = factories.OrderFactory()
+
+    def build_invoice_data(self, number):
+        invoice = afip.build_invoice(self.order, timezone.now())
+
+        return afip.complete_invoice(invoice, number, '70000000000000', '20200309')
+
+    def test_should_only_load_bundled_fonts(self):
+        # arrange
+        with open(renderer.INVOICE_STYLESHEET) as stylesheet:
+            css = stylesheet.read()
+
+        # act
+        font_urls = re.findall(r'url\((.*?)\)', css)
+
+        # assert
+        self.assertTrue(font_urls)
+        for font_url in font_urls:
+            self.assertTrue(os.path.isfile(
+                os.path.join(os.path.dirname(renderer.INVOICE_STYLESHEET), font_url),
+            ))
+
+    def test_should_render_pdf(self):
+        # act
+        invoice_pdf = renderer.render_invoice(self.build_invoice_data(1))
+
+        # assert
+        self.assertTrue(invoice_pdf.startswith(b'%PDF'))
+
+    def test_should_render_invoices_in_a_process_pool(self):
+        # arrange
+        invoices_data = [self.build_invoice_data(number) for number in range(1, 4)]
+
+        # act
+        invoices_pdfs = renderer.render_invoices(invoices_data, workers=2)
+
+        # assert
+        self.assertEqual(len(invoices_pdfs), 3)
+        self.assertTrue(all(invoice_pdf.startswith(b'%PDF') for invoice_pdf in invoices_pdfs))
@@ -0,0 +1,191 @@
+import io
+from django import test
+from django.core import management
+from django.utils import timezone
+
+from .. import factories, models, stock
+
+
+class ReserveOrderTestCase(test.TestCase):
+    def test_should_decrement_stock_and_create_reservations(self):
+        # arrange
+        items = [factories.ItemFactory(stock=5) for i in range(2)]
+        order = factories.OrderFactory(items=items)
+
+        # act
+        reservations = stock.reserve_order(order)
+
+        # assert
+        self.assertEqual(len(reservations), 2)
+        self.assertEqual(
+            list(models.Item.objects.filter(id__in=[item.id for item in items]).values_list(
+                'stock',
+                flat=True,
+            )),
+            [4, 4],
+        )
+        self.assertTrue(all(
+            reservation.expires_at == order.created_at + stock.RESERVATION_TTL
+            for reservation in reservations
+        ))
+
+    def test_should_not_take_any_stock_if_an_item_is_missing_stock(self):
+        # arrange
+        available = factories.ItemFactory(stock=5)
+        missing = factories.ItemFactory(stock=0)
+        order = factories.OrderFactory(items=[available, missing])
+
+        # act
+        with self.assertRaises(stock.InsufficientStock) as context:
+            stock.reserve_order(order)
+
+        # assert
+        self.assertEqual(context.exception.item_id, missing.id)
+        available.refresh_from_db()
+        self.assertEqual(available.stock, 5)
+        self.assertFalse(models.StockReservation.objects.exists())
+
+
+class ReleaseExpiredReservationsTestCase(test.TestCase):
+    def setUp(self):
+        self.item = factories.ItemFactory(stock=5)
+        self.order = factories.OrderFactory(
+            items=[self.item],
+            status=models.Order.STATUS.IN_PROCESS,
+        )
+        stock.reserve_order(self.order)
+        self.expired_at = self.order.created_at + stock.RESERVATION_TTL
+
+    def test_should_return_stock_and_cancel_expired_orders(self):
+        # act
+        released = stock.release_expired_reservations(now=self.expired_at)
+
+        # assert
+        self.assertEqual(released, 1)
+        self.item.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.item.stock, 5)
+        self.assertEqual(self.order.status, models.Order.STATUS.CANCELLED)
+        self.assertEqual(
+            self.order.stock_reservations.get().status,
+            models.StockReservation.STATUS.RELEASED,
+        )
+
+    def test_should_not_release_reservations_before_expiration(self):
+        # act
+        released = stock.release_expired_reservations(
+            now=self.expired_at - timezone.timedelta(seconds=1),
+        )
+
+        # assert
+        self.assertEqual(released, 0)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 4)
+
+    def test_should_not_release_paid_orders(self):
+        # arrange
+        self.order.status = models.Order.STATUS.PAID
+        self.order.save()
+        stock.confirm_order(self.order)
+
+        # act
+        released = stock.release_expired_reservations(now=self.expired_at)
+
+        # assert
+        self.assertEqual(released, 0)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 4)
+
+    def test_command_should_release_expired_reservations(self):
+        # arrange
+        models.StockReservation.objects.update(expires_at=timezone.now())
+
+        # act
+        management.call_command('release_expired_reservations', stdout=io.StringIO())
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 5)
+
+
+class ShardedStockTestCase(test.TestCase):
+    def setUp(self):
+        self.item = factories.ItemFactory(stock=10)
+
+    def test_should_split_stock_across_shards(self):
+        # act
+        total = stock.rebalance_item_stock(self.item.id, 3)
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertEqual(total, 10)
+        self.assertEqual(self.item.stock, 0)
+        self.assertEqual(
+            sorted(self.item.stock_shards.values_list('stock', flat=True)),
+            [3, 3, 4],
+        )
+        self.assertEqual(self.item.get_available_stock(), 10)
+
+    def test_should_merge_shards_back_into_the_item(self):
+        # arrange
+        stock.rebalance_item_stock(self.item.id, 3)
+
+        # act
+        stock.rebalance_item_stock(self.item.id, 0)
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 10)
+        self.assertFalse(self.item.stock_shards.exists())
+
+    def test_should_reserve_from_shards(self):
+        # arrange
+        stock.rebalance_item_stock(self.item.id, 2)
+        order = factories.OrderFactory(items=[self.item])
+
+        # act
+        stock.reserve_order(order)
+
+        # assert
+        self.assertEqual(
+            sorted(self.item.stock_shards.values_list('stock', flat=True)),
+            [4, 5],
+        )
+
+    def test_should_reserve_amounts_spanning_several_shards(self):
+        # arrange
+        stock.rebalance_item_stock(self.item.id, 4)
+
+        # act
+        reserved = stock.decrement_stock(self.item.id, 7)
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertTrue(reserved)
+        self.assertEqual(self.item.get_available_stock(), 3)
+
+    def test_should_fail_if_shards_do_not_have_enough_stock(self):
+        # arrange
+        stock.rebalance_item_stock(self.item.id, 4)
+
+        # act
+        reserved = stock.decrement_stock(self.item.id, 11)
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertFalse(reserved)
+        self.assertEqual(self.item.stock, 0)
+        self.assertEqual(self.item.get_available_stock(), 10)
+
+    def test_should_release_stock_into_shards(self):
+        # arrange
+        stock.rebalance_item_stock(self.item.id, 2)
+        stock.decrement_stock(self.item.id, 3)
+
+        # act
+        stock.increment_stock(self.item.id, 3)
+
+        # assert
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock, 0)
+        self.assertEqual(self.item.get_available_stock(), 10)
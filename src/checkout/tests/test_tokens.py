@@ -0,0 +1,67 @@
+import freezegun
+from django import test
+from django.conf import settings
+from django.utils import timezone
+
+from .. import tokens
+
+
+@test.override_settings(
+    CUSTOMER_TOKEN_KEYS={'b': 'new secret', 'a': 'old secret'},
+    CUSTOMER_TOKEN_KEY_ID='b',
+)
+class CustomerTokenTestCase(test.SimpleTestCase):
+    def test_should_parse_generated_token(self):
+        # arrange
+        token = tokens.generate_customer_token(1234)
+
+        # act
+        customer_id = tokens.parse_customer_token(token)
+
+        # assert
+        self.assertEqual(customer_id, 1234)
+        self.assertTrue(token.startswith('b.'))
+        self.assertFalse(tokens.is_legacy_token(token))
+
+    def test_should_accept_tokens_signed_with_rotated_keys(self):
+        # arrange
+        with test.override_settings(CUSTOMER_TOKEN_KEY_ID='a'):
+            token = tokens.generate_customer_token(1234)
+
+        # act
+        customer_id = tokens.parse_customer_token(token)
+
+        # assert
+        self.assertEqual(customer_id, 1234)
+
+    def test_should_reject_tokens_signed_with_removed_keys(self):
+        # arrange
+        with test.override_settings(CUSTOMER_TOKEN_KEYS={'c': 'secret'}, CUSTOMER_TOKEN_KEY_ID='c'):
+            token = tokens.generate_customer_token(1234)
+
+        # act / assert
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.parse_customer_token(token)
+
+    def test_should_reject_tokens_with_bad_signature(self):
+        # arrange
+        token = tokens.generate_customer_token(1234)
+
+        # act / assert
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.parse_customer_token(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+
+    def test_should_reject_malformed_tokens(self):
+        for token in ['', 'b.1.2', 'b.x!.1.abc', 'b.1.2.3.4']:
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.parse_customer_token(token)
+
+    def test_should_reject_expired_tokens(self):
+        # arrange
+        token = tokens.generate_customer_token(1234)
+        expiration = timezone.timedelta(seconds=settings.CUSTOMER_TOKEN_MAX_AGE + 1)
+
+        # act / assert
+        with freezegun.freeze_time(timezone.now() + expiration):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.parse_customer_token(token)
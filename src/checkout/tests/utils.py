@@ -1,6 +1,15 @@
+import collections
+import contextlib
+import re
+from django import db
+from django.test import utils as test_utils
+
 from ..utils import quantize_decimal  # noqa: F401
 from .. import authentication
 
+QUERY_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+QUERY_LISTS = re.compile(r'\(\?(?:, \?)*\)')
+
 
 def build_json_api_identifier(type, id):
     return {
@@ -34,3 +43,40 @@ def build_customer_authentication_credentials(customer):
         customer.user.email,
         customer.identity_document,
     )
+
+
+def normalize_query(sql):
+    # the parameters are dropped, so the same query run for different rows is grouped together
+    return QUERY_LISTS.sub('(?)', QUERY_LITERALS.sub('?', sql))
+
+
+def group_queries(queries):
+    return collections.Counter(normalize_query(query['sql']) for query in queries)
+
+
+class QueryBudgetMixin:
+    @contextlib.contextmanager
+    def assertQueryBudget(self, budget, max_repetitions=1):
+        # the same query run more than max_repetitions times, apart from its parameters, is how
+        # an N+1 shows up
+        with test_utils.CaptureQueriesContext(db.connection) as context:
+            yield context
+
+        repeated_queries = {
+            query: count
+            for query, count in group_queries(context.captured_queries).items()
+            if count > max_repetitions
+        }
+        self.assertFalse(
+            repeated_queries,
+            'Queries repeated, probably an N+1:\n' + '\n'.join(
+                f'{count}x {query}' for query, count in repeated_queries.items()
+            ),
+        )
+        self.assertLessEqual(
+            len(context),
+            budget,
+            f'{len(context)} queries over the budget of {budget}:\n' + '\n'.join(
+                query['sql'] for query in context.captured_queries
+            ),
+        )
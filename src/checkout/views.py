@@ -1,17 +1,44 @@
+import functools
+from django.conf import settings
 from django.db import transaction
 from django import urls, http, views as django_views
-from rest_framework import permissions as drf_permissions, decorators, response
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions as drf_permissions, decorators, response, exceptions
 from rest_framework.settings import api_settings
-from rest_framework_json_api import views
-
-from . import models, serializers, authentication, permissions, mercadopago, filters, tasks
+from rest_framework_json_api import views, utils as json_api_utils
+
+from shiro import pagination
+from . import (
+    models,
+    serializers,
+    authentication,
+    permissions,
+    mercadopago,
+    filters,
+    tasks,
+    catalog,
+    stock,
+    notifications,
+)
 
 
 class ItemViewSet(views.ReadOnlyModelViewSet):
-    queryset = models.Item.objects.order_by('id')
+    queryset = stock.annotate_available_stock(
+        models.Item.objects.prefetch_related('options').order_by('id'),
+    )
     serializer_class = serializers.ItemSerializer
     filterset_class = filters.ItemFilterSet
 
+    def list(self, request, *args, **kwargs):
+        get_response = functools.partial(super().list, request, *args, **kwargs)
+
+        return catalog.cached_response(request, get_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        get_response = functools.partial(super().retrieve, request, *args, **kwargs)
+
+        return catalog.cached_response(request, get_response)
+
 
 class CustomerViewSet(views.viewsets.GenericViewSet,
                       views.viewsets.mixins.CreateModelMixin):
@@ -28,12 +55,13 @@ class CustomerViewSet(views.viewsets.GenericViewSet,
         return response.Response()
 
 
-class OrderViewSet(views.viewsets.GenericViewSet,
-                   views.AutoPrefetchMixin,
+class OrderViewSet(views.AutoPrefetchMixin,
                    views.PreloadIncludesMixin,
                    views.RelatedMixin,
+                   views.viewsets.GenericViewSet,
                    views.viewsets.mixins.CreateModelMixin,
-                   views.viewsets.mixins.ListModelMixin):
+                   views.viewsets.mixins.ListModelMixin,
+                   views.viewsets.mixins.RetrieveModelMixin):
     queryset = models.Order.objects.order_by('id')
     serializer_class = serializers.OrderSerializer
     select_for_includes = {
@@ -41,14 +69,85 @@ class OrderViewSet(views.viewsets.GenericViewSet,
     }
     prefetch_for_includes = {
         '__all__': ['order_items'],
+        'discount_code': ['discount_code__items'],
         'order_items': ['order_items__options'],
-        'order_items.item': ['order_items__options', 'order_items__item__options'],
-        'order_items.item.options': ['order_items__options', 'order_items__item__options'],
+        'order_items.options': ['order_items__options'],
+        'order_items.options.item_option': ['order_items__options__item_option'],
+        'order_items.item': [
+            'order_items__options',
+            'order_items__item__options',
+            'order_items__item__stock_shards',
+        ],
+        'order_items.item.options': [
+            'order_items__options',
+            'order_items__item__options',
+            'order_items__item__stock_shards',
+        ],
     }
     authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES + [
         authentication.CustomerAuthentication,
     ]
     permission_classes = (drf_permissions.IsAdminUser | permissions.IsCustomer,)
+    ordering = ('id',)
+    # columns read by each serializer field, when a sparse fieldset is requested only the columns
+    # of its fields are loaded
+    columns_for_fields = {
+        'id': ['id'],
+        'order_items': [],
+        'notes': ['notes'],
+        'discount_code': ['discount_code'],
+        'customer': ['customer'],
+        'status': ['status'],
+        'preference_id': ['preference_id'],
+        'total': ['total', 'total_currency'],
+    }
+
+    @property
+    def paginator(self):
+        # page numbers stay the default, clients opt into cursors by sending page[cursor], empty
+        # for the first page, and following the links from there
+        if not hasattr(self, '_paginator'):
+            cursor_query_param = pagination.JsonApiCursorPagination.cursor_query_param
+
+            if cursor_query_param in self.request.query_params:
+                self._paginator = pagination.JsonApiCursorPagination()
+            else:
+                self._paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+
+        return self._paginator
+
+    def get_fieldset(self):
+        # same parameter the serializer uses to drop the fields that weren't requested
+        resource_type = json_api_utils.get_resource_type_from_serializer(
+            self.get_serializer_class(),
+        )
+        fieldset = self.request.query_params.get(f'fields[{resource_type}]')
+
+        return None if fieldset is None else set(fieldset.split(','))
+
+    def filter_for_fieldset(self, relations):
+        fieldset = self.get_fieldset()
+
+        if relations is None or fieldset is None:
+            return relations
+
+        # an empty list would make select_related follow every relation
+        return [relation for relation in relations if relation in fieldset] or None
+
+    def get_select_related(self, include):
+        # includes are received with the formatted field names, e.g. "order-items.item"
+        include = json_api_utils.format_value(include, 'underscore')
+        select_related = super().get_select_related(include)
+
+        return self.filter_for_fieldset(select_related) if include == '__all__' else select_related
+
+    def get_prefetch_related(self, include):
+        include = json_api_utils.format_value(include, 'underscore')
+        prefetch_related = super().get_prefetch_related(include)
+
+        return (
+            self.filter_for_fieldset(prefetch_related) if include == '__all__' else prefetch_related
+        )
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -56,20 +155,53 @@ class OrderViewSet(views.viewsets.GenericViewSet,
         if self.request.auth == authentication.CUSTOMER_AUTH_SCHEMA:
             queryset = queryset.filter(customer=self.request.user.customer)
 
+        fieldset = self.get_fieldset()
+
+        if self.action in ('list', 'retrieve') and fieldset is not None:
+            # included relations are loaded from the order even if they aren't in the fieldset
+            included = {
+                json_api_utils.format_value(resource.split('.')[0], 'underscore')
+                for resource in json_api_utils.get_included_resources(self.request)
+            }
+            # the trackers read the status and discount code of every loaded order
+            queryset = queryset.only('id', 'status', 'discount_code', *{
+                column
+                for field in fieldset | included
+                for column in self.columns_for_fields.get(field, [])
+            })
+
         return queryset
 
-    @transaction.atomic
     def perform_create(self, serializer):
         customer = self.request.user.customer
-        order = serializer.save(customer=customer)
-        back_urls = serializer.validated_data.get('back_urls')
 
+        with transaction.atomic():
+            order = serializer.save(customer=customer)
+
+            try:
+                stock.reserve_order(order)
+            except stock.InsufficientStock:
+                raise exceptions.ValidationError({
+                    'order_items': [_('There is not enough stock for some of the items')],
+                })
+
+        # the preference is created once the order is committed, so a slow Mercado Pago API
+        # doesn't keep the transaction and its locks open
+        back_urls = serializer.validated_data.get('back_urls')
         notification_url = self.request.build_absolute_uri(urls.reverse('order-ipn'))
-        mercadopago.generate_order_preference(
-            order,
-            notification_url=notification_url,
-            back_urls=back_urls,
-        )
+
+        if settings.MERCADOPAGO_ASYNC_PREFERENCES:
+            tasks.generate_order_preference(
+                order.id,
+                notification_url=notification_url,
+                back_urls=dict(back_urls) if back_urls is not None else None,
+            )
+        else:
+            mercadopago.generate_order_preference(
+                order,
+                notification_url=notification_url,
+                back_urls=back_urls,
+            )
 
 
 class OrderIPNView(django_views.View):
@@ -88,16 +220,15 @@ class OrderIPNView(django_views.View):
 
         if serializer.is_valid() and \
                 serializer.validated_data['topic'] == mercadopago.IPNTopic.MERCHANT_ORDER.value:
-            order_response = mercadopago.get_merchant_order(serializer.validated_data['id'])
-            order = models.Order.objects.get(id=order_response['external_reference'])
-
-            if order.status in [models.Order.STATUS.IN_PROCESS] and \
-                    order_response['order_status'] == mercadopago.OrderStatus.PAID.value:
-                order.status = models.Order.STATUS.PAID
-                order.external_id = order_response['id']
-                order.save()
-
-                tasks.generate_invoice(order.id)
+            # the notification is only recorded here, so repeated notifications are cheap and
+            # Mercado Pago gets its answer without waiting on its own API
+            notification = notifications.record_notification(
+                serializer.validated_data['topic'],
+                serializer.validated_data['id'],
+            )
+
+            if notification is not None:
+                tasks.process_notification(notification.id)
 
         return http.HttpResponse()
 
@@ -0,0 +1,115 @@
+import collections
+import contextlib
+import json
+import logging
+import random
+import threading
+import time
+import sentry_sdk
+from django import db
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.queries_time = 0
+        self.cache = collections.defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self.external = collections.defaultdict(lambda: {'calls': 0, 'time': 0})
+
+    def track_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.queries_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'db': {'queries': self.queries, 'time_ms': to_milliseconds(self.queries_time)},
+            'cache': dict(self.cache),
+            'external': {
+                service: {'calls': calls['calls'], 'time_ms': to_milliseconds(calls['time'])}
+                for service, calls in self.external.items()
+            },
+        }
+
+
+def to_milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+def get_metrics():
+    return getattr(_local, 'metrics', None)
+
+
+def record_cache(cache_name, hit):
+    metrics = get_metrics()
+
+    if metrics is not None:
+        metrics.cache[cache_name]['hits' if hit else 'misses'] += 1
+
+
+@contextlib.contextmanager
+def track_external(service, description):
+    # measured both for the request metrics and as a Sentry span
+    metrics = get_metrics()
+    start = time.perf_counter()
+
+    with sentry_sdk.start_span(op=service, description=description):
+        try:
+            yield
+        finally:
+            if metrics is not None:
+                metrics.external[service]['calls'] += 1
+                metrics.external[service]['time'] += time.perf_counter() - start
+
+
+def log_request(request, response, elapsed, metrics, slow):
+    resolver_match = getattr(request, 'resolver_match', None)
+    data = {
+        'event': 'request',
+        'method': request.method,
+        'path': request.path,
+        'view': resolver_match.view_name if resolver_match is not None else None,
+        'status': response.status_code,
+        'duration_ms': to_milliseconds(elapsed),
+        'slow': slow,
+        **(metrics.as_dict() if metrics is not None else {}),
+    }
+
+    logger.log(logging.WARNING if slow else logging.INFO, json.dumps(data, sort_keys=True))
+
+
+class MetricsMiddleware:
+    # logs a line for a sample of the requests and for every slow one, only the sampled ones count
+    # their queries, cache lookups and external calls, the rest are just timed
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        _local.metrics = metrics
+        start = time.perf_counter()
+
+        try:
+            if metrics is not None:
+                with db.connection.execute_wrapper(metrics.track_query):
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+
+        elapsed = time.perf_counter() - start
+        slow = elapsed >= settings.METRICS_SLOW_REQUEST_THRESHOLD
+
+        if metrics is not None or slow:
+            log_request(request, response, elapsed, metrics, slow)
+
+        return response
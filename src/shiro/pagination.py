@@ -0,0 +1,26 @@
+from collections import OrderedDict
+from rest_framework import pagination, response
+
+
+# pages are fetched after the last row of the previous one instead of using an offset, and rows
+# are never counted, so deep pages are as cheap as the first one, there are no page numbers nor
+# counts in the meta and links though, only the next and previous pages
+class JsonApiCursorPagination(pagination.CursorPagination):
+    cursor_query_param = 'page[cursor]'
+    page_size_query_param = 'page[size]'
+    max_page_size = 100
+    ordering = 'id'
+
+    def get_paginated_response(self, data):
+        return response.Response({
+            'results': data,
+            'meta': {
+                'pagination': OrderedDict([
+                    ('size', self.page_size),
+                ]),
+            },
+            'links': OrderedDict([
+                ('next', self.get_next_link()),
+                ('prev', self.get_previous_link()),
+            ]),
+        })
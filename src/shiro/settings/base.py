@@ -4,6 +4,7 @@ Django base settings for shiro project.
 
 import os
 import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shiro.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -100,12 +102,26 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     },
+    # verified customer credentials, kept briefly in each process
+    'customers': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'customers',
+        'TIMEOUT': 60,
+    },
 }
 
 # Auth
 
 AUTH_USER_MODEL = 'user.User'
 
+# Customer tokens, signing keys as "<key id>:<secret>" pairs. New tokens are signed with the first
+# one, the rest are only accepted until their tokens expire
+CUSTOMER_TOKEN_KEYS = dict(
+    key.split(':', 1) for key in os.getenv('CUSTOMER_TOKEN_KEYS').split(',')
+) if os.getenv('CUSTOMER_TOKEN_KEYS') else {'0': SECRET_KEY}
+CUSTOMER_TOKEN_KEY_ID = next(iter(CUSTOMER_TOKEN_KEYS))
+CUSTOMER_TOKEN_MAX_AGE = int(os.getenv('CUSTOMER_TOKEN_MAX_AGE', 60 * 60 * 24 * 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -155,6 +171,8 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_EMAIL = os.getenv('DEFAULT_EMAIL')
 TEMPLATED_EMAIL_TEMPLATE_DIR = 'emails/'
 TEMPLATED_EMAIL_FILE_EXTENSION = 'html'
+# messages per second, SES accounts start at 14, emails are sent by one worker at a time
+EMAIL_SEND_RATE = float(os.getenv('EMAIL_SEND_RATE', '14'))
 
 # Rest Framework
 REST_FRAMEWORK = {
@@ -193,8 +211,47 @@ JSON_API_FORMAT_TYPES = 'dasherize'
 # Mercadopago
 MERCADOPAGO_CLIENT_ID = os.getenv('MERCADOPAGO_CLIENT_ID')
 MERCADOPAGO_CLIENT_SECRET = os.getenv('MERCADOPAGO_CLIENT_SECRET')
+MERCADOPAGO_ASYNC_PREFERENCES = os.getenv('MERCADOPAGO_ASYNC_PREFERENCES') == 'true'
+MERCADOPAGO_API_URL = 'https://api.mercadopago.com'
+MERCADOPAGO_TIMEOUT = (3.05, 15)
 
 # AFIP
 AFIP_PRIVATE_KEY = os.getenv('AFIP_PRIVATE_KEY')
 AFIP_CERTIFICATE = os.getenv('AFIP_CERTIFICATE')
 AFIP_CUIT = os.getenv('AFIP_CUIT')
+AFIP_BATCH_INVOICES = os.getenv('AFIP_BATCH_INVOICES') == 'true'
+AFIP_WSDL_CACHE_DIR = os.getenv(
+    'AFIP_WSDL_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'afip'),
+)
+INVOICE_RENDER_WORKERS = int(os.getenv('INVOICE_RENDER_WORKERS', '1'))
+
+# Metrics
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '0' if TESTING else '0.01'))
+METRICS_SLOW_REQUEST_THRESHOLD = float(os.getenv('METRICS_SLOW_REQUEST_THRESHOLD', '1'))
+
+# Logging, the request metrics are written to stdout as JSON lines, on Lambda they end up in
+# CloudWatch
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {
+            'format': '%(message)s',
+        },
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'shiro.metrics': {
+            'handlers': ['metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
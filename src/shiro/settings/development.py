@@ -7,5 +7,10 @@ CACHES['afip'] = {  # noqa: F405
     'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
     'LOCATION': 'afip_cache_table',
 }
+CACHES['catalog'] = {  # noqa: F405
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'catalog_cache_table',
+    'TIMEOUT': 60 * 60,
+}
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
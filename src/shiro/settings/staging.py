@@ -12,6 +12,11 @@ CACHES['afip'] = {  # noqa: F405
     'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
     'LOCATION': 'afip_cache_table',
 }
+CACHES['catalog'] = {  # noqa: F405
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'catalog_cache_table',
+    'TIMEOUT': 60 * 60,
+}
 
 # Email
 EMAIL_BACKEND = 'django_amazon_ses.EmailBackend'
@@ -30,4 +35,5 @@ sentry_sdk.init(
     dsn=os.getenv('SENTRY_DSN'),
     integrations=[DjangoIntegration()],
     send_default_pii=True,
+    traces_sample_rate=float(os.getenv('SENTRY_TRACES_SAMPLE_RATE', '0')),
 )
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('user', '0002_user_increase_first_name_length'),
+    ]
+
+    operations = [
+        # matches the UPPER() expression Django uses for email__iexact lookups
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS user_user_email_upper_idx '
+            'ON user_user (UPPER(email::text));',
+            'DROP INDEX CONCURRENTLY IF EXISTS user_user_email_upper_idx;',
+        ),
+    ]
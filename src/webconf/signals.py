@@ -1,19 +1,16 @@
-import templated_email
 from django.conf import settings
-from checkout import models, signals as checkout_signals
+from checkout import emails, models, signals as checkout_signals
 
 
 def send_pass_emails(sender, order=None, **kwargs):
-    for order_item in order.order_items.filter(item__type=models.Item.TYPES.PASS):
-        email = order_item.options.get(item_option__type=models.ItemOption.TYPES.EMAIL).value
-        templated_email.send_templated_mail(
-            template_name='pass_paid',
-            from_email=settings.DEFAULT_EMAIL,
-            recipient_list=[email],
-            context={
-                'email': email,
-            },
-        )
+    # only queued, they're sent by the email worker once the order is paid
+    addresses = models.OrderItemOption.objects.filter(
+        order_item__order=order,
+        order_item__item__type=models.Item.TYPES.PASS,
+        item_option__type=models.ItemOption.TYPES.EMAIL,
+    ).order_by('order_item_id').values_list('value', flat=True)
+
+    emails.queue_emails('pass_paid', [(email, {'email': email}) for email in addresses])
 
 
 if not settings.TESTING:
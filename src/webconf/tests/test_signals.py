@@ -3,7 +3,7 @@ import itertools
 from django import test
 from django.core import mail
 
-from checkout import factories, models
+from checkout import emails, factories, models
 from .. import signals
 
 fake = faker.Faker()
@@ -33,6 +33,7 @@ class SendPassEmailsTestCase(test.TestCase):
 
         # act
         signals.send_pass_emails(None, self.order)
+        emails.send_queued_emails()
 
         # assert
         passes = self.order.order_items.filter(item__type=models.Item.TYPES.PASS)